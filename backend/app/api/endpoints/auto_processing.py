@@ -6,6 +6,8 @@ from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
 from sqlalchemy.orm import Session
 from app.services.processing.csv_processor import csv_processor
 from app.services.monitoring.file_watcher import start_file_watcher, stop_file_watcher, get_file_watcher_status
+from app.services.processing.tile_warmup import tile_warmup, tile_usage
+from app.services.processing.process_pool import processing_pool
 from app.database.session import get_db
 import logging
 
@@ -46,24 +48,16 @@ async def process_and_store_file(filename: str, background_tasks: BackgroundTask
                 
                 # 2. Determinar rutas de archivos
                 archivo_csv = Path(csv_processor.carpeta_almacenamiento_csv) / filename
-                # Preferimos el JSON histórico único por archivo
-                base = filename[:-4] if filename.lower().endswith('.csv') else filename
-                archivo_json_hist = Path(csv_processor.carpeta_almacenamiento_json) / f"datos{base}save.json"
-                if archivo_json_hist.exists():
-                    archivo_json = archivo_json_hist
-                else:
-                    # Fallback al último JSON en salida rápida
-                    output_dir = Path(csv_processor.carpeta_archivos_json)
-                    candidates = sorted(output_dir.glob("datos*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
-                    archivo_json = candidates[0] if candidates else output_dir / f"datos{base}.json"
+                # Preferimos el resultado histórico único por archivo (JSON legado o ndjson)
+                archivo_json = csv_processor.ruta_resultado(filename)
                 
                 # Verificar que los archivos existen
                 if not archivo_csv.exists():
                     logger.error(f"Archivo CSV procesado no encontrado: {archivo_csv}")
                     return {"error": "Archivo CSV procesado no encontrado"}
                 
-                if not archivo_json.exists():
-                    logger.error(f"Archivo JSON no encontrado: {archivo_json}")
+                if archivo_json is None:
+                    logger.error(f"Archivo de resultado no encontrado para: {filename}")
                     return {"error": "Archivo JSON no encontrado"}
                 
                 # 3. Llamar al endpoint de almacenamiento
@@ -159,16 +153,9 @@ async def process_pending_and_store_all(background_tasks: BackgroundTasks, db: S
                     if resultado_procesamiento:
                         # 2. Almacenar en BD
                         archivo_csv = Path(csv_processor.carpeta_almacenamiento_csv) / archivo
-                        base = archivo[:-4] if archivo.lower().endswith('.csv') else archivo
-                        archivo_json_hist = Path(csv_processor.carpeta_almacenamiento_json) / f"datos{base}save.json"
-                        if archivo_json_hist.exists():
-                            archivo_json = archivo_json_hist
-                        else:
-                            output_dir = Path(csv_processor.carpeta_archivos_json)
-                            candidates = sorted(output_dir.glob("datos*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
-                            archivo_json = candidates[0] if candidates else output_dir / f"datos{base}.json"
+                        archivo_json = csv_processor.ruta_resultado(archivo)
                         
-                        if archivo_csv.exists() and archivo_json.exists():
+                        if archivo_csv.exists() and archivo_json is not None:
                             url = f"{settings.BASE_URL}{settings.API_V1_STR}/recway/process-and-store"
                             params = {
                                 "csv_file_path": str(archivo_csv),
@@ -326,7 +313,7 @@ async def get_processed_files():
         # Listar archivos JSON generados
         archivos_json = []
         if carpeta_json.exists():
-            archivos_json = [f.name for f in carpeta_json.glob("*.json")]
+            archivos_json = [f.name for f in carpeta_json.iterdir() if csv_processor.es_archivo_resultado(f.name)]
         
         return {
             "archivos_csv_procesados": archivos_csv,
@@ -365,13 +352,17 @@ async def clear_processed_files():
         
         # Limpiar JSON output
         if carpeta_json_output.exists():
-            for archivo in carpeta_json_output.glob("*.json"):
+            for archivo in carpeta_json_output.iterdir():
+                if not csv_processor.es_archivo_resultado(archivo.name):
+                    continue
                 archivo.unlink()
                 archivos_eliminados += 1
         
         # Limpiar JSON storage
         if carpeta_json_storage.exists():
-            for archivo in carpeta_json_storage.glob("*.json"):
+            for archivo in carpeta_json_storage.iterdir():
+                if not csv_processor.es_archivo_resultado(archivo.name):
+                    continue
                 archivo.unlink()
                 archivos_eliminados += 1
         
@@ -614,3 +605,79 @@ async def stop_file_watcher_endpoint():
             status_code=500,
             detail=f"Error deteniendo file watcher: {str(e)}"
         )
+
+@router.get("/graph-warmup/status")
+async def get_graph_warmup_status():
+    """
+    Obtener el progreso del precalentamiento de tiles de grafo al iniciar
+    """
+    try:
+        # Con el pool cada worker precalienta su propia cache: se reporta el progreso de los workers
+        status = processing_pool.warmup_status() if processing_pool.enabled else tile_warmup.status()
+        status["usage_top"] = {tile: tile_usage.counts().get(tile, 0) for tile in status["planned"]}
+        status["graph_cache"] = csv_processor.metricas_cache_grafos()
+        status["processing_pool"] = processing_pool.status()
+        return status
+
+    except Exception as e:
+        logger.error(f"Error obteniendo estado del precalentamiento: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error obteniendo estado: {str(e)}"
+        )
+
+@router.get("/processing-pool/status")
+async def get_processing_pool_status():
+    """
+    Estado del pool de procesamiento: trabajos por worker, tiles en cache,
+    envíos por afinidad o por carga y tasa de aciertos de cache de cada worker
+    """
+    try:
+        return processing_pool.status()
+
+    except Exception as e:
+        logger.error(f"Error obteniendo estado del pool de procesamiento: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error obteniendo estado: {str(e)}"
+        )
+
+@router.get("/graph-versions")
+async def get_graph_versions():
+    """
+    Listar las versiones de tiles de grafo disponibles y cuál es la actual
+    """
+    try:
+        return csv_processor.versiones_tiles()
+
+    except Exception as e:
+        logger.error(f"Error listando versiones de tiles: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error listando versiones: {str(e)}"
+        )
+
+@router.post("/graph-versions/{version}/activate")
+async def activate_graph_version(version: str):
+    """
+    Activar una versión de tiles sin reiniciar el servicio.
+    Los archivos nuevos usan esta versión; los que están en curso terminan con la anterior.
+    """
+    try:
+        result = csv_processor.activar_version_tiles(version)
+        return {
+            "status": "success",
+            "message": f"Versión de tiles {result['actual']} activada",
+            **result
+        }
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error activando versión de tiles {version}: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error activando versión: {str(e)}"
+        )
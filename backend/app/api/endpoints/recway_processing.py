@@ -10,10 +10,10 @@ import logging
 
 from app.core.config import settings
 from app.database.session import get_db
-from app.schemas.recway import ProcessingResult, SegmentoFromJSON
+from app.schemas.recway import ProcessingResult, segmentos_from_json
 from app.services.data.database_service import RecWayDatabaseService
 from app.services.data.parser import CSVParser
-from app.services.processing.csv_processor import CSVProcessor
+from app.services.processing.csv_processor import CSVProcessor, csv_processor
 
 logger = logging.getLogger(__name__)
 
@@ -62,15 +62,15 @@ async def process_and_store_data(
         logger.info(f"Iniciando procesamiento de archivos: CSV={csv_file_path}, JSON={json_file_path}")
         
         # 1. Parsear CSV para obtener metadatos y datos de sensores
-        csv_metadata, sensor_data = CSVParser.parse_csv_file(csv_file_path)
+        csv_metadata, sensor_data = CSVParser.parse_csv_columns(csv_file_path)
         logger.info(f"CSV parseado: {len(sensor_data)} registros de sensores")
         
-        # 2. Leer JSON con segmentos procesados
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            json_data = json.load(f)
+        # 2. Leer resultado con segmentos procesados (JSON legado o ndjson compacto)
+        json_data = csv_processor.leer_resultado(json_file_path)
+        versiones = csv_processor.leer_versiones_resultado(json_file_path)
         
-        # Convertir JSON a esquemas Pydantic
-        processed_segments = [SegmentoFromJSON(**segment) for segment in json_data]
+        # Convertir JSON a esquemas Pydantic (validación de la lista en un solo paso)
+        processed_segments = segmentos_from_json.validate_python(json_data)
         logger.info(f"JSON parseado: {len(processed_segments)} segmentos")
         
         # 3. Procesar y almacenar en base de datos
@@ -79,7 +79,8 @@ async def process_and_store_data(
             csv_metadata=csv_metadata,
             processed_segments=processed_segments,
             csv_sensor_data=sensor_data,
-            user_id=DEFAULT_USER_ID
+            user_id=DEFAULT_USER_ID,
+            versiones=versiones
         )
         
         logger.info(f"Procesamiento completado en {result.total_processing_time:.2f}s")
@@ -129,14 +130,16 @@ async def process_csv_complete(
         logger.info(f"Iniciando procesamiento completo de CSV: {csv_file_path}")
         
         # 1. Parsear CSV
-        csv_metadata, sensor_data = CSVParser.parse_csv_file(csv_file_path)
+        csv_metadata, sensor_data = CSVParser.parse_csv_columns(csv_file_path)
         
         # 2. Ejecutar algoritmos de procesamiento
         csv_processor = CSVProcessor()
+        # El archivo se procesa con las versiones actuales al comenzar (ver versiones_tiles.usar_version)
+        version_algoritmo, version_tiles = csv_processor.versiones_actuales()
         json_result = csv_processor.process_csv_file(csv_file_path)
         
         # 3. Convertir resultado a esquemas
-        processed_segments = [SegmentoFromJSON(**segment) for segment in json_result]
+        processed_segments = segmentos_from_json.validate_python(json_result or [])
         
         # 4. Almacenar en base de datos
         db_service = RecWayDatabaseService(db)
@@ -144,7 +147,8 @@ async def process_csv_complete(
             csv_metadata=csv_metadata,
             processed_segments=processed_segments,
             csv_sensor_data=sensor_data,
-            user_id=DEFAULT_USER_ID
+            user_id=DEFAULT_USER_ID,
+            versiones={"version_algoritmo": version_algoritmo, "version_tiles": version_tiles}
         )
         
         logger.info(f"Procesamiento completo terminado en {result.total_processing_time:.2f}s")
@@ -186,7 +190,7 @@ async def store_sensor_data_only(
             )
         
         # Parsear CSV
-        csv_metadata, sensor_data = CSVParser.parse_csv_file(csv_file_path)
+        csv_metadata, sensor_data = CSVParser.parse_csv_columns(csv_file_path)
         
         # Crear/obtener fuente de datos
         db_service = RecWayDatabaseService(db)
@@ -1,11 +1,18 @@
 """Endpoint simple para subir CSV y colocarlo en uploads/csv/raw"""
-from fastapi import APIRouter, UploadFile, File, BackgroundTasks, HTTPException
+from fastapi import APIRouter, UploadFile, File, BackgroundTasks, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from contextlib import contextmanager
 from pathlib import Path
-import shutil
-import sys
+import asyncio
+import hashlib
+import os
 import traceback
 from typing import Optional, List
 
+from app.core.config import settings
+from app.services.processing.admission import AdmissionRejected, AdmissionTicket, admission_controller
+from app.services.processing.result_cache import CHUNK_SIZE
+
 router = APIRouter()
 
 # Base real del backend (sube cuatro niveles hasta la carpeta backend)
@@ -13,12 +20,36 @@ BACKEND_BASE = Path(__file__).resolve().parent.parent.parent.parent  # .../backe
 RAW_DIR = BACKEND_BASE / "uploads" / "csv" / "raw"
 RAW_DIR.mkdir(parents=True, exist_ok=True)
 
-@router.post("/upload-csv")
-async def upload_csv_file(background_tasks: BackgroundTasks, file: UploadFile = File(...), sync: bool = False):
-    print("[UPLOAD] Inicio subida archivo:", file.filename)
-    if not file.filename.lower().endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Solo se permiten archivos .csv")
-    target_path = RAW_DIR / file.filename
+DUPLICATE_POLICIES = ("cached", "reject")
+
+
+async def save_with_hash(file: UploadFile, filename: str, ticket: Optional[AdmissionTicket] = None):
+    """Guarda la subida en raw calculando su SHA-256 mientras se escribe.
+
+    Se escribe como .part (el watcher solo toma .csv) y se retorna (ruta temporal, hash).
+    Los bytes se cuentan en el ticket de admisión (AdmissionRejected si se pasa del límite).
+    """
+    part_path = RAW_DIR / f".{filename}.{os.getpid()}.{id(file)}.part"
+    digest = hashlib.sha256()
+    try:
+        with open(part_path, 'wb') as out:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if ticket is not None:
+                    ticket.add_bytes(len(chunk))
+                digest.update(chunk)
+                out.write(chunk)
+    except Exception:
+        part_path.unlink(missing_ok=True)
+        raise
+    return part_path, digest.hexdigest()
+
+
+def publish_upload(part_path: Path, filename: str) -> Path:
+    """Mueve la subida temporal a raw con su nombre (sufijo _N si ya existe)."""
+    target_path = RAW_DIR / filename
     # Evitar sobreescritura añadiendo sufijo si existe
     counter = 1
     base = target_path.stem
@@ -26,119 +57,342 @@ async def upload_csv_file(background_tasks: BackgroundTasks, file: UploadFile =
     while target_path.exists():
         target_path = RAW_DIR / f"{base}_{counter}{ext}"
         counter += 1
+    os.replace(part_path, target_path)
+    return target_path
+
+
+def process_upload(target_path: Path, tag: str = "PROCESS", ticket: Optional[AdmissionTicket] = None):
+    """CSV → JSON de una subida cuando no hay watcher activo que la tome (BackgroundTask o sync)."""
+    try:
+        print(f"[{tag}] Iniciando procesamiento de:", target_path.name)
+        from app.services.processing.csv_processor import csv_processor
+        resultado = csv_processor.procesar_archivo_especifico(target_path.name)
+        print(f"[{tag}] Resultado segmentos para {target_path.name}:",
+              len(resultado) if isinstance(resultado, list) else resultado)
+    except Exception as e:
+        print(f"[{tag}][ERROR] {target_path.name}:", e)
+        traceback.print_exc()
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+
+def hand_off(part_path: Path, filename: str):
+    """Publica la subida en raw y la entrega a un único consumidor.
+
+    Con el watcher activo el archivo se reclama en su cola en el mismo paso que el rename
+    del .part, así que ni su evento ni su barrido lo vuelven a tomar: retorna (ruta, trabajo), con
+    el Future del executor del watcher o el id del trabajo si la cola está en BD (JOB_QUEUE_ENABLED).
+    Sin watcher retorna (ruta, None) y el llamador lo procesa con process_upload.
+    """
+    from app.services.monitoring.file_watcher import enqueue_upload
+    queued = enqueue_upload(lambda: publish_upload(part_path, filename))
+    if queued is not None:
+        return queued
+    return publish_upload(part_path, filename), None
+
+
+async def wait_for_job(job):
+    """Espera un trabajo entregado al watcher: Future del executor o id en la cola en BD."""
+    if isinstance(job, int):
+        from app.services.processing.job_queue import job_queue
+        state = await run_in_threadpool(job_queue.wait, job, settings.JOB_SYNC_TIMEOUT_SECONDS)
+        if state is not None and state["state"] == "failed":
+            raise HTTPException(status_code=500, detail=f"Procesamiento fallido: {state['last_error']}")
+        return
+    await asyncio.wrap_future(job)
+
+
+def client_key(request: Request) -> str:
+    """Cliente para el límite de subidas simultáneas: IP del socket o, detrás de proxies de confianza
+    (ADMISSION_TRUSTED_PROXY_HOPS), la entrada de X-Forwarded-For que agregó el más externo.
+
+    Las entradas anteriores las pone el cliente y no se usan.
+    """
+    hops = settings.ADMISSION_TRUSTED_PROXY_HOPS
+    forwarded = request.headers.get("x-forwarded-for")
+    if hops > 0 and forwarded:
+        entries = [entry.strip() for entry in forwarded.split(",") if entry.strip()]
+        if len(entries) >= hops:
+            return entries[-hops]
+    return request.client.host if request.client else "unknown"
+
+
+def too_busy(e: AdmissionRejected) -> HTTPException:
+    print(f"[UPLOAD] Rechazada por admisión ({e.limit}): {e.reason}, Retry-After {e.retry_after}s")
+    return HTTPException(status_code=429, detail=e.detail(), headers={"Retry-After": str(e.retry_after)})
+
+
+@contextmanager
+def client_slot(request: Request):
+    """Cuenta la petición en el límite por cliente mientras dura (429 si el cliente ya tiene el máximo)."""
+    client = client_key(request)
+    try:
+        admission_controller.enter_client(client)
+    except AdmissionRejected as e:
+        raise too_busy(e)
+    try:
+        yield client
+    finally:
+        admission_controller.leave_client(client)
+
+
+def find_duplicate(content_hash: str):
+    """Resultado en cache para el contenido subido (versiones actuales de algoritmo y tiles) o None."""
+    if not settings.RESULT_CACHE_ENABLED:
+        return None
+    from app.services.processing.csv_processor import csv_processor
+    try:
+        return csv_processor.buscar_resultado_cache(content_hash)
+    except Exception as e:
+        print("[UPLOAD][WARN] No se pudo consultar la cache de resultados:", e)
+        return None
+
+
+def resolve_policy(on_duplicate: Optional[str]) -> str:
+    policy = on_duplicate or settings.UPLOAD_DUPLICATE_POLICY
+    if policy not in DUPLICATE_POLICIES:
+        raise HTTPException(status_code=400, detail=f"on_duplicate debe ser uno de {DUPLICATE_POLICIES}")
+    return policy
+
+
+def duplicate_detail(filename: str, content_hash: str, cached: dict) -> dict:
+    return {
+        "message": f"{filename} ya fue procesado como {cached['archivo']}",
+        "content_hash": content_hash,
+        "original_filename": cached["archivo"],
+        "algorithm_version": cached["version_algoritmo"],
+        "tile_version": cached["version_tiles"],
+    }
+
+
+def build_preview(part_path: Path) -> dict:
+    """Vista previa del archivo subido (se calcula sobre el .part, antes de que el watcher lo tome)."""
+    from app.services.processing.csv_processor import csv_processor
+    return csv_processor.vista_previa(str(part_path))
+
+
+@router.post("/upload-csv")
+async def upload_csv_file(request: Request, background_tasks: BackgroundTasks, file: UploadFile = File(...), sync: bool = False,
+                          on_duplicate: Optional[str] = None, preview: bool = False):
+    print("[UPLOAD] Inicio subida archivo:", file.filename)
+    if not file.filename.lower().endswith('.csv'):
+        raise HTTPException(status_code=400, detail="Solo se permiten archivos .csv")
+    policy = resolve_policy(on_duplicate)
+    with client_slot(request):
+        try:
+            ticket = admission_controller.admit(file.size or 0)
+        except AdmissionRejected as e:
+            raise too_busy(e)
+        try:
+            return await store_upload(file, background_tasks, policy, sync, preview, ticket)
+        finally:
+            ticket.release()
+
+
+async def store_upload(file: UploadFile, background_tasks: BackgroundTasks, policy: str, sync: bool, preview: bool,
+                       ticket: AdmissionTicket):
+    """Guarda, deduplica y entrega una subida admitida (ver upload_csv_file)."""
     try:
-        with open(target_path, 'wb') as out:
-            shutil.copyfileobj(file.file, out)
-        print(f"[UPLOAD] Guardado en {target_path}")
+        part_path, content_hash = await save_with_hash(file, file.filename, ticket)
+    except AdmissionRejected as e:
+        raise too_busy(e)
     except Exception as e:
         print("[UPLOAD][ERROR] Falló guardado:", e)
         raise HTTPException(status_code=500, detail=f"Error guardando archivo: {e}")
 
-    def run_process(nombre):
+    # Duplicado exacto ya procesado: no se procesa ni se inserta de nuevo
+    cached = find_duplicate(content_hash)
+    if cached is not None:
+        part_path.unlink(missing_ok=True)
+        detail = duplicate_detail(file.filename, content_hash, cached)
+        print(f"[UPLOAD] Duplicado de {cached['archivo']} ({content_hash[:12]}), política {policy}")
+        if policy == "reject":
+            raise HTTPException(status_code=409, detail=detail)
+        return {**detail, "filename": file.filename, "cached": True, "result": cached["segmentos"]}
+
+    # Vista previa: resultado aproximado en segundos; el procesamiento completo queda en cola
+    preview_result = None
+    preview_error = None
+    if preview:
         try:
-            print("[PROCESS] Iniciando procesamiento de:", nombre)
-            services_dir = Path(__file__).resolve().parent.parent.parent / 'services'
-            if str(services_dir) not in sys.path:
-                sys.path.insert(0, str(services_dir))
-                print("[PROCESS] Añadido services al sys.path")
-            from app.services.processing.csv_processor import csv_processor
-            resultado = csv_processor.procesar_archivo_especifico(Path(nombre).name)
-            print("[PROCESS] Resultado segmentos:", len(resultado) if isinstance(resultado, list) else resultado)
+            preview_result = await run_in_threadpool(build_preview, part_path)
+            print(f"[UPLOAD] Vista previa de {file.filename}: {len(preview_result['segmentos'])} segmentos "
+                  f"en {preview_result['tiempo']}s")
         except Exception as e:
-            print("[PROCESS][ERROR]", e)
-            traceback.print_exc()
+            preview_error = str(e)
+            print("[UPLOAD][WARN] No se pudo calcular la vista previa:", e)
+
+    try:
+        target_path, job = hand_off(part_path, file.filename)
+        print(f"[UPLOAD] Guardado en {target_path}" + (" (encolado en el watcher)" if job else ""))
+    except Exception as e:
+        part_path.unlink(missing_ok=True)
+        print("[UPLOAD][ERROR] Falló guardado:", e)
+        raise HTTPException(status_code=500, detail=f"Error guardando archivo: {e}")
+    if job is not None:
+        # Desde aquí la cola del watcher cuenta el archivo
+        ticket.release()
 
     if sync:
-        run_process(target_path)
-        return {"message": "Archivo subido y procesado (sync)", "filename": target_path.name, "path": str(target_path)}
+        if job is not None:
+            await wait_for_job(job)
+        else:
+            await run_in_threadpool(process_upload, target_path)
+        response = {"message": "Archivo subido y procesado (sync)", "filename": target_path.name,
+                    "path": str(target_path), "content_hash": content_hash}
     else:
-        background_tasks.add_task(run_process, target_path)
-        return {"message": "Archivo subido", "filename": target_path.name, "path": str(target_path)}
+        if job is None:
+            # El ticket se libera al terminar el procesamiento en segundo plano
+            background_tasks.add_task(process_upload, target_path, "PROCESS", ticket.transfer())
+        response = {"message": "Archivo subido", "filename": target_path.name, "path": str(target_path),
+                    "content_hash": content_hash}
+    if preview:
+        response["preview"] = preview_result
+        response["status"] = "processed" if sync else "processing_queued"
+        if preview_error:
+            response["preview_error"] = preview_error
+    return response
 
 
 @router.post("/upload-multiple-csv")
-async def upload_multiple_csv_files(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...), sync: bool = False):
+async def upload_multiple_csv_files(request: Request, response: Response, background_tasks: BackgroundTasks,
+                                    files: List[UploadFile] = File(...), sync: bool = False,
+                                    on_duplicate: Optional[str] = None):
     """
     Subir múltiples archivos CSV simultáneamente
+
+    Cada archivo pasa por el control de admisión: si ninguno entra la respuesta es 429;
+    si la cola se llena a mitad del lote, los restantes se reportan en rejected_files
+    y la respuesta lleva Retry-After.
     """
     print(f"[UPLOAD-MULTIPLE] Inicio subida de {len(files)} archivos")
     
     if not files:
         raise HTTPException(status_code=400, detail="No se enviaron archivos")
-    
+    policy = resolve_policy(on_duplicate)
+    with client_slot(request):
+        return await store_multiple_uploads(response, background_tasks, files, sync, policy)
+
+
+async def store_multiple_uploads(response: Response, background_tasks: BackgroundTasks, files: List[UploadFile],
+                                 sync: bool, policy: str):
     uploaded_files = []
+    duplicates = []
     errors = []
-    
-    # Función para procesar un archivo específico
-    def run_process_single(file_path, filename):
-        try:
-            print(f"[PROCESS-MULTIPLE] Iniciando procesamiento de: {filename}")
-            services_dir = Path(__file__).resolve().parent.parent.parent / 'services'
-            if str(services_dir) not in sys.path:
-                sys.path.insert(0, str(services_dir))
-                print(f"[PROCESS-MULTIPLE] Añadido services al sys.path para {filename}")
-            from app.services.processing.csv_processor import csv_processor
-            resultado = csv_processor.procesar_archivo_especifico(Path(file_path).name)
-            print(f"[PROCESS-MULTIPLE] Resultado segmentos para {filename}:", len(resultado) if isinstance(resultado, list) else resultado)
-        except Exception as e:
-            print(f"[PROCESS-MULTIPLE][ERROR] {filename}:", e)
-            traceback.print_exc()
+    rejected = []
+    retry_after = None
     
     # Procesar cada archivo
     for file in files:
+        ticket = None
         try:
             # Validar extensión
             if not file.filename.lower().endswith('.csv'):
                 errors.append(f"Archivo {file.filename}: Solo se permiten archivos .csv")
                 continue
+
+            # Admisión: con la cola llena el resto del lote se rechaza
+            if retry_after is not None:
+                rejected.append({"filename": file.filename, "status": "rejected", "retry_after": retry_after})
+                continue
+            try:
+                ticket = admission_controller.admit(file.size or 0)
+                # Guardar archivo calculando el hash del contenido
+                part_path, content_hash = await save_with_hash(file, file.filename, ticket)
+            except AdmissionRejected as e:
+                print(f"[UPLOAD-MULTIPLE] Rechazado por admisión ({e.limit}): {file.filename}")
+                retry_after = e.retry_after
+                rejected.append({"filename": file.filename, "status": "rejected", "reason": e.reason,
+                                 "retry_after": e.retry_after})
+                continue
+
+            # Duplicado exacto ya procesado: se reporta sin procesar ni insertar de nuevo
+            cached = find_duplicate(content_hash)
+            if cached is not None:
+                part_path.unlink(missing_ok=True)
+                print(f"[UPLOAD-MULTIPLE] Duplicado de {cached['archivo']}: {file.filename}")
+                if policy == "reject":
+                    errors.append(f"Archivo {file.filename}: duplicado de {cached['archivo']} (409)")
+                else:
+                    duplicates.append({**duplicate_detail(file.filename, content_hash, cached),
+                                       "filename": file.filename, "segments": len(cached["segmentos"]),
+                                       "status": "duplicate"})
+                continue
+
+            try:
+                target_path, job = hand_off(part_path, file.filename)
+            except Exception as e:
+                # El ticket se libera en el finally
+                part_path.unlink(missing_ok=True)
+                print(f"[UPLOAD-MULTIPLE][ERROR] Falló guardado de {file.filename}:", e)
+                errors.append(f"Error guardando {file.filename}: {e}")
+                continue
+            if job is not None:
+                ticket.release()
             
-            # Determinar path de destino
-            target_path = RAW_DIR / file.filename
-            counter = 1
-            base = target_path.stem
-            ext = target_path.suffix
-            while target_path.exists():
-                target_path = RAW_DIR / f"{base}_{counter}{ext}"
-                counter += 1
-            
-            # Guardar archivo
-            with open(target_path, 'wb') as out:
-                shutil.copyfileobj(file.file, out)
-            
-            print(f"[UPLOAD-MULTIPLE] Guardado: {target_path}")
+            print(f"[UPLOAD-MULTIPLE] Guardado: {target_path}" + (" (encolado en el watcher)" if job else ""))
             
             uploaded_files.append({
                 "original_filename": file.filename,
                 "saved_filename": target_path.name,
                 "path": str(target_path),
+                "content_hash": content_hash,
                 "status": "uploaded"
             })
             
-            # Procesar archivo
+            # Procesar archivo (un solo consumidor: el watcher si está activo)
             if sync:
-                run_process_single(target_path, file.filename)
+                if job is not None:
+                    await wait_for_job(job)
+                else:
+                    await run_in_threadpool(process_upload, target_path, "PROCESS-MULTIPLE")
                 uploaded_files[-1]["status"] = "processed"
             else:
-                background_tasks.add_task(run_process_single, target_path, file.filename)
+                if job is None:
+                    background_tasks.add_task(process_upload, target_path, "PROCESS-MULTIPLE", ticket.transfer())
                 uploaded_files[-1]["status"] = "processing_queued"
                 
         except Exception as e:
             error_msg = f"Error guardando {file.filename}: {str(e)}"
             print(f"[UPLOAD-MULTIPLE][ERROR] {error_msg}")
             errors.append(error_msg)
+        finally:
+            if ticket is not None:
+                ticket.release()
+
+    if rejected and not uploaded_files and not duplicates:
+        # No entró ningún archivo: 429 para todo el lote
+        raise HTTPException(status_code=429, detail={"message": "Cola de procesamiento llena",
+                                                     "retry_after": retry_after, "rejected_files": rejected},
+                            headers={"Retry-After": str(retry_after)})
     
     # Preparar respuesta
-    response = {
+    result = {
         "total_files": len(files),
         "uploaded_successfully": len(uploaded_files),
+        "duplicates": len(duplicates),
+        "rejected": len(rejected),
         "errors": len(errors),
         "uploaded_files": uploaded_files,
+        "duplicate_files": duplicates,
+        "rejected_files": rejected,
         "processing_mode": "sync" if sync else "async"
     }
     
     if errors:
-        response["error_details"] = errors
+        result["error_details"] = errors
+    if rejected:
+        result["retry_after"] = retry_after
+        response.headers["Retry-After"] = str(retry_after)
     
-    print(f"[UPLOAD-MULTIPLE] Completado: {len(uploaded_files)} exitosos, {len(errors)} errores")
+    print(f"[UPLOAD-MULTIPLE] Completado: {len(uploaded_files)} exitosos, {len(rejected)} rechazados, "
+          f"{len(errors)} errores")
     
-    return response
+    return result
+
+
+@router.get("/queue-status")
+async def queue_status():
+    """Profundidad de la cola de procesamiento, bytes en vuelo, espera estimada y límites de admisión."""
+    return await run_in_threadpool(admission_controller.status)
@@ -35,10 +35,79 @@ class Settings:
     JSON_STORAGE_DIR = os.getenv("JSON_STORAGE_DIR", os.path.join(LOCAL_STORAGE_BASE, "json", "storage"))
     GRAPHS_DIR = os.getenv("GRAPHS_DIR", os.path.join("grafos_archivos6"))
     GRAPHML_DIR = os.getenv("GRAPHML_DIR", os.path.join("grafos_archivos5"))
+    # Cache de tiles de grafo (presupuesto de memoria en MB; con el pool se reparte entre sus workers)
+    GRAPH_CACHE_MAX_MB = float(os.getenv("GRAPH_CACHE_MAX_MB", "1024"))
+    # Precarga del tile siguiente cuando el vehículo está a menos de esta distancia (m) del borde
+    GRAPH_PREFETCH_ENABLED = os.getenv("GRAPH_PREFETCH_ENABLED", "true").lower() == "true"
+    GRAPH_PREFETCH_DISTANCE_M = float(os.getenv("GRAPH_PREFETCH_DISTANCE_M", "1500"))
+    # Precalentamiento al iniciar: los N tiles más usados se cargan antes de arrancar el watcher
+    # (con el pool se reparten por turnos entre sus workers)
+    GRAPH_WARMUP_ENABLED = os.getenv("GRAPH_WARMUP_ENABLED", "true").lower() == "true"
+    GRAPH_WARMUP_TOP_N = int(os.getenv("GRAPH_WARMUP_TOP_N", "10"))
+    GRAPH_TILE_USAGE_FILE = os.getenv("GRAPH_TILE_USAGE_FILE", os.path.join(LOCAL_STORAGE_BASE, "graph_tile_usage.json"))
+    # Pool persistente de procesos para CSV → JSON (0 workers = núcleos disponibles - 1)
+    PROCESSING_POOL_ENABLED = os.getenv("PROCESSING_POOL_ENABLED", "true").lower() == "true"
+    PROCESSING_POOL_WORKERS = int(os.getenv("PROCESSING_POOL_WORKERS", "0"))
+    # Afinidad por tile: cada viaje va al worker que ya tiene su tile en cache, salvo que
+    # ese worker tenga más de PROCESSING_POOL_MAX_IMBALANCE trabajos en curso que el menos cargado
+    PROCESSING_POOL_AFFINITY = os.getenv("PROCESSING_POOL_AFFINITY", "true").lower() == "true"
+    PROCESSING_POOL_MAX_IMBALANCE = int(os.getenv("PROCESSING_POOL_MAX_IMBALANCE", "1"))
+    # Cache de resultados por contenido (hash, versión de algoritmo, versión de tiles).
+    # Un CSV repetido devuelve el resultado guardado ("cached") o se rechaza con 409 ("reject")
+    RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+    RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", os.path.join(LOCAL_STORAGE_BASE, "result_cache"))
+    UPLOAD_DUPLICATE_POLICY = os.getenv("UPLOAD_DUPLICATE_POLICY", "cached")
+    # Escritura de los JSON de resultado: "async" (en segundo plano), "sync" o "off".
+    # El resultado pasa a la BD en memoria; los JSON quedan como copia para consulta
+    RESULT_JSON_PERSIST = os.getenv("RESULT_JSON_PERSIST", "async")
+    # Formato de los archivos de resultado: "ndjson" (compacto, geometría empaquetada, nombre único
+    # por trabajo en salida rápida) o "json" (legado, indent=2). Compresión ndjson: gzip | zstd | ninguna
+    RESULT_FILE_FORMAT = os.getenv("RESULT_FILE_FORMAT", "ndjson")
+    RESULT_FILE_COMPRESSION = os.getenv("RESULT_FILE_COMPRESSION", "gzip")
+    # Artefactos intermedios por etapa (señales, detecciones, matching, espectros) para
+    # reprocesar solo las etapas cuya versión cambió; vacío (por defecto) deshabilita, p. ej.
+    # uploads/stage_artifacts. Al pasar STAGE_ARTIFACTS_MAX_MB se borran los CSV usados hace más tiempo
+    STAGE_ARTIFACTS_DIR = os.getenv("STAGE_ARTIFACTS_DIR", "")
+    STAGE_ARTIFACTS_MAX_MB = float(os.getenv("STAGE_ARTIFACTS_MAX_MB", "1024"))
+    # Modo de bajo consumo de memoria (lectura por bloques, sin copias del DataFrame, etapas en serie)
+    # y pico de memoria por etapa con tracemalloc en el diagnóstico (más lento, solo para medir).
+    # No acota la memoria de viajes arbitrariamente largos: el viaje completo sigue en memoria
+    # (~15 MB por hora de viaje además de la cache de tiles)
+    PROCESSING_LOW_MEMORY = os.getenv("PROCESSING_LOW_MEMORY", "false").lower() == "true"
+    PROCESSING_MEMORY_TRACE = os.getenv("PROCESSING_MEMORY_TRACE", "false").lower() == "true"
+    # Vista previa en la subida (?preview=true): matching con una muestra GPS cada N metros
+    PREVIEW_DECIMATION_M = float(os.getenv("PREVIEW_DECIMATION_M", "25"))
+    # Checkpoints del reprocesamiento masivo (python -m app.services.processing.reprocess)
+    REPROCESS_CHECKPOINT_DIR = os.getenv("REPROCESS_CHECKPOINT_DIR", os.path.join(LOCAL_STORAGE_BASE, "reprocess"))
     
     # Runtime toggles - Definir primero para usar en CORS
     ENV = os.getenv("ENV", "local")  # local | azure | staging | prod
     ENABLE_FILE_WATCHER = os.getenv("ENABLE_FILE_WATCHER", "true").lower() == "true"
+    # Modo del watcher: "auto" (inotify en Linux, si no polling), "inotify" o "polling".
+    # Con inotify la carpeta se barre cada FILE_WATCHER_RECONCILE_SECONDS para recuperar archivos sin evento
+    FILE_WATCHER_MODE = os.getenv("FILE_WATCHER_MODE", "auto")
+    FILE_WATCHER_RECONCILE_SECONDS = float(os.getenv("FILE_WATCHER_RECONCILE_SECONDS", "60"))
+    # Cola de trabajos en BD (tabla processing_jobs): el watcher y las subidas encolan y cualquier
+    # instancia toma los trabajos con lease; los fallidos se reintentan con backoff exponencial
+    JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE_ENABLED", "false").lower() == "true"
+    JOB_QUEUE_WORKERS = int(os.getenv("JOB_QUEUE_WORKERS", "0"))  # 0 = uno por worker del pool (o 3)
+    JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+    JOB_BACKOFF_BASE_SECONDS = float(os.getenv("JOB_BACKOFF_BASE_SECONDS", "30"))
+    JOB_BACKOFF_MAX_SECONDS = float(os.getenv("JOB_BACKOFF_MAX_SECONDS", "1800"))
+    JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+    JOB_SYNC_TIMEOUT_SECONDS = float(os.getenv("JOB_SYNC_TIMEOUT_SECONDS", "600"))
+    # Control de admisión de subidas (0 = sin límite): trabajos en cola o en proceso, MB subiéndose o
+    # esperando procesamiento y subidas simultáneas por cliente. Lo que no entra recibe 429 con Retry-After
+    ADMISSION_MAX_QUEUED_JOBS = int(os.getenv("ADMISSION_MAX_QUEUED_JOBS", "50"))
+    ADMISSION_MAX_INFLIGHT_MB = float(os.getenv("ADMISSION_MAX_INFLIGHT_MB", "512"))
+    ADMISSION_MAX_PER_CLIENT = int(os.getenv("ADMISSION_MAX_PER_CLIENT", "4"))
+    # Proxies de confianza delante del servicio (p. ej. 1 en Azure App Service). Con 0 el cliente es la IP
+    # del socket; con N es la entrada de X-Forwarded-For que agregó el proxy más externo (N-ésima desde el
+    # final), así un cliente no puede saltarse el límite enviando el encabezado con otra IP
+    ADMISSION_TRUSTED_PROXY_HOPS = int(os.getenv("ADMISSION_TRUSTED_PROXY_HOPS", "0"))
+    # Duración supuesta de un procesamiento hasta medir alguno (para Retry-After y la espera estimada)
+    ADMISSION_DEFAULT_JOB_SECONDS = float(os.getenv("ADMISSION_DEFAULT_JOB_SECONDS", "30"))
     
     # URLs básicas
     BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
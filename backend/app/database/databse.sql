@@ -4,6 +4,7 @@
 -----------------------------------------------------------------------
 
 -- ELIMINACIÓN DE TABLAS EN ORDEN CORRECTO
+DROP TABLE IF EXISTS processing_jobs;
 DROP TABLE IF EXISTS registro_sensores;
 DROP TABLE IF EXISTS indices_muestra;
 DROP TABLE IF EXISTS huecoMuestra;
@@ -197,6 +198,8 @@ CREATE TABLE muestra (
     tipo_dispositivo varchar(30),
     identificador_dispositivo varchar(60),
     fecha_muestra varchar(40),
+    version_algoritmo varchar(20),
+    version_tiles varchar(100),
     id_segmento_seleccionado bigint NOT NULL REFERENCES segmento(id_segmento) ON DELETE CASCADE,
     created_by_user_id BIGINT REFERENCES users(id)
 );
@@ -248,9 +251,18 @@ CREATE TABLE fuente_datos_dispositivo (
     sampling_rate real,
     recording_duration varchar(20),
     average_sample_rate real,
+    version_algoritmo varchar(20),
+    version_tiles varchar(100),
     created_by_user_id BIGINT REFERENCES users(id)
 );
 
+-- Versiones de algoritmo y tiles con que se procesó cada viaje y muestra.
+-- En una base existente:
+--   ALTER TABLE fuente_datos_dispositivo ADD COLUMN IF NOT EXISTS version_algoritmo varchar(20);
+--   ALTER TABLE fuente_datos_dispositivo ADD COLUMN IF NOT EXISTS version_tiles varchar(100);
+--   ALTER TABLE muestra ADD COLUMN IF NOT EXISTS version_algoritmo varchar(20);
+--   ALTER TABLE muestra ADD COLUMN IF NOT EXISTS version_tiles varchar(100);
+
 -- REGISTRO DETALLADO DE SENSORES
 CREATE TABLE registro_sensores (
     id_registro bigserial PRIMARY KEY,
@@ -280,6 +292,29 @@ CREATE TABLE registro_sensores (
     id_fuente bigint NOT NULL REFERENCES fuente_datos_dispositivo(id_fuente) ON DELETE CASCADE
 );
 
+-- COLA DE TRABAJOS DE PROCESAMIENTO (JOB_QUEUE_ENABLED)
+-- pending -> running (lease) -> done | failed; los workers toman trabajos con
+-- SELECT ... FOR UPDATE SKIP LOCKED y los reintentos esperan next_attempt_at
+CREATE TABLE processing_jobs (
+    id               BIGSERIAL PRIMARY KEY,
+    file_path        TEXT NOT NULL,
+    file_name        VARCHAR(255) NOT NULL,
+    source           VARCHAR(20) NOT NULL DEFAULT 'watcher',
+    content_hash     VARCHAR(64),
+    state            VARCHAR(20) NOT NULL DEFAULT 'pending'
+                     CHECK (state IN ('pending', 'running', 'done', 'failed')),
+    attempts         INTEGER NOT NULL DEFAULT 0,
+    max_attempts     INTEGER NOT NULL DEFAULT 5,
+    lease_owner      VARCHAR(255),
+    lease_expires_at TIMESTAMP WITH TIME ZONE,
+    next_attempt_at  TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    result           VARCHAR(50),
+    last_error       TEXT,
+    created_at       TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at       TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    finished_at      TIMESTAMP WITH TIME ZONE
+);
+
 -----------------------------------------------------------------------
 -- 9) ÍNDICES
 -----------------------------------------------------------------------
@@ -292,6 +327,13 @@ CREATE INDEX idx_current_subscriptions_company ON current_subscriptions(company_
 CREATE INDEX idx_segmento_user ON segmento(created_by_user_id);
 CREATE INDEX idx_muestra_user ON muestra(created_by_user_id);
 CREATE INDEX idx_fuente_user ON fuente_datos_dispositivo(created_by_user_id);
+CREATE INDEX idx_processing_jobs_claim ON processing_jobs(state, next_attempt_at);
+CREATE INDEX idx_processing_jobs_lease ON processing_jobs(state, lease_expires_at);
+
+-- Un solo trabajo activo por archivo aunque varias instancias lo encolen
+CREATE UNIQUE INDEX uq_processing_jobs_active_path
+        ON processing_jobs(file_path)
+        WHERE state IN ('pending', 'running');
 
 CREATE UNIQUE INDEX uniq_active_subscription_user
         ON current_subscriptions(user_id)
@@ -13,6 +13,8 @@ from app.api.endpoints.recway_processing import router as recway_processing_rout
 from app.api.v1.export import router as data_export_router  # Router funcional de exportación
 from app.api.v1.optimization import router as optimized_export_router  # Router optimizado
 from app.services.monitoring.file_watcher import start_file_watcher, stop_file_watcher
+from app.services.processing.tile_warmup import tile_warmup
+from app.services.processing.process_pool import processing_pool
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -69,12 +71,23 @@ async def test_endpoint():
 async def startup_event():
     """Eventos que se ejecutan al iniciar la aplicación"""
     logger.info("Iniciando RecWay API...")
-    
-    # Iniciar file watcher para procesamiento automático
-    if start_file_watcher():
-        logger.info("✅ File Watcher iniciado correctamente")
+
+    def iniciar_watcher():
+        # Iniciar file watcher para procesamiento automático
+        if start_file_watcher():
+            logger.info("✅ File Watcher iniciado correctamente")
+        else:
+            logger.warning("⚠️ No se pudo iniciar el File Watcher")
+
+    # Precalentar los tiles de grafo más usados antes de que el watcher reparta trabajo.
+    # Con el pool de procesos cada worker precalienta su propia cache al arrancar
+    # (/graph-warmup/status reporta entonces processing_pool.warmup_status()).
+    if settings.PROCESSING_POOL_ENABLED:
+        processing_pool.start(on_ready=iniciar_watcher)
+    elif settings.GRAPH_WARMUP_ENABLED:
+        tile_warmup.start(on_complete=iniciar_watcher)
     else:
-        logger.warning("⚠️ No se pudo iniciar el File Watcher")
+        iniciar_watcher()
 
 @app.on_event("shutdown")
 async def shutdown_event():
@@ -85,6 +98,9 @@ async def shutdown_event():
     stop_file_watcher()
     logger.info("✅ File Watcher detenido")
 
+    # Detener los workers del pool de procesamiento
+    processing_pool.shutdown()
+
 # Debug endpoint to check database tables
 @app.get("/api/v1/debug/tables")
 def debug_tables(db: Session = Depends(get_db)):
@@ -6,10 +6,12 @@ from .recway import (
     Muestra, IndicesMuestra, HuecoMuestra,
     FuenteDatosDispositivo, RegistroSensores
 )
+from .jobs import ProcessingJob
 
 __all__ = [
     "User", "AuthToken", "Company",
     "Segmento", "Geometria", "IndicesSegmento", "HuecoSegmento",
     "Muestra", "IndicesMuestra", "HuecoMuestra", 
-    "FuenteDatosDispositivo", "RegistroSensores"
+    "FuenteDatosDispositivo", "RegistroSensores",
+    "ProcessingJob"
 ]
@@ -0,0 +1,39 @@
+"""
+Modelo SQLAlchemy de la cola de trabajos de procesamiento
+"""
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger, Text, Index, text
+from sqlalchemy.sql import func
+from app.database.session import Base
+
+JOB_ACTIVE_STATES = ("pending", "running")
+
+
+class ProcessingJob(Base):
+    """Trabajo de procesamiento de un CSV (pending → running → done | failed)"""
+    __tablename__ = "processing_jobs"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    file_path = Column(Text, nullable=False)
+    file_name = Column(String(255), nullable=False)
+    source = Column(String(20), nullable=False, default="watcher")  # upload | watcher
+    content_hash = Column(String(64))
+    state = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    lease_owner = Column(String(255))
+    lease_expires_at = Column(DateTime(timezone=True))
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    result = Column(String(50))
+    last_error = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        # Un solo trabajo activo por archivo aunque varias instancias lo encolen
+        Index("uq_processing_jobs_active_path", "file_path", unique=True,
+              postgresql_where=text("state IN ('pending', 'running')"),
+              sqlite_where=text("state IN ('pending', 'running')")),
+        Index("idx_processing_jobs_claim", "state", "next_attempt_at"),
+        Index("idx_processing_jobs_lease", "state", "lease_expires_at"),
+    )
@@ -93,6 +93,8 @@ class Muestra(Base):
     tipo_dispositivo = Column(String(30))           # platform del CSV
     identificador_dispositivo = Column(String(60))  # device_id del CSV
     fecha_muestra = Column(String(40))              # fecha del JSON
+    version_algoritmo = Column(String(20))          # versión del algoritmo que produjo la muestra
+    version_tiles = Column(String(100))             # versión de tiles usada en el matching
     id_segmento_seleccionado = Column(BigInteger, ForeignKey("segmento.id_segmento", ondelete="CASCADE"), nullable=False)
     created_by_user_id = Column(BigInteger, ForeignKey("users.id"))
 
@@ -162,6 +164,8 @@ class FuenteDatosDispositivo(Base):
     sampling_rate = Column(Float)
     recording_duration = Column(String(20))
     average_sample_rate = Column(Float)
+    version_algoritmo = Column(String(20))   # versión del algoritmo con que se procesó el viaje
+    version_tiles = Column(String(100))      # versión de tiles usada en el matching del viaje
     created_by_user_id = Column(BigInteger, ForeignKey("users.id"))
 
     # Relaciones
@@ -2,7 +2,7 @@
 Esquemas Pydantic para RecWay - Validación de datos
 """
 from typing import List, Optional, Dict, Any, Union
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, TypeAdapter, field_validator
 from datetime import datetime
 
 # =================== ESQUEMAS BASE ===================
@@ -88,6 +88,8 @@ class MuestraCreate(BaseModel):
     tipo_dispositivo: Optional[str] = None
     identificador_dispositivo: Optional[str] = None
     fecha_muestra: Optional[str] = None
+    version_algoritmo: Optional[str] = None
+    version_tiles: Optional[str] = None
     id_segmento_seleccionado: int
     created_by_user_id: int
 
@@ -178,6 +180,8 @@ class FuenteDatosDispositivoCreate(BaseModel):
     sampling_rate: Optional[float] = None
     recording_duration: Optional[str] = None
     average_sample_rate: Optional[float] = None
+    version_algoritmo: Optional[str] = None
+    version_tiles: Optional[str] = None
     created_by_user_id: int
 
 class FuenteDatosDispositivoResponse(FuenteDatosDispositivoCreate):
@@ -252,6 +256,10 @@ class SegmentoFromJSON(BaseModel):
         return v
 
 
+# Valida en un solo paso la lista de segmentos que entrega el algoritmo
+segmentos_from_json = TypeAdapter(List[SegmentoFromJSON])
+
+
 class ProcessingDataBundle(BaseModel):
     """Bundle completo de datos para procesamiento"""
     csv_metadata: CSVMetadata
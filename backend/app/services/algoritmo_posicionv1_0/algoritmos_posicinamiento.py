@@ -7,7 +7,14 @@ import osmnx as ox
 import networkx as nx
 import math
 from datetime import datetime
+from . import lector_csv as lc
 
+#grilla uniforme de tiles: origen (esquina superior izquierda), tamaño de celda y columnas
+LAT_ORIGEN_GRILLA = 12.461201
+LON_ORIGEN_GRILLA = -79.457520
+INTERVALO_LAT_GRILLA = 0.4102147
+INTERVALO_LON_GRILLA = 0.309800875
+COLUMNAS_GRILLA = 40
 
 def encontrar_area_latlon(lat1, lon1, lat2, lon2, L):
     """
@@ -293,7 +300,7 @@ def distancia_segmento(segmento_coords, longitud, latitud):
     return distancia
 
 
-def cargar_csv_con_metadatos(carpeta, nombre_csv):
+def cargar_csv_con_metadatos(carpeta, nombre_csv, columnas=None, invertir=False):
     """
     Carga un archivo CSV exportado por RecWay desde una carpeta y nombre de archivo dado.
     Extrae los metadatos desde las líneas iniciales (prefijadas con '#')
@@ -304,6 +311,11 @@ def cargar_csv_con_metadatos(carpeta, nombre_csv):
             Ruta a la carpeta que contiene el archivo CSV.
         nombre_csv : str
             Nombre del archivo CSV (con extensión .csv).
+        columnas : list[str] o None
+            Columnas a cargar (None = todas).
+        invertir : bool
+            Si es True las filas se devuelven en orden inverso al del archivo.
+            Con columnas o invertir el archivo se lee por bloques (bajo consumo de memoria).
 
     Retorna:
         df : pandas.DataFrame
@@ -316,49 +328,14 @@ def cargar_csv_con_metadatos(carpeta, nombre_csv):
     if not os.path.isfile(ruta_csv):
         raise FileNotFoundError(f"No se encontró el archivo: {ruta_csv}")
 
-    metadatos = {}
-    lineas_saltadas = 0
-
-    # Intentar múltiples codificaciones para mayor compatibilidad
-    encodings_to_try = ['utf-8', 'latin-1', 'windows-1252', 'iso-8859-1']
-    file_content = None
-    used_encoding = None
-    
-    for encoding in encodings_to_try:
-        try:
-            with open(ruta_csv, 'r', encoding=encoding) as f:
-                file_content = f.read()
-                used_encoding = encoding
-                break
-        except UnicodeDecodeError:
-            continue
-    
-    if file_content is None:
-        raise ValueError(f"No se pudo leer el archivo {ruta_csv} con ninguna codificación conocida")
-    
-    # Procesar línea por línea desde el contenido leído
-    lines = file_content.splitlines()
-    line_index = 0
-    
-    for linea in lines:
-        linea = linea.strip()
-
-        if linea.startswith("timestamp"):
-            break
-
-        if linea.startswith("#") and ":" in linea:
-            try:
-                clave, valor = linea.strip("# ").split(":", 1)
-                metadatos[clave.strip()] = valor.strip()
-            except ValueError:
-                pass
-
-        lineas_saltadas += 1
-
-    # Leer el CSV con la misma codificación encontrada
-    df = pd.read_csv(ruta_csv, skiprows=lineas_saltadas, encoding=used_encoding)
+    if columnas is None and not invertir:
+        #lectura única del archivo: metadatos y columnas numéricas en una pasada
+        registro = lc.leer_csv(ruta_csv)
+    else:
+        #lectura por bloques de las columnas pedidas, ya en el orden final
+        registro = lc.leer_csv_por_bloques(ruta_csv, columnas, invertir)
 
-    return df, metadatos
+    return registro.dataframe(), registro.metadatos
 
 def filtrar_muestras_por_velocidad(df, umbral_velocidad):
     """
@@ -381,7 +358,7 @@ def filtrar_muestras_por_velocidad(df, umbral_velocidad):
     return df_filtrado
 
 #esta función tambien invierte las muestras del GPS
-def eliminar_muestras_gps_duplicadas(df):
+def eliminar_muestras_gps_duplicadas(df, columnas=None):
     """
     Elimina las filas donde la latitud y longitud GPS no cambian respecto a la fila anterior.
     Además, agrega una columna 'index_original' que indica el índice original de cada muestra
@@ -390,6 +367,8 @@ def eliminar_muestras_gps_duplicadas(df):
     Parámetros:
         df : pandas.DataFrame
             DataFrame con columnas 'gps_lat' y 'gps_lng'.
+        columnas : list[str] o None
+            Columnas a conservar en el resultado (None = todas).
 
     Retorna:
         pandas.DataFrame con las muestras duplicadas eliminadas y columna 'index_original'.
@@ -397,10 +376,6 @@ def eliminar_muestras_gps_duplicadas(df):
     if not {'gps_lat', 'gps_lng'}.issubset(df.columns):
         raise ValueError("El DataFrame debe contener las columnas 'gps_lat' y 'gps_lng'.")
 
-    # Guardar el índice original
-    df = df.copy()
-    df['index_original'] = df.index
-
     # Detectar cambios en lat o lng
     cambio_lat = df['gps_lat'] != df['gps_lat'].shift()
     cambio_lng = df['gps_lng'] != df['gps_lng'].shift()
@@ -409,8 +384,12 @@ def eliminar_muestras_gps_duplicadas(df):
     # Asegurar conservar la primera fila
     cambio.iloc[0] = True
 
-    # Filtrar y devolver invertido
-    df_filtrado = df[cambio].copy()
+    # Filtrar (solo se copian las filas que se conservan) y guardar el índice original
+    if columnas is None:
+        df_filtrado = df[cambio].copy()
+    else:
+        df_filtrado = df.loc[cambio, list(columnas)].copy()
+    df_filtrado['index_original'] = df_filtrado.index
 
     return df_filtrado
 
@@ -472,23 +451,31 @@ def determinar_grafo(latitud, longitud):
     Devuelve:
     - Número de grafo asignado basado en la ubicación proporcionada.
     """
-    # Coordenadas de referencia para el primer grafo (esquina superior izquierda).
-    lat_original = 12.461201  # Latitud (Y)
-    lon_original = -79.457520  # Longitud (X)
-
-    # Tamaño de cada celda en términos de latitud y longitud.
-    intervalo_lon = 0.309800875
-    intervalo_lat = 0.4102147
-
     # Calcula la posición del grafo en términos de filas (latitud) y columnas (longitud).
-    posicion_grafo_y = int(abs(lat_original - latitud) / intervalo_lat)
-    posicion_grafo_x = int(abs(lon_original - longitud) / intervalo_lon)
+    posicion_grafo_y = int(abs(LAT_ORIGEN_GRILLA - latitud) / INTERVALO_LAT_GRILLA)
+    posicion_grafo_x = int(abs(LON_ORIGEN_GRILLA - longitud) / INTERVALO_LON_GRILLA)
 
     # Calcula el número de grafo basado en la posición.
-    numero_grafo = posicion_grafo_y * 40 + posicion_grafo_x
+    numero_grafo = posicion_grafo_y * COLUMNAS_GRILLA + posicion_grafo_x
 
     return numero_grafo
 
+def limites_celda_grafo(numero_grafo):
+    """
+    Calcula los límites de la celda de la grilla asociada a un número de grafo
+    (operación inversa de determinar_grafo).
+
+    Parámetros:
+    - numero_grafo: Número de grafo.
+
+    Devuelve:
+    - (lat_min, lat_max, lon_min, lon_max) de la celda.
+    """
+    fila, columna = divmod(int(numero_grafo), COLUMNAS_GRILLA)
+    lat_max = LAT_ORIGEN_GRILLA - fila * INTERVALO_LAT_GRILLA
+    lon_min = LON_ORIGEN_GRILLA + columna * INTERVALO_LON_GRILLA
+    return lat_max - INTERVALO_LAT_GRILLA, lat_max, lon_min, lon_min + INTERVALO_LON_GRILLA
+
 def buscar_archivos_por_prefijo(directorio, prefijo):
     """
     Busca archivos en un directorio con un prefijo específico.
@@ -681,18 +668,20 @@ def caminos_hasta_distanciav2(G, u, v, distancia_maxima, key_inicial=0):
     return dict(niveles_ordenados)
 
 
-def ajustar_heading_y_filtrar(df):
+def ajustar_heading_y_filtrar(df, en_sitio=False):
     """
     Ajusta la columna 'gps_heading' de [0, 360) a [-180, 180) y aplica un filtro promediador de orden 8.
 
     Args:
         df (pd.DataFrame): DataFrame con columna 'gps_heading'
+        en_sitio (bool): si es True agrega las columnas a df en lugar de a una copia
 
     Returns:
         pd.DataFrame: DataFrame con nueva columna 'gps_heading_filtrado'
     """
     # Conversión de 0-360 a -180 a 180
-    df = df.copy()
+    if not en_sitio:
+        df = df.copy()
     df['gps_heading_180'] = ((df['gps_heading'] + 180) % 360) - 180
 
     # Filtro promediador de orden 8
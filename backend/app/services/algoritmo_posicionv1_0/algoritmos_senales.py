@@ -1,6 +1,7 @@
+from functools import lru_cache
 import numpy as np
 import pandas as pd
-from scipy.signal import resample, resample_poly, cwt, find_peaks, filtfilt
+from scipy.signal import resample, resample_poly, find_peaks, filtfilt, convolve
 from scipy.ndimage import maximum_filter, generate_binary_structure
 import matplotlib.pyplot as plt
 
@@ -17,6 +18,60 @@ except Exception:
         return wave
 
 
+#cantidad de núcleos de wavelet que se conservan por proceso entre archivos
+MAX_NUCLEOS_WAVELET = 512
+
+
+@lru_cache(maxsize=MAX_NUCLEOS_WAVELET)
+def nucleo_morlet(largo, ancho, w):
+    """
+    Núcleo de convolución (morlet2 conjugada e invertida) para un ancho de la CWT.
+
+    Los anchos dependen solo de la frecuencia de muestreo y del índice de
+    escala, así que se repiten entre segmentos y entre archivos; el núcleo se
+    calcula una vez por proceso. El arreglo retornado es compartido y no se
+    debe modificar.
+
+    Parámetros:
+        largo : float
+            Cantidad de puntos del núcleo (min(10*ancho, largo de la señal)).
+        ancho : float
+            Ancho (escala) de la wavelet.
+        w : float
+            Frecuencia central de morlet2.
+
+    Retorna:
+        ndarray complejo con el núcleo.
+    """
+    nucleo = np.conj(morlet2(largo, ancho, w=w)[::-1])
+    nucleo.setflags(write=False)
+    return nucleo
+
+
+def cwt_morlet(vector, widths, w):
+    """
+    Transformada wavelet continua con morlet2, equivalente a
+    scipy.signal.cwt(vector, morlet2, widths, w=w) pero reutilizando los núcleos
+    ya calculados (nucleo_morlet).
+
+    Parámetros:
+        vector : ndarray (1D)
+            Señal a transformar.
+        widths : ndarray (1D)
+            Anchos de la wavelet.
+        w : float
+            Frecuencia central de morlet2.
+
+    Retorna:
+        ndarray complejo de forma (len(widths), len(vector)).
+    """
+    salida = np.empty((len(widths), len(vector)), dtype=np.complex128)
+    for indice, ancho in enumerate(widths):
+        largo = np.min([10 * ancho, len(vector)])
+        salida[indice] = convolve(vector, nucleo_morlet(float(largo), float(ancho), w), mode='same')
+    return salida
+
+
 def reflejar_indices_por_umbral(arreglo, fs, m):
     """
     Encuentra para cada columna (1:m/2) el índice donde el arreglo decreciente
@@ -247,7 +302,7 @@ def encontar_huecos_segmento(vector,fs,frecuencia_menor,frecuencia_mayor,umbral_
     caida_energia = np.exp((exponente/2)*arreglo_recorrido)
     
     #se calcula la wavelet
-    cwt_result = cwt(vector, morlet2, widths, w=w)
+    cwt_result = cwt_morlet(vector, widths, w)
     
     #se aplica la caida de energía para conservar la energía de la señal
     new_cwt = np.abs(cwt_result)*caida_energia[:,np.newaxis]
@@ -0,0 +1,289 @@
+"""
+Archivos de resultado del procesamiento (lista de segmentos).
+
+Formato legado ("json"): lista de segmentos en JSON con indent=2, la geometría
+como lista de {"orden", "longitud", "latitud"}. Se escribe en
+output/datos1.json (nombre fijo, lo pisan los trabajos concurrentes) y en
+storage/datos<nombre_csv>save.json.
+
+Formato compacto ("ndjson"): una línea JSON por registro, sin indentación.
+
+    {"formato": "recway-resultado", "version": 1, "archivo": ..., "segmentos": n,
+     "coordenadas": "f8le-lonlat-base64", "version_algoritmo": "1.0.0",
+     "version_tiles": "2024-06-01"}                           <- encabezado
+    {"numero": 0, ..., "geometria_empaquetada": "<base64>"}   <- un segmento por línea
+
+La geometría de cada segmento va empaquetada como float64 little-endian
+intercalados (lon0, lat0, lon1, lat1, ...) en base64: conserva los valores
+exactos y ocupa una fracción del texto. El archivo se puede comprimir con gzip
+o zstd (este último solo si el paquete `zstandard` está instalado):
+
+    output/datos<nombre_csv>-<trabajo>.ndjson[.gz|.zst]   <- único por trabajo
+    storage/datos<nombre_csv>save.ndjson[.gz|.zst]        <- histórico por archivo
+
+Ambos formatos se escriben en un temporal de la misma carpeta y se publican con
+os.replace, así que un lector nunca ve un archivo a medio escribir.
+`leer_resultado` lee los dos formatos y devuelve siempre la lista de segmentos
+del formato legado; `leer_versiones` retorna las versiones de algoritmo y tiles
+con que se produjo (el formato legado es solo la lista y no las guarda).
+
+Variables de entorno:
+    PROCESAMIENTO_FORMATO_RESULTADO     "json" (legado) o "ndjson"
+    PROCESAMIENTO_COMPRESION_RESULTADO  "gzip", "zstd" o "ninguna" (solo ndjson)
+"""
+import base64
+import gzip
+import json
+import os
+import secrets
+import time
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # dependencia opcional
+    zstandard = None
+
+FORMATO = os.getenv("PROCESAMIENTO_FORMATO_RESULTADO", "json").lower()
+COMPRESION = os.getenv("PROCESAMIENTO_COMPRESION_RESULTADO", "gzip").lower()
+
+FORMATOS = ("json", "ndjson")
+COMPRESIONES = {"ninguna": "", "gzip": ".gz", "zstd": ".zst"}
+
+NOMBRE_FORMATO = "recway-resultado"
+VERSION_FORMATO = 1
+CODIFICACION_COORDENADAS = "f8le-lonlat-base64"
+
+#extensiones que puede tener un archivo de resultado (para listar o limpiar carpetas)
+EXTENSIONES = (".json", ".ndjson", ".ndjson.gz", ".ndjson.zst")
+
+_MAGIA_GZIP = b"\x1f\x8b"
+_MAGIA_ZSTD = b"\x28\xb5\x2f\xfd"
+
+
+def configurar(formato, compresion="gzip"):
+    """Cambia el formato y la compresión de los resultados del proceso."""
+    global FORMATO, COMPRESION
+    formato = (formato or "json").lower()
+    compresion = (compresion or "ninguna").lower()
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de resultado desconocido: {formato} (opciones: {FORMATOS})")
+    if compresion not in COMPRESIONES:
+        raise ValueError(f"Compresión desconocida: {compresion} (opciones: {tuple(COMPRESIONES)})")
+    if compresion == "zstd" and zstandard is None:
+        raise ValueError("La compresión zstd necesita el paquete 'zstandard' (pip install zstandard)")
+    FORMATO, COMPRESION = formato, compresion
+
+
+def extension(formato=None, compresion=None):
+    formato = formato or FORMATO
+    if formato == "json":
+        return ".json"
+    return ".ndjson" + COMPRESIONES[compresion or COMPRESION]
+
+
+def _base(dato):
+    return dato[:-4] if dato.lower().endswith(".csv") else dato
+
+
+def id_trabajo():
+    """Identificador único de un trabajo (fecha, pid y sufijo aleatorio)."""
+    return time.strftime("%Y%m%dT%H%M%S") + "-" + str(os.getpid()) + "-" + secrets.token_hex(3)
+
+
+def ruta_historico(carpeta, dato, formato=None, compresion=None):
+    return os.path.join(carpeta or ".", "datos" + _base(dato) + "save" + extension(formato, compresion))
+
+
+def buscar_historico(carpeta, dato):
+    """
+    Ruta del resultado histórico de un CSV en cualquiera de los formatos
+    (el más reciente si hay varios) o None si no existe.
+    """
+    candidatos = [os.path.join(carpeta or ".", "datos" + _base(dato) + "save" + ext) for ext in EXTENSIONES]
+    existentes = [ruta for ruta in candidatos if os.path.isfile(ruta)]
+    if not existentes:
+        return None
+    return max(existentes, key=os.path.getmtime)
+
+
+def es_archivo_resultado(nombre):
+    return nombre.startswith("datos") and nombre.endswith(EXTENSIONES)
+
+
+def _empaquetar_geometria(geometria):
+    coordenadas = np.empty(2 * len(geometria), dtype="<f8")
+    coordenadas[0::2] = [punto["longitud"] for punto in geometria]
+    coordenadas[1::2] = [punto["latitud"] for punto in geometria]
+    return base64.b64encode(coordenadas.tobytes()).decode("ascii")
+
+
+def _desempaquetar_geometria(texto):
+    coordenadas = np.frombuffer(base64.b64decode(texto), dtype="<f8").tolist()
+    return [{"orden": j, "longitud": coordenadas[2 * j], "latitud": coordenadas[2 * j + 1]}
+            for j in range(len(coordenadas) // 2)]
+
+
+def serializar(resultado_json, dato, formato=None, compresion=None, versiones=None):
+    """
+    Contenido del archivo de resultado en bytes.
+
+    Parámetros:
+        resultado_json : list
+            Segmentos en el formato legado (construir_resultado_json).
+        dato : str
+            Nombre del CSV de origen (va en el encabezado del ndjson).
+        formato, compresion : str
+            Por defecto los configurados en el módulo.
+        versiones : dict
+            "version_algoritmo" y "version_tiles" del procesamiento (van en el
+            encabezado del ndjson).
+
+    Retorna:
+        bytes
+    """
+    formato = formato or FORMATO
+    compresion = compresion or COMPRESION
+    if formato == "json":
+        return json.dumps(resultado_json, indent=2).encode("utf-8")
+
+    encabezado = {
+        "formato": NOMBRE_FORMATO,
+        "version": VERSION_FORMATO,
+        "archivo": dato,
+        "segmentos": len(resultado_json),
+        "coordenadas": CODIFICACION_COORDENADAS,
+        "version_algoritmo": (versiones or {}).get("version_algoritmo"),
+        "version_tiles": (versiones or {}).get("version_tiles"),
+    }
+    lineas = [json.dumps(encabezado, separators=(",", ":"))]
+    for segmento in resultado_json:
+        compacto = {clave: valor for clave, valor in segmento.items() if clave != "geometria"}
+        compacto["geometria_empaquetada"] = _empaquetar_geometria(segmento["geometria"])
+        lineas.append(json.dumps(compacto, separators=(",", ":")))
+    contenido = ("\n".join(lineas) + "\n").encode("utf-8")
+
+    if compresion == "gzip":
+        #mtime fijo: el mismo resultado produce los mismos bytes
+        return gzip.compress(contenido, compresslevel=6, mtime=0)
+    if compresion == "zstd":
+        if zstandard is None:
+            raise ValueError("La compresión zstd necesita el paquete 'zstandard' (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=6).compress(contenido)
+    return contenido
+
+
+def escribir_atomico(ruta, contenido):
+    """Escribe en un temporal de la misma carpeta y lo publica con os.replace."""
+    carpeta = os.path.dirname(ruta) or "."
+    os.makedirs(carpeta, exist_ok=True)
+    temporal = os.path.join(carpeta, "." + os.path.basename(ruta) + "." + str(os.getpid()) + "."
+                            + secrets.token_hex(3) + ".tmp")
+    try:
+        with open(temporal, "wb") as archivo:
+            archivo.write(contenido)
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+def escribir_resultado(resultado_json, dato, carpeta_salida, carpeta_historico, contador_json=1,
+                       formato=None, compresion=None, versiones=None):
+    """
+    Guarda el resultado rápido (salida) y el histórico del archivo.
+
+    En formato legado el rápido se llama datos<contador_json>.json; en ndjson
+    lleva el nombre del CSV y un id de trabajo, así que trabajos concurrentes
+    no se pisan. El contenido se serializa una sola vez para los dos archivos.
+
+    Retorna:
+        tuple (ruta_salida, ruta_historico)
+    """
+    formato = formato or FORMATO
+    compresion = compresion or COMPRESION
+    contenido = serializar(resultado_json, dato, formato, compresion, versiones)
+    if formato == "json":
+        nombre_salida = "datos" + str(contador_json) + ".json"
+    else:
+        nombre_salida = "datos" + _base(dato) + "-" + id_trabajo() + extension(formato, compresion)
+    ruta_salida = os.path.join(carpeta_salida or ".", nombre_salida)
+    ruta_hist = ruta_historico(carpeta_historico, dato, formato, compresion)
+    escribir_atomico(ruta_salida, contenido)
+    escribir_atomico(ruta_hist, contenido)
+    return ruta_salida, ruta_hist
+
+
+def _descomprimir(contenido):
+    if contenido[:2] == _MAGIA_GZIP:
+        return gzip.decompress(contenido)
+    if contenido[:4] == _MAGIA_ZSTD:
+        if zstandard is None:
+            raise ValueError("El resultado está comprimido con zstd y falta el paquete 'zstandard'")
+        return zstandard.ZstdDecompressor().decompress(contenido)
+    return contenido
+
+
+def _leer_texto(ruta):
+    with open(ruta, "rb") as archivo:
+        return _descomprimir(archivo.read()).decode("utf-8")
+
+
+def leer_versiones(ruta):
+    """
+    Versiones con que se produjo un archivo de resultado.
+
+    Retorna:
+        dict con "version_algoritmo" y "version_tiles" (None en el formato
+        legado o en archivos escritos antes de guardarlas).
+    """
+    texto = _leer_texto(ruta)
+    versiones = {"version_algoritmo": None, "version_tiles": None}
+    if texto.lstrip().startswith("["):
+        return versiones
+    encabezado = json.loads(texto.split("\n", 1)[0])
+    for clave in versiones:
+        versiones[clave] = encabezado.get(clave)
+    return versiones
+
+
+def leer_resultado(ruta):
+    """
+    Lee un archivo de resultado en cualquiera de los formatos.
+
+    Retorna:
+        list de segmentos en el formato legado (geometría como lista de
+        {"orden", "longitud", "latitud"}).
+    """
+    texto = _leer_texto(ruta)
+    if texto.lstrip().startswith("["):
+        return json.loads(texto)
+
+    lineas = texto.splitlines()
+    encabezado = json.loads(lineas[0])
+    if encabezado.get("formato") != NOMBRE_FORMATO:
+        raise ValueError(f"{ruta} no es un archivo de resultado ({encabezado.get('formato')})")
+    if encabezado.get("version", 0) > VERSION_FORMATO:
+        raise ValueError(f"{ruta} usa la versión {encabezado['version']} del formato, "
+                         f"se soporta hasta la {VERSION_FORMATO}")
+    segmentos = []
+    for linea in lineas[1:]:
+        if not linea.strip():
+            continue
+        segmento = json.loads(linea)
+        geometria = _desempaquetar_geometria(segmento.pop("geometria_empaquetada"))
+        #misma posición de la geometría que en el formato legado
+        ordenado = {}
+        for clave, valor in segmento.items():
+            ordenado[clave] = valor
+            if clave == "longitud_destino":
+                ordenado["geometria"] = geometria
+        ordenado.setdefault("geometria", geometria)
+        segmentos.append(ordenado)
+    if len(segmentos) != encabezado.get("segmentos", len(segmentos)):
+        raise ValueError(f"{ruta} está incompleto: {len(segmentos)} de {encabezado['segmentos']} segmentos")
+    return segmentos
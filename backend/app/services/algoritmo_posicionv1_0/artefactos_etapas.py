@@ -0,0 +1,207 @@
+"""
+Artefactos intermedios por etapa para reprocesar solo lo que cambió.
+
+Cada etapa del procesamiento guarda su salida en disco con una clave que combina
+el hash del CSV, la versión de la etapa (VERSIONES_ETAPAS en main_procesamiento)
+y las claves de las etapas de las que depende:
+
+    senales          señales remuestreadas a 25 Hz sin media
+    huecos           detecciones por ventana de 6 s            <- senales
+    emparejamiento   cambios de segmento del matching          (+ versión de tiles)
+    espectros        PSD y energías por segmento, huecos       <- senales, huecos, emparejamiento
+
+Los índices (az, ax, wx, IRI, IQR) no se guardan: se calculan siempre a partir
+de los espectros, así que cambiar sus fórmulas no obliga a repetir el
+remuestreo, la wavelet ni el matching. Al cambiar el código de una etapa se
+sube su versión y se recalculan esa etapa y las que dependen de ella.
+
+    ARTEFACTOS_DIR/<hash csv>/<etapa>-<clave>.pkl
+
+La carpeta tiene un tope de tamaño: al guardar, si lo supera se borran las
+carpetas de CSV usadas hace más tiempo (la fecha de la carpeta se actualiza
+cada vez que se procesa ese CSV).
+
+Variables de entorno:
+    PROCESAMIENTO_ARTEFACTOS_DIR      carpeta de artefactos (vacío = deshabilitado)
+    PROCESAMIENTO_ARTEFACTOS_MAX_MB   tamaño máximo de la carpeta en MB (0 = sin límite)
+"""
+import hashlib
+import os
+import pickle
+import shutil
+
+ARTEFACTOS_DIR = os.getenv("PROCESAMIENTO_ARTEFACTOS_DIR", "")
+ARTEFACTOS_MAX_MB = float(os.getenv("PROCESAMIENTO_ARTEFACTOS_MAX_MB", "1024"))
+
+#etapas de las que depende cada etapa
+DEPENDENCIAS = {
+    "senales": (),
+    "huecos": ("senales",),
+    "emparejamiento": (),
+    "espectros": ("senales", "huecos", "emparejamiento"),
+}
+
+
+def configurar(carpeta, max_mb=None):
+    """Cambia la carpeta de artefactos del proceso (vacío o None deshabilita) y su tamaño máximo."""
+    global ARTEFACTOS_DIR, ARTEFACTOS_MAX_MB
+    ARTEFACTOS_DIR = carpeta or ""
+    if max_mb is not None:
+        ARTEFACTOS_MAX_MB = max_mb
+
+
+def hash_archivo(ruta):
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def _tamano_carpeta(carpeta):
+    total = 0
+    for nombre in os.listdir(carpeta):
+        try:
+            total += os.path.getsize(os.path.join(carpeta, nombre))
+        except OSError:
+            pass
+    return total
+
+
+def recortar(raiz, limite_bytes, conservar=None):
+    """
+    Borra las carpetas de CSV usadas hace más tiempo hasta que la raíz quede bajo el límite.
+
+    Parámetros:
+        raiz : str
+            Carpeta de artefactos.
+        limite_bytes : int
+            Tamaño máximo (0 o menos = sin límite).
+        conservar : str
+            Carpeta que no se borra (la del CSV que se está procesando).
+
+    Retorna:
+        int con la cantidad de carpetas borradas.
+    """
+    if limite_bytes <= 0 or not os.path.isdir(raiz):
+        return 0
+    carpetas = []
+    for nombre in os.listdir(raiz):
+        ruta = os.path.join(raiz, nombre)
+        try:
+            if os.path.isdir(ruta):
+                carpetas.append((os.path.getmtime(ruta), _tamano_carpeta(ruta), ruta))
+        except OSError:
+            pass
+    total = sum(tamano for _, tamano, _ in carpetas)
+    borradas = 0
+    #las menos usadas primero
+    for _, tamano, ruta in sorted(carpetas):
+        if total <= limite_bytes:
+            break
+        if conservar is not None and os.path.abspath(ruta) == os.path.abspath(conservar):
+            continue
+        shutil.rmtree(ruta, ignore_errors=True)
+        total -= tamano
+        borradas += 1
+    return borradas
+
+
+class ArtefactosArchivo:
+    """
+    Artefactos de un CSV. Si la carpeta no está configurada no guarda ni
+    carga nada y todas las etapas se calculan.
+    """
+
+    def __init__(self, ruta_csv, versiones, version_tiles, carpeta=None, hash_csv=None):
+        carpeta = ARTEFACTOS_DIR if carpeta is None else carpeta
+        self.habilitado = bool(carpeta)
+        self.reutilizadas = []
+        self.calculadas = []
+        self.raiz = carpeta
+        self.carpeta = None
+        self._claves = {}
+        if not self.habilitado:
+            return
+        #el hash ya calculado por quien llama (p. ej. la cache de resultados) evita leer el CSV otra vez
+        self.carpeta = os.path.join(carpeta, hash_csv or hash_archivo(ruta_csv))
+        if os.path.isdir(self.carpeta):
+            #marca la carpeta como usada recién para el recorte por antigüedad
+            try:
+                os.utime(self.carpeta)
+            except OSError:
+                pass
+        for etapa in DEPENDENCIAS:
+            self._claves[etapa] = self._clave(etapa, versiones, version_tiles)
+
+    def _clave(self, etapa, versiones, version_tiles):
+        partes = [f"{etapa}:{versiones[etapa]}"]
+        if etapa == "emparejamiento":
+            partes.append(f"tiles:{version_tiles}")
+        for dependencia in DEPENDENCIAS[etapa]:
+            partes.append(self._claves.get(dependencia) or self._clave(dependencia, versiones, version_tiles))
+        return hashlib.sha1("|".join(partes).encode("utf-8")).hexdigest()[:16]
+
+    def _ruta(self, etapa):
+        return os.path.join(self.carpeta, f"{etapa}-{self._claves[etapa]}.pkl")
+
+    def cargar(self, etapa):
+        """Salida guardada de la etapa o None si no existe para la versión actual."""
+        if not self.habilitado:
+            return None
+        try:
+            with open(self._ruta(etapa), "rb") as f:
+                valor = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"artefacto {etapa} ilegible, se recalcula: {e}")
+            return None
+        self.reutilizadas.append(etapa)
+        return valor
+
+    def guardar(self, etapa, valor):
+        """Guarda la salida de la etapa (escritura atómica; los errores solo se informan)."""
+        self.calculadas.append(etapa)
+        if not self.habilitado:
+            return
+        ruta = self._ruta(etapa)
+        try:
+            os.makedirs(self.carpeta, exist_ok=True)
+            temporal = f"{ruta}.{os.getpid()}.tmp"
+            with open(temporal, "wb") as f:
+                pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, ruta)
+        except Exception as e:
+            print(f"no se pudo guardar el artefacto {etapa}: {e}")
+            return
+        #las versiones anteriores de la etapa ya no se van a usar
+        prefijo = f"{etapa}-"
+        for nombre in os.listdir(self.carpeta):
+            if nombre.startswith(prefijo) and nombre.endswith(".pkl") and os.path.join(self.carpeta, nombre) != ruta:
+                try:
+                    os.remove(os.path.join(self.carpeta, nombre))
+                except OSError:
+                    pass
+
+    def obtener(self, etapa, calcular):
+        """Carga la etapa o la calcula con `calcular()` y la guarda."""
+        valor = self.cargar(etapa)
+        if valor is None:
+            valor = calcular()
+            self.guardar(etapa, valor)
+        return valor
+
+    def recortar(self):
+        """Aplica ARTEFACTOS_MAX_MB a la carpeta de artefactos si esta vez se guardó algo."""
+        if not self.habilitado or not self.calculadas:
+            return 0
+        try:
+            return recortar(self.raiz, int(ARTEFACTOS_MAX_MB * 1024 * 1024), conservar=self.carpeta)
+        except Exception as e:
+            print(f"no se pudo recortar la carpeta de artefactos: {e}")
+            return 0
+
+    def resumen(self):
+        return {"habilitado": self.habilitado, "reutilizadas": list(self.reutilizadas),
+                "calculadas": list(self.calculadas)}
@@ -0,0 +1,165 @@
+"""
+Cache de grafos (tiles) compartida por proceso.
+
+Cada archivo procesado crea su propia estructura DatosProcesamiento, pero los
+tiles de grafo (grafo osmnx, BallTree y mids/ids) son los mismos entre viajes
+de la misma zona. Esta cache los conserva en memoria entre archivos con
+desalojo LRU limitado por un presupuesto de memoria.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+#presupuesto por defecto (MB) si no se configura desde la aplicación
+LIMITE_MB_DEFECTO = float(os.getenv("GRAPH_CACHE_MAX_MB", "1024"))
+
+#factor aproximado entre el tamaño en disco de un tile y su tamaño en memoria
+FACTOR_MEMORIA_DISCO = float(os.getenv("GRAPH_CACHE_MEMORY_FACTOR", "3.0"))
+
+
+class TileGrafo:
+    """Contenido de un tile cargado: grafo, índice espacial y tablas de mids/ids."""
+
+    def __init__(self, numero, G, tree, mids, ids, tamano_bytes):
+        self.numero = numero
+        self.G = G
+        self.tree = tree
+        self.mids = mids
+        self.ids = ids
+        self.tamano_bytes = tamano_bytes
+
+
+def estimar_tamano_tile(rutas):
+    """
+    Estima la memoria que ocupa un tile a partir del tamaño en disco de sus archivos.
+
+    Parámetros:
+        rutas : list[str]
+            Archivos que componen el tile.
+
+    Retorna:
+        int con el tamaño estimado en bytes.
+    """
+    total = 0
+    for ruta in rutas:
+        try:
+            total += os.path.getsize(ruta)
+        except OSError:
+            pass
+    return int(total * FACTOR_MEMORIA_DISCO)
+
+
+class CacheGrafos:
+    """
+    Cache LRU de tiles de grafo con presupuesto de memoria y métricas.
+
+    Es segura entre hilos: si varios hilos piden el mismo tile a la vez solo uno
+    lo carga y el resto espera a que termine.
+    """
+
+    def __init__(self, limite_bytes):
+        self.limite_bytes = int(limite_bytes)
+        self._tiles = OrderedDict()
+        self._cargando = {}
+        self._lock = threading.Lock()
+        self.bytes_usados = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def configurar(self, limite_bytes):
+        """Cambia el presupuesto de memoria y desaloja lo que sobre."""
+        with self._lock:
+            self.limite_bytes = int(limite_bytes)
+            self._desalojar(0)
+
+    def obtener(self, clave, cargador):
+        """
+        Retorna el tile asociado a la clave, cargándolo con `cargador` si no está.
+
+        Parámetros:
+            clave : hashable
+                Identificador del tile (carpeta de grafos, número de grafo).
+            cargador : callable
+                Función sin argumentos que retorna un TileGrafo.
+
+        Retorna:
+            (tile, acierto) : tuple[TileGrafo, bool]
+        """
+        while True:
+            with self._lock:
+                tile = self._tiles.get(clave)
+                if tile is not None:
+                    self._tiles.move_to_end(clave)
+                    self.aciertos += 1
+                    return tile, True
+                evento = self._cargando.get(clave)
+                if evento is None:
+                    evento = threading.Event()
+                    self._cargando[clave] = evento
+                    self.fallos += 1
+                    break
+            #otro hilo está cargando el mismo tile, se espera y se reintenta
+            evento.wait()
+
+        try:
+            tile = cargador()
+            with self._lock:
+                self._desalojar(tile.tamano_bytes)
+                self._tiles[clave] = tile
+                self.bytes_usados += tile.tamano_bytes
+            return tile, False
+        finally:
+            with self._lock:
+                self._cargando.pop(clave, None)
+            evento.set()
+
+    def contiene(self, clave):
+        with self._lock:
+            return clave in self._tiles
+
+    def _desalojar(self, bytes_nuevos):
+        #se desalojan los tiles menos usados hasta que quepa el nuevo (siempre se conserva uno)
+        while self._tiles and self.bytes_usados + bytes_nuevos > self.limite_bytes:
+            _, tile = self._tiles.popitem(last=False)
+            self.bytes_usados -= tile.tamano_bytes
+            self.desalojos += 1
+
+    def desalojar_carpeta(self, carpeta_grafos):
+        """
+        Desaloja los tiles cargados desde una carpeta de grafos (p. ej. una
+        versión de tiles retirada) y retorna cuántos se liberaron.
+        """
+        carpeta = os.path.abspath(carpeta_grafos)
+        with self._lock:
+            claves = [clave for clave in self._tiles
+                      if isinstance(clave, tuple) and os.path.abspath(clave[0]) == carpeta]
+            for clave in claves:
+                tile = self._tiles.pop(clave)
+                self.bytes_usados -= tile.tamano_bytes
+                self.desalojos += 1
+        return len(claves)
+
+    def limpiar(self):
+        with self._lock:
+            self._tiles.clear()
+            self.bytes_usados = 0
+
+    def metricas(self):
+        """Retorna las métricas de aciertos, fallos, desalojos y memoria de la cache."""
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "tiles": len(self._tiles),
+                "claves": [str(clave[-1]) if isinstance(clave, tuple) else str(clave) for clave in self._tiles],
+                "bytes_usados": self.bytes_usados,
+                "limite_bytes": self.limite_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "desalojos": self.desalojos,
+                "tasa_aciertos": (self.aciertos / consultas) if consultas else 0.0,
+            }
+
+
+#cache global del proceso (cada worker tiene la suya)
+cache_global = CacheGrafos(LIMITE_MB_DEFECTO * 1024 * 1024)
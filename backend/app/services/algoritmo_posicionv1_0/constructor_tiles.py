@@ -0,0 +1,582 @@
+"""
+Constructor offline de tiles de grafo a partir de fuentes GraphML.
+
+Lee los grafos osmnx de la carpeta de fuentes (`settings.GRAPHML_DIR`, archivos
+`.graphml` o grafos osmnx en `.pkl`), los corta en las celdas de la grilla de
+tiles con un halo alrededor y genera por tile los mismos artefactos que consume
+el matching:
+
+    segN<n>pos<latI>&<latD>&<lonI>&<lonD>.pkl   grafo osmnx recortado
+    balltree_model_N<n>.pkl                      BallTree haversine de los puntos medios
+    mids_ids_N<n>.csv                            puntos medios (rad) y aristas (u, v, k)
+    columnar/N<n>/                               tile columnar con extras precalculados
+
+Extras del tile columnar (alineados con el orden de aristas/nodos del formato):
+
+    rumbo_entrada / rumbo_salida           rumbo (grados) del primer y último tramo de cada arista
+    nodos_x_m / nodos_y_m / origen_metrico coordenadas métricas locales de los nodos
+    vecinas_inicio / vecinas_orden         CSR de aristas conectadas (edges_conectados)
+    subsegmentos_inicio / subsegmentos     CSR de puntos de corte de subsegmentos (lon, lat)
+
+Las celdas densas se parten en cuadrantes (quadtree) hasta que cada tile queda
+bajo el presupuesto de aristas o de bytes; los tiles hijos se identifican con el
+número de la celda base, 'q' y un dígito de cuadrante por nivel (p. ej. N695q03)
+y conservan el halo, de modo que el matching cerca de un borde sigue viendo las
+aristas vecinas. El manifiesto resuelve cada punto al tile más pequeño que lo
+contiene.
+
+La construcción es incremental: `build_state.json` guarda el hash de cada fuente
+y la firma de cada tile (hashes de las fuentes que lo tocan y parámetros), y
+solo se reconstruyen los tiles cuya firma cambió. Al final se regenera el
+manifiesto de la carpeta de salida.
+
+Uso:
+    python -m app.services.algoritmo_posicionv1_0.constructor_tiles --carpeta_graphml grafos_archivos5 --carpeta_salida grafos_archivos6
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import pickle
+import re
+import shutil
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import networkx as nx
+import numpy as np
+import osmnx as ox
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+from . import algoritmos_posicinamiento as ap
+from . import formato_columnar as fc
+from . import manifiesto_tiles as mt
+
+VERSION_CONSTRUCTOR = 1
+NOMBRE_ESTADO = "build_state.json"
+EARTH_R = 6371000.0
+
+#halo (m) que se agrega alrededor de cada celda para no cortar aristas en el borde
+HALO_DEFECTO_M = 2000.0
+
+#presupuesto por tile antes de partirlo en cuadrantes (0 = sin límite)
+MAX_ARISTAS_DEFECTO = 150000
+MAX_MB_DEFECTO = 0.0
+MAX_PROFUNDIDAD_DEFECTO = 4
+
+#mismo largo máximo de segmento que usa el matching (DatosProcesamiento.segmento_maximo)
+SEGMENTO_MAXIMO = 100
+
+EXTENSIONES_FUENTE = (".graphml", ".pkl")
+
+
+###############################################################
+#-----------------        FUENTES        ---------------------#
+
+def hash_archivo(ruta, bloque=1024 * 1024):
+    """sha256 del contenido de un archivo."""
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for parte in iter(lambda: f.read(bloque), b""):
+            h.update(parte)
+    return h.hexdigest()
+
+
+def cargar_fuente(ruta):
+    """Carga un grafo osmnx desde GraphML o pickle."""
+    if ruta.endswith(".graphml"):
+        return ox.load_graphml(ruta)
+    with open(ruta, "rb") as f:
+        return pickle.load(f)
+
+
+def extension_grafo(G):
+    """(lat_min, lat_max, lon_min, lon_max) de los nodos del grafo."""
+    ys = [d["y"] for _, d in G.nodes(data=True)]
+    xs = [d["x"] for _, d in G.nodes(data=True)]
+    return [min(ys), max(ys), min(xs), max(xs)]
+
+
+def _describir_fuente(ruta):
+    #se ejecuta en el pool: hash y extensión de una fuente nueva o modificada
+    G = cargar_fuente(ruta)
+    return {"sha256": hash_archivo(ruta), "extension": extension_grafo(G)}
+
+
+def actualizar_fuentes(carpeta_graphml, estado, pool):
+    """
+    Actualiza en el estado la descripción (hash y extensión) de cada fuente.
+    Solo se vuelven a leer las fuentes cuyo tamaño o fecha de modificación cambió.
+
+    Retorna:
+        dict {nombre_fuente: descripción} con las fuentes presentes.
+    """
+    anteriores = estado.get("fuentes", {})
+    fuentes = {}
+    pendientes = {}
+    for nombre in sorted(os.listdir(carpeta_graphml)):
+        if not nombre.endswith(EXTENSIONES_FUENTE):
+            continue
+        ruta = os.path.join(carpeta_graphml, nombre)
+        info = os.stat(ruta)
+        anterior = anteriores.get(nombre)
+        if anterior and anterior.get("tamano") == info.st_size and anterior.get("mtime") == info.st_mtime:
+            fuentes[nombre] = anterior
+        else:
+            pendientes[nombre] = (pool.submit(_describir_fuente, ruta), info)
+
+    for nombre, (fut, info) in pendientes.items():
+        descripcion = fut.result()
+        descripcion.update({"tamano": info.st_size, "mtime": info.st_mtime})
+        fuentes[nombre] = descripcion
+        print(f"   📄 fuente {nombre}: {descripcion['sha256'][:12]}")
+    return fuentes
+
+
+###############################################################
+#-----------------        GRILLA         ---------------------#
+
+def limites_con_halo(limites, halo_m):
+    """Expande (lat_min, lat_max, lon_min, lon_max) en halo_m metros."""
+    lat_min, lat_max, lon_min, lon_max = limites
+    dlat = math.degrees(halo_m / EARTH_R)
+    dlon = math.degrees(halo_m / (EARTH_R * max(math.cos(math.radians((lat_min + lat_max) / 2)), 1e-6)))
+    return [lat_min - dlat, lat_max + dlat, lon_min - dlon, lon_max + dlon]
+
+
+def intersectan(a, b):
+    return a[0] <= b[1] and b[0] <= a[1] and a[2] <= b[3] and b[2] <= a[3]
+
+
+def celdas_en_extension(extension):
+    """Números de grafo de la grilla uniforme cuyas celdas tocan la extensión."""
+    lat_min, lat_max, lon_min, lon_max = extension
+    fila_ini = int(abs(ap.LAT_ORIGEN_GRILLA - lat_max) / ap.INTERVALO_LAT_GRILLA)
+    fila_fin = int(abs(ap.LAT_ORIGEN_GRILLA - lat_min) / ap.INTERVALO_LAT_GRILLA)
+    col_ini = int(abs(ap.LON_ORIGEN_GRILLA - lon_min) / ap.INTERVALO_LON_GRILLA)
+    col_fin = int(abs(ap.LON_ORIGEN_GRILLA - lon_max) / ap.INTERVALO_LON_GRILLA)
+    return [
+        fila * ap.COLUMNAS_GRILLA + col
+        for fila in range(min(fila_ini, fila_fin), max(fila_ini, fila_fin) + 1)
+        for col in range(min(col_ini, col_fin), max(col_ini, col_fin) + 1)
+    ]
+
+
+###############################################################
+#-----------------   ARTEFACTOS DEL TILE  --------------------#
+
+def recortar_grafo(G, limites):
+    """
+    Recorta el grafo a los límites dados conservando las aristas con al menos un
+    extremo dentro (equivalente a truncate_by_edge de osmnx).
+    """
+    lat_min, lat_max, lon_min, lon_max = limites
+    dentro = {
+        n for n, d in G.nodes(data=True)
+        if lat_min <= d["y"] <= lat_max and lon_min <= d["x"] <= lon_max
+    }
+    aristas = [(u, v, k) for u, v, k in G.edges(keys=True) if u in dentro or v in dentro]
+    H = G.edge_subgraph(aristas).copy()
+    H.graph = dict(G.graph)
+    return H
+
+
+def calcular_mids_ids(G):
+    """Tabla de puntos medios (punto medio entre nodos, en radianes) por arista."""
+    filas = []
+    for u, v, k in G.edges(keys=True):
+        nu, nv = G.nodes[u], G.nodes[v]
+        filas.append((math.radians((nu["y"] + nv["y"]) / 2), math.radians((nu["x"] + nv["x"]) / 2), u, v, k))
+    return pd.DataFrame(filas, columns=["lat_rad", "lon_rad", "u", "v", "k"])
+
+
+def cortes_subsegmentos(coordenadas, longitud, segmento_maximo=SEGMENTO_MAXIMO):
+    """
+    Puntos de corte (lon, lat) de una arista larga, con el mismo criterio de
+    segmentar_grafo: int(longitud / segmento_maximo) cortes equiespaciados.
+    """
+    if longitud <= segmento_maximo:
+        return []
+    cantidad_divisiones = int(longitud / segmento_maximo)
+    distancia_acumulada = ap.distancia_euclidiana_acumulada(coordenadas)
+    longitud_subsegmento = distancia_acumulada[-1] / (cantidad_divisiones + 1)
+    cortes = []
+    posicion = 1
+    for i in range(1, len(distancia_acumulada)):
+        while distancia_acumulada[i] > longitud_subsegmento * posicion:
+            longitud_faltante = (longitud_subsegmento * posicion) - distancia_acumulada[i - 1]
+            cortes.append(ap.punto_en_recta_geografica_simple(coordenadas[i - 1][1], coordenadas[i - 1][0],
+                                                              coordenadas[i][1], coordenadas[i][0],
+                                                              longitud_faltante,
+                                                              distancia_acumulada[i] - distancia_acumulada[i - 1]))
+            posicion += 1
+    return cortes
+
+
+def calcular_extras(G, segmento_maximo=SEGMENTO_MAXIMO):
+    """
+    Arreglos precalculados del tile, alineados con el orden de formato_columnar
+    (nodos ordenados por id, aristas ordenadas por (u, v, k)).
+    """
+    nodos = sorted(G.nodes)
+    aristas = sorted(G.edges(keys=True))
+    indice_arista = {arista: i for i, arista in enumerate(aristas)}
+
+    #coordenadas métricas locales (equirectangular alrededor del centro del tile)
+    ys = np.asarray([G.nodes[n]["y"] for n in nodos], dtype=np.float64)
+    xs = np.asarray([G.nodes[n]["x"] for n in nodos], dtype=np.float64)
+    lat0 = float((ys.min() + ys.max()) / 2) if len(ys) else 0.0
+    lon0 = float((xs.min() + xs.max()) / 2) if len(xs) else 0.0
+    nodos_x_m = np.radians(xs - lon0) * EARTH_R * math.cos(math.radians(lat0))
+    nodos_y_m = np.radians(ys - lat0) * EARTH_R
+
+    rumbo_entrada, rumbo_salida = [], []
+    vecinas_inicio, vecinas = [0], []
+    subsegmentos_inicio, subsegmentos = [0], []
+    for u, v, k in aristas:
+        data = G.edges[u, v, k]
+        coordenadas = ap.obtener_coordenadas_segmento(G, (u, v, k), data)
+        if len(coordenadas) < 2:
+            coordenadas = [(G.nodes[u]["x"], G.nodes[u]["y"]), (G.nodes[v]["x"], G.nodes[v]["y"])]
+        rumbo_entrada.append(ap.calcular_angulo(coordenadas[0][::-1], coordenadas[1][::-1]))
+        rumbo_salida.append(ap.calcular_angulo(coordenadas[-2][::-1], coordenadas[-1][::-1]))
+
+        entrada, salida = ap.edges_conectados(G, u, v)
+        vecinas.extend(indice_arista[e] for e in entrada + salida)
+        vecinas_inicio.append(len(vecinas))
+
+        subsegmentos.extend(cortes_subsegmentos(coordenadas, float(data.get("length", 0.0)), segmento_maximo))
+        subsegmentos_inicio.append(len(subsegmentos))
+
+    return {
+        "rumbo_entrada": np.asarray(rumbo_entrada, dtype=np.float32),
+        "rumbo_salida": np.asarray(rumbo_salida, dtype=np.float32),
+        "nodos_x_m": nodos_x_m,
+        "nodos_y_m": nodos_y_m,
+        "origen_metrico": np.asarray([lat0, lon0], dtype=np.float64),
+        "vecinas_inicio": np.asarray(vecinas_inicio, dtype=np.int64),
+        "vecinas_orden": np.asarray(vecinas, dtype=np.int64),
+        "subsegmentos_inicio": np.asarray(subsegmentos_inicio, dtype=np.int64),
+        "subsegmentos": np.asarray(subsegmentos, dtype=np.float64).reshape(-1, 2),
+    }
+
+
+def nombre_grafo_tile(id_tile, extension):
+    lat_min, lat_max, lon_min, lon_max = extension
+    return f"segN{id_tile}pos{lat_max}&{lat_min}&{lon_min}&{lon_max}.pkl"
+
+
+def _reemplazar(ruta, escribir):
+    #escritura atómica: archivo temporal + os.replace
+    temporal = ruta + ".tmp"
+    escribir(temporal)
+    os.replace(temporal, ruta)
+
+
+def escribir_tile(carpeta_salida, id_tile, G, columnar=True):
+    """
+    Escribe los artefactos de un tile en la carpeta de salida.
+
+    Retorna:
+        dict con el nombre del grafo, la extensión y el número de aristas.
+    """
+    extension = extension_grafo(G)
+    nombre_grafo = nombre_grafo_tile(id_tile, extension)
+
+    #el nombre del grafo incluye la extensión: se borran versiones anteriores del mismo tile
+    for anterior in os.listdir(carpeta_salida):
+        if anterior.startswith(f"segN{id_tile}pos") and anterior != nombre_grafo:
+            os.remove(os.path.join(carpeta_salida, anterior))
+
+    def escribir_grafo(ruta):
+        with open(ruta, "wb") as f:
+            pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    mids_ids = calcular_mids_ids(G)
+    tree = BallTree(mids_ids[["lat_rad", "lon_rad"]].to_numpy(), leaf_size=40, metric="haversine")
+
+    _reemplazar(os.path.join(carpeta_salida, nombre_grafo), escribir_grafo)
+    _reemplazar(os.path.join(carpeta_salida, f"balltree_model_N{id_tile}.pkl"), lambda ruta: joblib.dump(tree, ruta))
+    _reemplazar(os.path.join(carpeta_salida, f"mids_ids_N{id_tile}.csv"), lambda ruta: mids_ids.to_csv(ruta, index=False))
+    if columnar:
+        fc.escribir_tile_columnar(fc.ruta_tile_columnar(carpeta_salida, id_tile), G, mids_ids, extras=calcular_extras(G))
+
+    return {"grafo": nombre_grafo, "extension": extension, "aristas": int(G.number_of_edges())}
+
+
+def excede_presupuesto(G, parametros):
+    """Indica si un tile supera el presupuesto de aristas o de bytes (pickle) configurado."""
+    if parametros["max_aristas"] and G.number_of_edges() > parametros["max_aristas"]:
+        return True
+    if parametros["max_mb"]:
+        tamano = len(pickle.dumps(G, protocol=pickle.HIGHEST_PROTOCOL))
+        return tamano > parametros["max_mb"] * 1024 * 1024
+    return False
+
+
+def particionar_tile(id_tile, G, parametros, profundidad=0):
+    """
+    Parte un tile en cuadrantes hasta que cada hoja queda bajo el presupuesto.
+
+    Parámetros:
+        id_tile : int | str
+            Identificador del tile (número de celda o id de cuadrante).
+        G : networkx.MultiDiGraph
+            Grafo recortado a la celda del tile más su halo.
+        parametros : dict
+            halo_m, max_aristas, max_mb y max_profundidad.
+
+    Retorna:
+        list[(id_hoja, grafo_hoja)] sin hojas vacías.
+    """
+    if profundidad >= parametros["max_profundidad"] or not excede_presupuesto(G, parametros):
+        return [(id_tile, G)] if G.number_of_edges() > 0 else []
+    separador = "" if "q" in str(id_tile) else "q"
+    hojas = []
+    for cuadrante in "0123":
+        id_hijo = f"{id_tile}{separador}{cuadrante}"
+        limites = limites_con_halo(mt.limites_celda(id_hijo), parametros["halo_m"])
+        hojas.extend(particionar_tile(id_hijo, recortar_grafo(G, limites), parametros, profundidad + 1))
+    return hojas
+
+
+_PATRON_ARTEFACTO = re.compile(r"^(?:segN|balltree_model_N|mids_ids_N|N)(\d+(?:q[0-3]+)?)(?:pos|\.pkl$|\.csv$|$)")
+
+
+def limpiar_tiles_obsoletos(carpeta_salida, id_base, conservar):
+    """
+    Borra los artefactos de la celda base que no pertenecen a la partición actual
+    (p. ej. el tile entero cuando ahora se parte, o cuadrantes de una partición anterior).
+    """
+    conservar = {str(i) for i in conservar}
+    for carpeta in (carpeta_salida, os.path.join(carpeta_salida, "columnar")):
+        if not os.path.isdir(carpeta):
+            continue
+        for nombre in os.listdir(carpeta):
+            coincidencia = _PATRON_ARTEFACTO.match(nombre)
+            if coincidencia is None:
+                continue
+            id_tile = coincidencia.group(1)
+            if id_tile.partition("q")[0] != str(id_base) or id_tile in conservar:
+                continue
+            ruta = os.path.join(carpeta, nombre)
+            if os.path.isdir(ruta):
+                shutil.rmtree(ruta, ignore_errors=True)
+            else:
+                os.remove(ruta)
+
+
+#fuentes ya cargadas en este worker (se reutilizan entre tiles de la misma zona)
+_fuentes_cargadas = {}
+MAX_FUENTES_CARGADAS = 2
+
+
+def _cargar_fuente_cacheada(ruta, firma):
+    clave = (ruta, firma)
+    if clave not in _fuentes_cargadas:
+        while len(_fuentes_cargadas) >= MAX_FUENTES_CARGADAS:
+            _fuentes_cargadas.pop(next(iter(_fuentes_cargadas)))
+        _fuentes_cargadas[clave] = cargar_fuente(ruta)
+    return _fuentes_cargadas[clave]
+
+
+def construir_tile(tarea):
+    """
+    Construye los tiles de una celda base (se ejecuta en el pool de procesos).
+
+    Parámetros:
+        tarea : dict
+            id, limites (celda con halo), fuentes [(ruta, sha256)], carpeta_salida,
+            columnar y parametros de partición.
+
+    Retorna:
+        dict con el id de la celda y la descripción de cada hoja escrita (vacío si no hay aristas).
+    """
+    inicio = time.time()
+    grafos = [recortar_grafo(_cargar_fuente_cacheada(ruta, firma), tarea["limites"]) for ruta, firma in tarea["fuentes"]]
+    grafos = [g for g in grafos if g.number_of_edges() > 0]
+    hojas = []
+    if grafos:
+        G = grafos[0] if len(grafos) == 1 else nx.compose_all(grafos)
+        hojas = particionar_tile(tarea["id"], G, tarea["parametros"])
+    limpiar_tiles_obsoletos(tarea["carpeta_salida"], tarea["id"], [id_hoja for id_hoja, _ in hojas])
+    resultados = [
+        dict(escribir_tile(tarea["carpeta_salida"], id_hoja, G_hoja, tarea["columnar"]), id=id_hoja)
+        for id_hoja, G_hoja in hojas
+    ]
+    return {"id": tarea["id"], "hojas": resultados, "tiempo": time.time() - inicio}
+
+
+###############################################################
+#-----------------      PLANIFICACIÓN      -------------------#
+
+def firma_tile(fuentes, parametros):
+    contenido = json.dumps({"fuentes": sorted(fuentes), "parametros": parametros, "version": VERSION_CONSTRUCTOR,
+                            "segmento_maximo": SEGMENTO_MAXIMO}, sort_keys=True)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+def cargar_estado(carpeta_salida):
+    ruta = os.path.join(carpeta_salida, NOMBRE_ESTADO)
+    if not os.path.isfile(ruta):
+        return {"version": VERSION_CONSTRUCTOR, "fuentes": {}, "tiles": {}}
+    with open(ruta, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def guardar_estado(carpeta_salida, estado):
+    def escribir(temporal):
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(estado, f, indent=2)
+
+    _reemplazar(os.path.join(carpeta_salida, NOMBRE_ESTADO), escribir)
+
+
+def _tile_completo(carpeta_salida, anterior, columnar):
+    if anterior is None:
+        return False
+    if anterior.get("vacio", False):
+        return True
+    return all(
+        os.path.isfile(os.path.join(carpeta_salida, hoja["grafo"]))
+        and (not columnar or fc.existe_tile_columnar(carpeta_salida, hoja["id"]))
+        for hoja in anterior.get("hojas", [])
+    ) and bool(anterior.get("hojas"))
+
+
+def planificar_tiles(carpeta_graphml, carpeta_salida, fuentes, estado, parametros, tiles=None, forzar=False, columnar=True):
+    """
+    Decide qué celdas base hay que construir.
+
+    Retorna:
+        (tareas, firmas) : lista de tareas para construir_tile y firma de cada tile planificado.
+    """
+    candidatos = set()
+    for descripcion in fuentes.values():
+        candidatos.update(celdas_en_extension(descripcion["extension"]))
+    if tiles:
+        candidatos &= set(tiles)
+
+    tareas = []
+    firmas = {}
+    for id_tile in sorted(candidatos):
+        limites = limites_con_halo(ap.limites_celda_grafo(id_tile), parametros["halo_m"])
+        tocan = [(nombre, d["sha256"]) for nombre, d in fuentes.items() if intersectan(d["extension"], limites)]
+        if not tocan:
+            continue
+        firma = firma_tile([sha for _, sha in tocan], parametros)
+        firmas[id_tile] = firma
+        anterior = estado.get("tiles", {}).get(str(id_tile))
+        if not forzar and _tile_completo(carpeta_salida, anterior, columnar) and anterior.get("firma") == firma:
+            continue
+        tareas.append({
+            "id": id_tile,
+            "limites": limites,
+            "fuentes": [(os.path.join(carpeta_graphml, nombre), sha) for nombre, sha in tocan],
+            "carpeta_salida": carpeta_salida,
+            "columnar": columnar,
+            "parametros": parametros,
+        })
+    #tareas de la misma fuente seguidas para aprovechar la cache de fuentes de cada worker
+    tareas.sort(key=lambda t: (t["fuentes"][0][0], t["id"]))
+    return tareas, firmas
+
+
+def construir_tiles(carpeta_graphml, carpeta_salida, halo_m=HALO_DEFECTO_M, workers=1, tiles=None,
+                    forzar=False, columnar=True, max_aristas=MAX_ARISTAS_DEFECTO, max_mb=MAX_MB_DEFECTO,
+                    max_profundidad=MAX_PROFUNDIDAD_DEFECTO):
+    """
+    Construye (o actualiza) los tiles de la carpeta de salida a partir de las fuentes.
+
+    Retorna:
+        dict con las celdas construidas, omitidas, fallidas, las hojas escritas y el tiempo total.
+    """
+    inicio = time.time()
+    parametros = {
+        "halo_m": float(halo_m),
+        "max_aristas": int(max_aristas or 0),
+        "max_mb": float(max_mb or 0.0),
+        "max_profundidad": int(max_profundidad),
+    }
+    hojas_escritas = 0
+    os.makedirs(carpeta_salida, exist_ok=True)
+    estado = cargar_estado(carpeta_salida)
+    construidos, vacios, fallidos = [], [], []
+
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as ex:
+        fuentes = actualizar_fuentes(carpeta_graphml, estado, ex)
+        estado["fuentes"] = fuentes
+        tareas, firmas = planificar_tiles(carpeta_graphml, carpeta_salida, fuentes, estado, parametros, tiles, forzar, columnar)
+        print(f"🧱 {len(tareas)} tiles por construir ({len(firmas) - len(tareas)} sin cambios)")
+
+        futs = {ex.submit(construir_tile, tarea): tarea["id"] for tarea in tareas}
+        for fut in as_completed(futs):
+            id_tile = futs[fut]
+            try:
+                salida = fut.result()
+            except Exception as e:
+                fallidos.append(id_tile)
+                print(f"⚠️  Tile N{id_tile} fallido:")
+                traceback.print_exception(type(e), e, e.__traceback__)
+                continue
+            if not salida["hojas"]:
+                #la celda no tiene aristas: se recuerda para no volver a intentarla mientras no cambien las fuentes
+                vacios.append(id_tile)
+                estado.setdefault("tiles", {})[str(id_tile)] = {"vacio": True, "firma": firmas[id_tile]}
+                continue
+            construidos.append(id_tile)
+            hojas_escritas += len(salida["hojas"])
+            estado.setdefault("tiles", {})[str(id_tile)] = {"firma": firmas[id_tile], "hojas": salida["hojas"]}
+            aristas = sum(hoja["aristas"] for hoja in salida["hojas"])
+            print(f"   ✅ N{id_tile}: {aristas} aristas en {len(salida['hojas'])} tile(s) en {salida['tiempo']:.1f}s")
+            #el estado se guarda tras cada tile para poder retomar una construcción interrumpida
+            guardar_estado(carpeta_salida, estado)
+
+    estado["version"] = VERSION_CONSTRUCTOR
+    guardar_estado(carpeta_salida, estado)
+    mt.generar_manifiesto(carpeta_salida)
+
+    return {
+        "construidos": sorted(construidos),
+        "vacios": sorted(vacios),
+        "fallidos": sorted(fallidos),
+        "hojas": hojas_escritas,
+        "sin_cambios": len(firmas) - len(tareas),
+        "tiempo": round(time.time() - inicio, 1),
+    }
+
+
+###############################################################
+#-----------------       MAIN        -------------------------#
+
+def main():
+    entrada = argparse.ArgumentParser(description="Construye tiles de grafo a partir de fuentes GraphML")
+    entrada.add_argument("--carpeta_graphml", required=True, help="Carpeta con grafos .graphml (o .pkl de osmnx)")
+    entrada.add_argument("--carpeta_salida", required=True, help="Carpeta de tiles (segN*, balltree, mids_ids, columnar)")
+    entrada.add_argument("--halo_m", type=float, default=HALO_DEFECTO_M, help="Halo alrededor de cada celda (m)")
+    entrada.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="Procesos en paralelo")
+    entrada.add_argument("--tiles", type=int, nargs="*", default=None, help="Construir solo estos números de tile")
+    entrada.add_argument("--forzar", action="store_true", help="Reconstruir aunque las fuentes no hayan cambiado")
+    entrada.add_argument("--sin_columnar", action="store_true", help="No generar el formato columnar")
+    entrada.add_argument("--max_aristas", type=int, default=MAX_ARISTAS_DEFECTO,
+                         help="Aristas máximas por tile antes de partirlo en cuadrantes (0 = sin límite)")
+    entrada.add_argument("--max_mb", type=float, default=MAX_MB_DEFECTO,
+                         help="Tamaño máximo (MB, pickle) por tile antes de partirlo (0 = sin límite)")
+    entrada.add_argument("--max_profundidad", type=int, default=MAX_PROFUNDIDAD_DEFECTO,
+                         help="Niveles máximos de partición en cuadrantes")
+    args = entrada.parse_args()
+
+    resumen = construir_tiles(args.carpeta_graphml, args.carpeta_salida, args.halo_m, args.workers,
+                              args.tiles, args.forzar, not args.sin_columnar,
+                              args.max_aristas, args.max_mb, args.max_profundidad)
+    print(f"🏁 {len(resumen['construidos'])} celdas construidas ({resumen['hojas']} tiles), "
+          f"{resumen['sin_cambios']} sin cambios, "
+          f"{len(resumen['fallidos'])} fallidos en {resumen['tiempo']}s")
+
+
+if __name__ == "__main__":
+    main()
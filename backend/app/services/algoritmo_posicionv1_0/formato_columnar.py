@@ -0,0 +1,589 @@
+"""
+Formato columnar de tiles de grafo, mapeable en memoria.
+
+Un tile legado se reparte en tres archivos (grafo osmnx en pickle, BallTree de
+joblib y mids_ids_N*.csv) que hay que deserializar completos en cada proceso.
+El formato columnar guarda todo el tile en un directorio de arreglos `.npy`
+que se abren con `np.load(mmap_mode='r')`: la carga es casi instantánea y las
+páginas se comparten entre procesos a través de la cache de páginas del SO.
+
+Estructura de un tile (`<carpeta_grafos>/columnar/N<numero>/`):
+
+    meta.json                 versión, crs, parámetros de la grilla del índice
+    vocabulario.json          textos de 'highway' y 'name' (codificados en JSON)
+    nodos_id / nodos_x / nodos_y
+    aristas_u / aristas_v / aristas_k / aristas_length / aristas_oneway
+    aristas_highway / aristas_name      (códigos en el vocabulario, -1 = sin dato)
+    aristas_geom_inicio / geom_coords   (CSR de coordenadas lon, lat por arista)
+    salida_inicio                        (CSR de aristas por nodo origen)
+    entrada_inicio / entrada_orden       (CSR de aristas por nodo destino)
+    mids_lat / mids_lon / mids_arista    (puntos medios en radianes)
+    celdas_inicio / celdas_orden         (grilla uniforme sobre los mids)
+
+Los tiles se leen a través de `VistaGrafo`, que expone el subconjunto del API de
+networkx que usa el matching, e `IndiceEspacialColumnar`, que replica `query` y
+`query_radius` del BallTree con métrica haversine.
+"""
+import json
+import math
+import os
+import pickle
+import shutil
+
+import numpy as np
+
+VERSION_FORMATO = 1
+
+#tamaño de celda del índice espacial (radianes, ~200 m)
+TAMANO_CELDA_DEFECTO = 200.0 / 6371000.0
+
+#fracción del tamaño en disco que se cuenta como memoria privada del proceso
+#(el resto vive en la cache de páginas compartida)
+FACTOR_MEMORIA_MMAP = 0.1
+
+ARREGLOS = [
+    "nodos_id", "nodos_x", "nodos_y",
+    "aristas_u", "aristas_v", "aristas_k", "aristas_length", "aristas_oneway",
+    "aristas_highway", "aristas_name", "aristas_geom_inicio", "geom_coords",
+    "salida_inicio", "entrada_inicio", "entrada_orden",
+    "mids_lat", "mids_lon", "mids_arista", "celdas_inicio", "celdas_orden",
+]
+
+
+def ruta_tile_columnar(carpeta_grafos, numero_grafo):
+    """Ruta del directorio columnar de un tile dentro de la carpeta de grafos."""
+    return os.path.join(carpeta_grafos, "columnar", "N" + str(numero_grafo))
+
+
+def existe_tile_columnar(carpeta_grafos, numero_grafo):
+    return os.path.isfile(os.path.join(ruta_tile_columnar(carpeta_grafos, numero_grafo), "meta.json"))
+
+
+###############################################################
+#-----------------       ESCRITURA       ---------------------#
+
+def _codificar(valor, vocabulario, indices):
+    #los textos se guardan en JSON para conservar listas de nombres de osmnx
+    if valor is None:
+        return -1
+    texto = json.dumps(valor, ensure_ascii=False)
+    if texto not in indices:
+        indices[texto] = len(vocabulario)
+        vocabulario.append(texto)
+    return indices[texto]
+
+
+def _es_oneway(valor):
+    return valor in [True, 'yes', '1', 'True', 'true']
+
+
+def _punto_medio(coords):
+    #punto medio sobre la longitud de la polilínea (en grados)
+    if len(coords) == 1:
+        return coords[0]
+    tramos = np.hypot(np.diff(coords[:, 0]), np.diff(coords[:, 1]))
+    total = tramos.sum()
+    if total == 0:
+        return coords[0]
+    acumulada = np.concatenate(([0.0], np.cumsum(tramos)))
+    mitad = total / 2
+    i = min(int(np.searchsorted(acumulada, mitad, side="right")) - 1, len(tramos) - 1)
+    t = (mitad - acumulada[i]) / tramos[i] if tramos[i] > 0 else 0.0
+    return coords[i] + t * (coords[i + 1] - coords[i])
+
+
+def construir_indice_grilla(lat, lon, tamano_celda=TAMANO_CELDA_DEFECTO):
+    """
+    Construye una grilla uniforme (CSR) sobre puntos en radianes.
+
+    Retorna:
+        (meta_grilla, celdas_inicio, celdas_orden)
+    """
+    lat0 = float(lat.min()) if len(lat) else 0.0
+    lon0 = float(lon.min()) if len(lon) else 0.0
+    filas = np.floor((lat - lat0) / tamano_celda).astype(np.int64) if len(lat) else np.zeros(0, np.int64)
+    columnas = np.floor((lon - lon0) / tamano_celda).astype(np.int64) if len(lon) else np.zeros(0, np.int64)
+    n_filas = int(filas.max()) + 1 if len(filas) else 1
+    n_columnas = int(columnas.max()) + 1 if len(columnas) else 1
+
+    celda = filas * n_columnas + columnas
+    celdas_orden = np.argsort(celda, kind="stable").astype(np.int64)
+    conteo = np.bincount(celda, minlength=n_filas * n_columnas)
+    celdas_inicio = np.concatenate(([0], np.cumsum(conteo))).astype(np.int64)
+
+    meta = {
+        "lat0": lat0,
+        "lon0": lon0,
+        "tamano_celda": tamano_celda,
+        "n_filas": n_filas,
+        "n_columnas": n_columnas,
+    }
+    return meta, celdas_inicio, celdas_orden
+
+
+def escribir_tile_columnar(destino, G, mids_ids=None, extras=None, tamano_celda=TAMANO_CELDA_DEFECTO):
+    """
+    Escribe un grafo osmnx en formato columnar.
+
+    Parámetros:
+        destino : str
+            Directorio del tile (se reemplaza de forma atómica si ya existe).
+        G : networkx.MultiDiGraph
+            Grafo del tile.
+        mids_ids : pandas.DataFrame, opcional
+            Tabla con columnas lat_rad, lon_rad, u, v, k. Si no se da, los puntos
+            medios se calculan de la geometría de cada arista.
+        extras : dict[str, np.ndarray], opcional
+            Arreglos adicionales precalculados que se guardan junto al tile.
+        tamano_celda : float
+            Tamaño de celda del índice espacial en radianes.
+
+    Retorna:
+        str con la ruta del tile escrito.
+    """
+    nodos = sorted(G.nodes)
+    nodos_id = np.asarray(nodos, dtype=np.int64)
+    nodos_x = np.asarray([G.nodes[n]["x"] for n in nodos], dtype=np.float64)
+    nodos_y = np.asarray([G.nodes[n]["y"] for n in nodos], dtype=np.float64)
+
+    #aristas ordenadas por (u, v, k): las salidas de cada nodo quedan contiguas
+    aristas = sorted(G.edges(keys=True, data=True), key=lambda e: (e[0], e[1], e[2]))
+    vocabulario = []
+    indices_vocabulario = {}
+    u_arr, v_arr, k_arr, length, oneway, highway, name = [], [], [], [], [], [], []
+    geom_inicio = [0]
+    geom = []
+    for u, v, k, data in aristas:
+        u_arr.append(u)
+        v_arr.append(v)
+        k_arr.append(k)
+        length.append(float(data.get("length", 0.0)))
+        oneway.append(_es_oneway(data.get("oneway", False)))
+        highway.append(_codificar(data.get("highway"), vocabulario, indices_vocabulario))
+        name.append(_codificar(data.get("name"), vocabulario, indices_vocabulario))
+        if "geometry" in data:
+            geom.extend(list(data["geometry"].coords))
+        geom_inicio.append(len(geom))
+
+    aristas_u = np.asarray(u_arr, dtype=np.int64)
+    aristas_v = np.asarray(v_arr, dtype=np.int64)
+    geom_coords = np.asarray(geom, dtype=np.float64).reshape(-1, 2)
+    aristas_geom_inicio = np.asarray(geom_inicio, dtype=np.int64)
+
+    indice_u = np.searchsorted(nodos_id, aristas_u)
+    indice_v = np.searchsorted(nodos_id, aristas_v)
+    salida_inicio = np.concatenate(([0], np.cumsum(np.bincount(indice_u, minlength=len(nodos_id))))).astype(np.int64)
+    entrada_orden = np.argsort(indice_v, kind="stable").astype(np.int64)
+    entrada_inicio = np.concatenate(([0], np.cumsum(np.bincount(indice_v, minlength=len(nodos_id))))).astype(np.int64)
+
+    #puntos medios: se reutiliza la tabla mids_ids si existe para conservar el mismo índice
+    if mids_ids is not None:
+        claves = {(int(u), int(v), int(k)): i for i, (u, v, k) in enumerate(zip(aristas_u, aristas_v, k_arr))}
+        filas = [claves.get((int(u), int(v), int(k)), -1) for u, v, k in zip(mids_ids["u"], mids_ids["v"], mids_ids["k"])]
+        mids_arista = np.asarray(filas, dtype=np.int64)
+        validos = mids_arista >= 0
+        mids_arista = mids_arista[validos]
+        mids_lat = mids_ids["lat_rad"].to_numpy(dtype=np.float64)[validos]
+        mids_lon = mids_ids["lon_rad"].to_numpy(dtype=np.float64)[validos]
+    else:
+        medios = []
+        for i in range(len(aristas)):
+            inicio, fin = aristas_geom_inicio[i], aristas_geom_inicio[i + 1]
+            if fin > inicio:
+                coords = geom_coords[inicio:fin]
+            else:
+                iu, iv = indice_u[i], indice_v[i]
+                coords = np.array([[nodos_x[iu], nodos_y[iu]], [nodos_x[iv], nodos_y[iv]]])
+            medios.append(_punto_medio(coords))
+        medios = np.asarray(medios, dtype=np.float64).reshape(-1, 2)
+        mids_lat = np.radians(medios[:, 1])
+        mids_lon = np.radians(medios[:, 0])
+        mids_arista = np.arange(len(aristas), dtype=np.int64)
+
+    meta_grilla, celdas_inicio, celdas_orden = construir_indice_grilla(mids_lat, mids_lon, tamano_celda)
+
+    arreglos = {
+        "nodos_id": nodos_id,
+        "nodos_x": nodos_x,
+        "nodos_y": nodos_y,
+        "aristas_u": aristas_u,
+        "aristas_v": aristas_v,
+        "aristas_k": np.asarray(k_arr, dtype=np.int64),
+        "aristas_length": np.asarray(length, dtype=np.float64),
+        "aristas_oneway": np.asarray(oneway, dtype=bool),
+        "aristas_highway": np.asarray(highway, dtype=np.int32),
+        "aristas_name": np.asarray(name, dtype=np.int32),
+        "aristas_geom_inicio": aristas_geom_inicio,
+        "geom_coords": geom_coords,
+        "salida_inicio": salida_inicio,
+        "entrada_inicio": entrada_inicio,
+        "entrada_orden": entrada_orden,
+        "mids_lat": mids_lat,
+        "mids_lon": mids_lon,
+        "mids_arista": mids_arista,
+        "celdas_inicio": celdas_inicio,
+        "celdas_orden": celdas_orden,
+    }
+    meta = {
+        "version": VERSION_FORMATO,
+        "crs": str(G.graph.get("crs", "EPSG:4326")),
+        "n_nodos": int(len(nodos_id)),
+        "n_aristas": int(len(aristas)),
+        "grilla": meta_grilla,
+        "extras": sorted((extras or {}).keys()),
+    }
+
+    #se escribe en un directorio temporal y se reemplaza al final
+    temporal = destino.rstrip("/\\") + ".tmp"
+    shutil.rmtree(temporal, ignore_errors=True)
+    os.makedirs(temporal)
+    for nombre, arreglo in arreglos.items():
+        np.save(os.path.join(temporal, nombre + ".npy"), arreglo)
+    for nombre, arreglo in (extras or {}).items():
+        np.save(os.path.join(temporal, "extra_" + nombre + ".npy"), np.asarray(arreglo))
+    with open(os.path.join(temporal, "vocabulario.json"), "w", encoding="utf-8") as f:
+        json.dump(vocabulario, f, ensure_ascii=False)
+    with open(os.path.join(temporal, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    anterior = destino.rstrip("/\\") + ".old"
+    if os.path.isdir(destino):
+        shutil.rmtree(anterior, ignore_errors=True)
+        os.replace(destino, anterior)
+    os.replace(temporal, destino)
+    shutil.rmtree(anterior, ignore_errors=True)
+    return destino
+
+
+def convertir_tile_legacy(carpeta_grafos, numero_grafo, carpeta_destino=None):
+    """
+    Convierte un tile legado (pickle + BallTree + mids_ids CSV) al formato columnar.
+
+    Retorna:
+        str con la ruta del tile columnar, o None si el tile no tiene grafo.
+    """
+    import pandas as pd
+    from . import manifiesto_tiles as mt
+
+    ruta_grafo = mt.cargar_manifiesto(carpeta_grafos).ruta(numero_grafo, 'grafo')
+    if ruta_grafo is None:
+        return None
+    with open(ruta_grafo, "rb") as f:
+        G = pickle.load(f)
+
+    ruta_mids = os.path.join(carpeta_grafos, 'mids_ids_N' + str(numero_grafo) + '.csv')
+    mids_ids = pd.read_csv(ruta_mids) if os.path.isfile(ruta_mids) else None
+
+    destino = ruta_tile_columnar(carpeta_destino or carpeta_grafos, numero_grafo)
+    return escribir_tile_columnar(destino, G, mids_ids)
+
+
+###############################################################
+#-----------------        LECTURA        ---------------------#
+
+class _VistaNodos:
+    def __init__(self, grafo):
+        self._g = grafo
+
+    def __contains__(self, nodo):
+        return self._g._indice_nodo(nodo) is not None
+
+    def __getitem__(self, nodo):
+        i = self._g._indice_nodo(nodo)
+        if i is None:
+            raise KeyError(nodo)
+        return {"x": float(self._g.a["nodos_x"][i]), "y": float(self._g.a["nodos_y"][i])}
+
+    def __iter__(self):
+        return (int(n) for n in self._g.a["nodos_id"])
+
+    def __len__(self):
+        return len(self._g.a["nodos_id"])
+
+
+class _VistaAristas:
+    def __init__(self, grafo):
+        self._g = grafo
+
+    def __contains__(self, arista):
+        return self._g._indice_arista(*arista) is not None
+
+    def __getitem__(self, arista):
+        i = self._g._indice_arista(*arista)
+        if i is None:
+            raise KeyError(arista)
+        return self._g._datos_arista(i)
+
+    def __len__(self):
+        return len(self._g.a["aristas_u"])
+
+
+class VistaGrafo:
+    """
+    Grafo de solo lectura sobre los arreglos de un tile columnar.
+
+    Implementa el subconjunto de networkx.MultiDiGraph que usa el matching:
+    `nodes[n]`, `edges[(u, v, k)]`, `G[u][v][k]`, `predecessors`, `successors`,
+    `has_edge`, `get_edge_data` y `graph`.
+    """
+
+    def __init__(self, arreglos, vocabulario, meta):
+        self.a = arreglos
+        self._vocabulario = vocabulario
+        self.graph = {"crs": meta.get("crs", "EPSG:4326")}
+        self.nodes = _VistaNodos(self)
+        self.edges = _VistaAristas(self)
+        self._cache_datos = {}
+
+    def extra(self, nombre):
+        """Arreglo precalculado guardado con el tile (None si el tile no lo tiene)."""
+        return self.a.get("extra_" + nombre)
+
+    def _indice_nodo(self, nodo):
+        ids = self.a["nodos_id"]
+        i = int(np.searchsorted(ids, int(nodo)))
+        if i < len(ids) and ids[i] == int(nodo):
+            return i
+        return None
+
+    def _rango_salida(self, nodo):
+        i = self._indice_nodo(nodo)
+        if i is None:
+            return 0, 0
+        return int(self.a["salida_inicio"][i]), int(self.a["salida_inicio"][i + 1])
+
+    def _indice_arista(self, u, v, k):
+        inicio, fin = self._rango_salida(u)
+        aristas_v = self.a["aristas_v"]
+        aristas_k = self.a["aristas_k"]
+        for i in range(inicio, fin):
+            if aristas_v[i] == int(v) and aristas_k[i] == int(k):
+                return i
+        return None
+
+    def _texto(self, codigo):
+        if codigo < 0:
+            return None
+        return json.loads(self._vocabulario[codigo])
+
+    def _datos_arista(self, i):
+        datos = self._cache_datos.get(i)
+        if datos is not None:
+            return datos
+        datos = {
+            "length": float(self.a["aristas_length"][i]),
+            "oneway": bool(self.a["aristas_oneway"][i]),
+            "highway": self._texto(int(self.a["aristas_highway"][i])),
+        }
+        nombre = self._texto(int(self.a["aristas_name"][i]))
+        if nombre is not None:
+            datos["name"] = nombre
+        inicio, fin = int(self.a["aristas_geom_inicio"][i]), int(self.a["aristas_geom_inicio"][i + 1])
+        if fin > inicio:
+            from shapely.geometry import LineString
+            datos["geometry"] = LineString(np.asarray(self.a["geom_coords"][inicio:fin]))
+        self._cache_datos[i] = datos
+        return datos
+
+    def successors(self, u):
+        inicio, fin = self._rango_salida(u)
+        vistos = dict.fromkeys(int(v) for v in self.a["aristas_v"][inicio:fin])
+        return iter(vistos)
+
+    def predecessors(self, v):
+        i = self._indice_nodo(v)
+        if i is None:
+            return iter(())
+        inicio, fin = int(self.a["entrada_inicio"][i]), int(self.a["entrada_inicio"][i + 1])
+        aristas = self.a["entrada_orden"][inicio:fin]
+        vistos = dict.fromkeys(int(u) for u in self.a["aristas_u"][aristas])
+        return iter(vistos)
+
+    def get_edge_data(self, u, v, key=None, default=None):
+        inicio, fin = self._rango_salida(u)
+        datos = {}
+        for i in range(inicio, fin):
+            if self.a["aristas_v"][i] == int(v):
+                datos[int(self.a["aristas_k"][i])] = self._datos_arista(i)
+        if not datos:
+            return default
+        if key is not None:
+            return datos.get(key, default)
+        return datos
+
+    def has_edge(self, u, v, key=None):
+        return self.get_edge_data(u, v, key) is not None
+
+    def __getitem__(self, u):
+        inicio, fin = self._rango_salida(u)
+        adyacencia = {}
+        for i in range(inicio, fin):
+            adyacencia.setdefault(int(self.a["aristas_v"][i]), {})[int(self.a["aristas_k"][i])] = self._datos_arista(i)
+        return adyacencia
+
+    def __contains__(self, nodo):
+        return nodo in self.nodes
+
+
+class IdsColumnar:
+    """Secuencia (u, v, k) de cada punto medio, equivalente a la lista `ids` legada."""
+
+    def __init__(self, arreglos):
+        self.a = arreglos
+
+    def __len__(self):
+        return len(self.a["mids_arista"])
+
+    def __getitem__(self, i):
+        arista = int(self.a["mids_arista"][i])
+        return (int(self.a["aristas_u"][arista]), int(self.a["aristas_v"][arista]), int(self.a["aristas_k"][arista]))
+
+
+def _haversine(lat1, lon1, lat2, lon2):
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    h = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+class IndiceEspacialColumnar:
+    """
+    Índice espacial sobre los puntos medios de un tile columnar.
+
+    Replica el API de `sklearn.neighbors.BallTree` con métrica haversine
+    (coordenadas y distancias en radianes) para `query` y `query_radius`.
+    """
+
+    def __init__(self, arreglos, meta_grilla):
+        self.a = arreglos
+        self.lat0 = meta_grilla["lat0"]
+        self.lon0 = meta_grilla["lon0"]
+        self.celda = meta_grilla["tamano_celda"]
+        self.n_filas = meta_grilla["n_filas"]
+        self.n_columnas = meta_grilla["n_columnas"]
+
+    def _celda_de(self, lat, lon):
+        return int(math.floor((lat - self.lat0) / self.celda)), int(math.floor((lon - self.lon0) / self.celda))
+
+    def _puntos_en_anillo(self, fila, columna, r):
+        #índices de los puntos en las celdas a distancia de Chebyshev exactamente r
+        inicio = self.a["celdas_inicio"]
+        orden = self.a["celdas_orden"]
+        partes = []
+        for f in range(fila - r, fila + r + 1):
+            if f < 0 or f >= self.n_filas:
+                continue
+            borde = f in (fila - r, fila + r)
+            columnas = range(columna - r, columna + r + 1) if borde else (columna - r, columna + r)
+            for c in columnas:
+                if c < 0 or c >= self.n_columnas:
+                    continue
+                celda = f * self.n_columnas + c
+                if inicio[celda + 1] > inicio[celda]:
+                    partes.append(orden[inicio[celda]:inicio[celda + 1]])
+        return partes
+
+    def _consultar_k(self, lat, lon, k):
+        fila, columna = self._celda_de(lat, lon)
+        k = min(k, len(self.a["mids_lat"]))
+        #anillo a partir del cual ya se recorrió toda la grilla
+        radio_max = max(abs(fila), abs(fila - self.n_filas), abs(columna), abs(columna - self.n_columnas))
+        candidatos = []
+        r = 0
+        while True:
+            candidatos.extend(self._puntos_en_anillo(fila, columna, r))
+            n = sum(len(p) for p in candidatos)
+            if n >= k:
+                idx = np.concatenate(candidatos)
+                dist = _haversine(lat, lon, self.a["mids_lat"][idx], self.a["mids_lon"][idx])
+                orden = np.argsort(dist, kind="stable")[:k]
+                #distancia mínima garantizada a los puntos fuera de las celdas revisadas
+                cubierto = r * self.celda * math.cos(min(abs(lat) + r * self.celda, math.pi / 2))
+                if dist[orden[-1]] <= cubierto or r >= radio_max:
+                    return dist[orden], idx[orden]
+            elif r >= radio_max:
+                idx = np.concatenate(candidatos) if candidatos else np.zeros(0, np.int64)
+                dist = _haversine(lat, lon, self.a["mids_lat"][idx], self.a["mids_lon"][idx])
+                orden = np.argsort(dist, kind="stable")
+                return dist[orden], idx[orden]
+            r += 1
+
+    def query(self, X, k=1):
+        resultados = [self._consultar_k(float(lat), float(lon), k) for lat, lon in np.asarray(X, dtype=np.float64)]
+        distancias = np.vstack([d for d, _ in resultados])
+        indices = np.vstack([i for _, i in resultados])
+        return distancias, indices
+
+    def query_radius(self, X, r):
+        salida = []
+        for lat, lon in np.asarray(X, dtype=np.float64):
+            fila, columna = self._celda_de(lat, lon)
+            escala = max(math.cos(min(abs(lat) + r, math.pi / 2)), 1e-6)
+            anillos = int(math.ceil(r / (self.celda * escala)))
+            partes = []
+            for anillo in range(anillos + 1):
+                partes.extend(self._puntos_en_anillo(fila, columna, anillo))
+            idx = np.concatenate(partes) if partes else np.zeros(0, np.int64)
+            dist = _haversine(lat, lon, self.a["mids_lat"][idx], self.a["mids_lon"][idx])
+            salida.append(idx[dist <= r])
+        resultado = np.empty(len(salida), dtype=object)
+        resultado[:] = salida
+        return resultado
+
+
+def cargar_tile_columnar(ruta, numero_grafo=None, mmap=True):
+    """
+    Abre un tile columnar.
+
+    Parámetros:
+        ruta : str
+            Directorio del tile.
+        numero_grafo : int, opcional
+            Número del tile (se guarda en el resultado).
+        mmap : bool
+            Si es True los arreglos se abren con mmap_mode='r'.
+
+    Retorna:
+        TileGrafo con `G` (VistaGrafo), `tree` (IndiceEspacialColumnar), `mids` e `ids`.
+    """
+    from .cache_grafos import TileGrafo
+
+    with open(os.path.join(ruta, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != VERSION_FORMATO:
+        raise ValueError(f"Versión de tile columnar no soportada en {ruta}: {meta.get('version')}")
+    with open(os.path.join(ruta, "vocabulario.json"), "r", encoding="utf-8") as f:
+        vocabulario = json.load(f)
+
+    modo = "r" if mmap else None
+    nombres = ARREGLOS + ["extra_" + nombre for nombre in meta.get("extras", [])]
+    arreglos = {nombre: np.load(os.path.join(ruta, nombre + ".npy"), mmap_mode=modo) for nombre in nombres}
+
+    tamano_disco = sum(os.path.getsize(os.path.join(ruta, nombre + ".npy")) for nombre in nombres)
+    tamano = int(tamano_disco * FACTOR_MEMORIA_MMAP) if mmap else tamano_disco
+
+    G = VistaGrafo(arreglos, vocabulario, meta)
+    tree = IndiceEspacialColumnar(arreglos, meta["grilla"])
+    #los puntos medios se consultan a través del índice, no se materializa la lista `mids`
+    return TileGrafo(numero_grafo, G, tree, None, IdsColumnar(arreglos), tamano)
+
+
+###############################################################
+#-----------------       MAIN        -------------------------#
+
+def main():
+    import argparse
+    from . import manifiesto_tiles as mt
+
+    entrada = argparse.ArgumentParser(description="Convierte tiles legados al formato columnar mapeable")
+    entrada.add_argument("--carpeta_grafos", required=True, help="Carpeta con segN*.pkl, balltree y mids_ids")
+    entrada.add_argument("--destino", default=None, help="Carpeta de salida (por defecto la misma carpeta de grafos)")
+    args = entrada.parse_args()
+
+    for numero in mt.cargar_manifiesto(args.carpeta_grafos).ids():
+        ruta = convertir_tile_legacy(args.carpeta_grafos, numero, args.destino)
+        print(f"tile N{numero} -> {ruta}")
+
+
+if __name__ == "__main__":
+    main()
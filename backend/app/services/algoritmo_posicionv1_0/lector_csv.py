@@ -0,0 +1,167 @@
+"""
+Lectura en una sola pasada de los CSV exportados por la app RecWay.
+
+El archivo se lee una vez como bytes: el encabezado de metadatos (líneas con
+'#') se decodifica probando codificaciones y las columnas numéricas se
+convierten directamente a arreglos numpy tipados con el parser C de pandas.
+Lo usan tanto el procesamiento (cargar_csv_con_metadatos) como la carga de
+registros de sensores a la base de datos.
+
+leer_csv_por_bloques es la variante de bajo consumo de memoria: no mantiene los
+bytes del archivo, conserva solo las columnas pedidas y puede devolverlas ya en
+orden inverso sin una copia adicional.
+"""
+import io
+
+import numpy as np
+import pandas as pd
+
+#codificaciones probadas para el encabezado, en orden
+CODIFICACIONES = ['utf-8', 'latin-1', 'windows-1252', 'iso-8859-1']
+
+#filas por bloque en la lectura por bloques (unos 10 MB por columna numérica)
+FILAS_POR_BLOQUE = 250000
+
+
+class RegistroCSV:
+    """
+    Contenido de un CSV de RecWay leído en columnas.
+
+    Atributos:
+        ruta : str
+        metadatos : dict
+            Clave/valor de las líneas '# Clave: valor' del encabezado.
+        lineas_encabezado : list[str]
+            Líneas previas a la fila de nombres de columnas.
+        codificacion : str
+            Codificación con la que se decodificó el encabezado.
+    """
+
+    def __init__(self, ruta, metadatos, lineas_encabezado, codificacion, df):
+        self.ruta = ruta
+        self.metadatos = metadatos
+        self.lineas_encabezado = lineas_encabezado
+        self.codificacion = codificacion
+        self._df = df
+
+    @property
+    def columnas(self):
+        """dict nombre -> ndarray (timestamp int64, sensores float64), en el orden del archivo."""
+        return {nombre: self._df[nombre].to_numpy() for nombre in self._df.columns}
+
+    def dataframe(self):
+        """DataFrame con las mismas columnas (compartido, no se copia)."""
+        return self._df
+
+    def __len__(self):
+        return len(self._df)
+
+
+def _decodificar(crudo):
+    for codificacion in CODIFICACIONES:
+        try:
+            return crudo.decode(codificacion), codificacion
+        except UnicodeDecodeError:
+            continue
+    raise ValueError("No se pudo leer el encabezado con ninguna codificación conocida")
+
+
+def leer_csv(ruta_csv):
+    """
+    Lee un CSV de RecWay en una sola pasada.
+
+    Parámetros:
+        ruta_csv : str
+            Ruta al archivo CSV.
+
+    Retorna:
+        RegistroCSV con metadatos y columnas tipadas.
+    """
+    with open(ruta_csv, 'rb') as f:
+        crudo = f.read()
+
+    #se ubica la fila de nombres de columnas (primera línea que empieza con 'timestamp')
+    inicio = 0
+    encabezado = []
+    while inicio < len(crudo):
+        fin = crudo.find(b'\n', inicio)
+        if fin < 0:
+            fin = len(crudo)
+        linea = crudo[inicio:fin]
+        if linea.strip().startswith(b'timestamp'):
+            break
+        encabezado.append(linea)
+        inicio = fin + 1
+    else:
+        raise ValueError(f"No se encontró la línea de encabezado de datos en {ruta_csv}")
+
+    metadatos, lineas_encabezado, codificacion = _leer_encabezado(encabezado)
+
+    df = pd.read_csv(io.BytesIO(memoryview(crudo)[inicio:]), encoding=codificacion)
+    return RegistroCSV(ruta_csv, metadatos, lineas_encabezado, codificacion, df)
+
+
+def leer_csv_por_bloques(ruta_csv, columnas=None, invertir=False, filas_por_bloque=FILAS_POR_BLOQUE):
+    """
+    Lee un CSV de RecWay por bloques de filas, sin cargar el archivo completo.
+
+    Cada columna se arma con las partes de cada bloque y se libera parte por
+    parte, así la memoria necesaria es la de las columnas finales más un bloque.
+
+    Parámetros:
+        ruta_csv : str
+            Ruta al archivo CSV.
+        columnas : list[str] o None
+            Columnas a conservar (None = todas).
+        invertir : bool
+            Si es True las filas quedan en orden inverso al del archivo (la app
+            exporta de la muestra más reciente a la más antigua).
+        filas_por_bloque : int
+            Filas leídas por bloque.
+
+    Retorna:
+        RegistroCSV con índice 0..n-1; cada columna es un bloque propio del
+        DataFrame, así eliminar columnas libera su memoria.
+    """
+    with open(ruta_csv, 'rb') as f:
+        encabezado = []
+        for linea in f:
+            if linea.strip().startswith(b'timestamp'):
+                break
+            encabezado.append(linea.rstrip(b'\n'))
+        else:
+            raise ValueError(f"No se encontró la línea de encabezado de datos en {ruta_csv}")
+        f.seek(f.tell() - len(linea))
+
+        metadatos, lineas_encabezado, codificacion = _leer_encabezado(encabezado)
+
+        partes = {}
+        for bloque in pd.read_csv(f, usecols=columnas, chunksize=filas_por_bloque, encoding=codificacion):
+            for nombre in bloque.columns:
+                partes.setdefault(nombre, []).append(bloque[nombre].to_numpy(copy=True))
+            del bloque
+
+    datos = {}
+    for nombre in list(partes):
+        lista = partes.pop(nombre)
+        if invertir:
+            datos[nombre] = np.concatenate([parte[::-1] for parte in reversed(lista)])
+        else:
+            datos[nombre] = np.concatenate(lista)
+        del lista
+
+    df = pd.DataFrame(datos, copy=False)
+    return RegistroCSV(ruta_csv, metadatos, lineas_encabezado, codificacion, df)
+
+
+def _leer_encabezado(encabezado):
+    texto, codificacion = _decodificar(b'\n'.join(encabezado))
+    lineas_encabezado = texto.split('\n')
+
+    metadatos = {}
+    for linea in lineas_encabezado:
+        linea = linea.strip()
+        if linea.startswith("#") and ":" in linea:
+            clave, valor = linea.strip("# ").split(":", 1)
+            metadatos[clave.strip()] = valor.strip()
+    return metadatos, lineas_encabezado, codificacion
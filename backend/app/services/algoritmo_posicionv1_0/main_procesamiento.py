@@ -10,6 +10,15 @@ import math
 from . import algoritmos_posicinamiento as ap
 from . import algoritmos_busqueda as ab
 from . import algoritmos_senales as algs
+from . import cache_grafos as cg
+from . import formato_columnar as fc
+from . import manifiesto_tiles as mt
+from . import prefetch_tiles as pf
+from . import versiones_tiles as vt
+from . import procesamiento_tramos as pt
+from . import artefactos_etapas as ae
+from . import memoria_etapas as me
+from . import archivo_resultado as ar
 import json
 from scipy.signal import filtfilt,firwin,lfilter,welch
 from scipy.signal import resample
@@ -18,12 +27,57 @@ import joblib
 import time
 import pickle
 import argparse
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import traceback
 
 #variables base
 EARTH_R = 6371000.0
 
+#detección de huecos en un hilo en paralelo al matching: "auto" (solo con más de un núcleo,
+#con uno solo los dos hilos compiten por el GIL y el total empeora), "true" o "false"
+DETECCION_CONCURRENTE = os.getenv("PROCESAMIENTO_DETECCION_CONCURRENTE", "auto").lower()
+
+
+def deteccion_concurrente():
+    if DETECCION_CONCURRENTE == "auto":
+        try:
+            nucleos = len(os.sched_getaffinity(0))
+        except AttributeError:
+            nucleos = os.cpu_count() or 1
+        return nucleos > 1
+    return DETECCION_CONCURRENTE == "true"
+
+#modo de bajo consumo de memoria: lectura por bloques solo de las columnas usadas, sin copias
+#del DataFrame completo y con las etapas en serie (los tramos en paralelo copian datos a cada worker).
+#no parte el viaje: las columnas usadas y las señales a 25 Hz del viaje completo quedan en memoria,
+#así que el pico baja pero sigue creciendo con la duración (unos 15 MB por hora de viaje a 25 Hz,
+#más la cache de tiles). Partir en tramos no lo acota: el remuestreo es sobre la señal completa
+BAJA_MEMORIA = os.getenv("PROCESAMIENTO_BAJA_MEMORIA", "false").lower() == "true"
+#pico de memoria por etapa (tracemalloc) en el diagnóstico; tracemalloc hace varias veces
+#más lento el matching, así que es aparte del modo de bajo consumo y se usa para medir
+TRAZA_MEMORIA = os.getenv("PROCESAMIENTO_TRAZA_MEMORIA", "false").lower() == "true"
+
+#columnas del CSV que usa el procesamiento
+COLUMNAS_SENALES = ("acc_x", "acc_z", "gyro_x", "gyro_y")
+COLUMNAS_GPS = ("timestamp", "gps_lat", "gps_lng", "gps_speed", "gps_heading")
+COLUMNAS_PROCESAMIENTO = ("timestamp",) + COLUMNAS_SENALES + COLUMNAS_GPS[1:]
+
+
+def configurar_memoria(baja_memoria, traza=False):
+    """Activa el modo de bajo consumo y/o la traza de memoria del proceso."""
+    global BAJA_MEMORIA, TRAZA_MEMORIA
+    BAJA_MEMORIA = bool(baja_memoria)
+    TRAZA_MEMORIA = bool(traza)
+
+#versión de la lógica de procesamiento: se sube cuando cambian los resultados,
+#así la cache de resultados no devuelve salidas de una versión anterior
+VERSION_ALGORITMO = "1.0.0"
+
+#versión del código de cada etapa con artefacto intermedio: al cambiar una etapa
+#se sube su versión y solo se recalculan esa etapa y las que dependen de ella.
+#Las fórmulas de los índices (calcular_indices) no tienen artefacto y siempre se aplican
+VERSIONES_ETAPAS = {"senales": 1, "huecos": 1, "emparejamiento": 1, "espectros": 1}
+
 #clase con los datos de procesamiento 
 class DatosProcesamiento:
     def __init__(self):
@@ -52,6 +106,31 @@ class DatosProcesamiento:
         self.cambio_segmento = False #variable que indica cuando se cambio el segmento
         self.indice_subsegmento = 0
         self.segmento_maximo = 100
+        #contadores de diagnóstico del matching (se retornan con el resultado del archivo)
+        self.contadores = {
+            "muestras_procesadas": 0,
+            "dentro_corredor": 0,
+            "busquedas_vecinos": 0,
+            "candidatos_evaluados": 0,
+            "candidatos_puntuados": 0,
+            "busquedas_pesadas": 0,
+            "cambios_grafo": 0,
+            "aciertos_cache_grafo": 0,
+            "prefetch_solicitados": 0,
+        }
+        #tiempo acumulado (s) en cada rama del matching
+        self.tiempos = {
+            "carga_grafo": 0.0,
+            "primera_muestra": 0.0,
+            "dentro_corredor": 0.0,
+            "busqueda_vecinos": 0.0,
+            "busqueda_pesada": 0.0,
+            "subsegmentos": 0.0,
+            "segmento_corto": 0.0,
+        }
+        self.grafos_usados = []
+        #tramos en paralelo usados en el archivo (None si se procesó en serie)
+        self.tramos = None
         
 ###############################################################
 #-----------------SUB FUNCIONES MAIN -------------------------#
@@ -65,24 +144,94 @@ def adquirir_latitud_longitud(df_gps,datos,index_GPS):
     datos.heading = df_gps['gps_heading'].iloc[index_GPS]
 
 
+def cargar_tile_grafo(carpeta_grafos, carpeta_grafos_comprimidos, num_grafo):
+    """
+    Carga desde disco el grafo, el BallTree y la tabla mids/ids de un tile.
+    Si el tile existe en formato columnar se abre mapeado en memoria.
+
+    Retorna:
+        TileGrafo con el contenido del tile y su tamaño estimado en memoria.
+    """
+    if fc.existe_tile_columnar(carpeta_grafos, num_grafo):
+        return fc.cargar_tile_columnar(fc.ruta_tile_columnar(carpeta_grafos, num_grafo), num_grafo)
+
+    #las rutas salen del manifiesto; si el tile no está en él se busca en la carpeta
+    manifiesto = mt.cargar_manifiesto(carpeta_grafos)
+    ruta_grafo = manifiesto.ruta(num_grafo, 'grafo')
+    if ruta_grafo is None:
+        ruta_grafo = ap.buscar_archivos_por_prefijo(carpeta_grafos, 'segN' + str(num_grafo) + 'pos')[0]
+    ruta_tree = carpeta_grafos_comprimidos + '/balltree_model_N' + str(num_grafo) + ".pkl"
+    ruta_mids = carpeta_grafos_comprimidos + '/mids_ids_N' + str(num_grafo) + ".csv"
+
+    with open(ruta_grafo, "rb") as f:
+        G = pickle.load(f)
+
+    tree = joblib.load(ruta_tree)
+    datos_comprimidos_grafo = pd.read_csv(ruta_mids)
+    mids = datos_comprimidos_grafo[["lat_rad", "lon_rad"]].to_numpy().tolist()
+    ids = list(zip(datos_comprimidos_grafo["u"], datos_comprimidos_grafo["v"], datos_comprimidos_grafo["k"]))
+
+    tamano = cg.estimar_tamano_tile([ruta_grafo, ruta_tree, ruta_mids])
+    return cg.TileGrafo(num_grafo, G, tree, mids, ids, tamano)
+
+
+def estimar_tamano_tile(carpeta_grafos, num_grafo):
+    """
+    Estima la memoria que ocuparía un tile sin cargarlo.
+
+    Retorna:
+        int con el tamaño estimado en bytes, o None si el tile no está en el manifiesto.
+    """
+    if fc.existe_tile_columnar(carpeta_grafos, num_grafo):
+        ruta = fc.ruta_tile_columnar(carpeta_grafos, num_grafo)
+        return int(sum(os.path.getsize(os.path.join(ruta, a)) for a in os.listdir(ruta)) * fc.FACTOR_MEMORIA_MMAP)
+    manifiesto = mt.cargar_manifiesto(carpeta_grafos)
+    if manifiesto.entrada(num_grafo) is None:
+        return None
+    return cg.estimar_tamano_tile([manifiesto.ruta(num_grafo, a) for a in ('grafo', 'balltree', 'mids_ids')])
+
+
+def obtener_tile(carpeta_grafos, carpeta_grafos_comprimidos, num_grafo):
+    """
+    Retorna un tile desde la cache del proceso; solo se lee de disco si no está.
+
+    Retorna:
+        (tile, acierto) : tuple[TileGrafo, bool]
+    """
+    return cg.cache_global.obtener(
+        (carpeta_grafos, num_grafo),
+        lambda: cargar_tile_grafo(carpeta_grafos, carpeta_grafos_comprimidos, num_grafo)
+    )
+
+
 def procesamiento_mapa_simple(datos):
-    num_grafo = ap.determinar_grafo(datos.latitud, datos.longitud)
+    num_grafo = mt.resolver_grafo(datos.carpeta_grafos, datos.latitud, datos.longitud)
     if datos.numero_grafo != num_grafo:
-    
-        grafo_nombre = ap.buscar_archivos_por_prefijo(datos.carpeta_grafos, 'segN' + str(num_grafo) + 'pos')
-        datos.numero_grafo = num_grafo
-        with open(str(grafo_nombre[0]), "rb") as f:
-            datos.G = pickle.load(f)
+        t0 = time.perf_counter()
 
+        tile, acierto = obtener_tile(datos.carpeta_grafos, datos.carpeta_grafos_comprimidos, num_grafo)
+        datos.numero_grafo = num_grafo
+        datos.G = tile.G
         datos.G_exist = True
-        datos.tree = joblib.load(datos.carpeta_grafos_comprimidos + '/balltree_model_N' + str(num_grafo) + ".pkl")
-        datos_comprimidos_grafo = pd.read_csv(datos.carpeta_grafos_comprimidos + '/mids_ids_N' + str(num_grafo) + ".csv")
-        datos.mids = datos_comprimidos_grafo[["lat_rad", "lon_rad"]].to_numpy().tolist()
-        datos.ids = list(zip(datos_comprimidos_grafo["u"], datos_comprimidos_grafo["v"], datos_comprimidos_grafo["k"]))
+        datos.tree = tile.tree
+        datos.mids = tile.mids
+        datos.ids = tile.ids
+
+        datos.contadores["cambios_grafo"] += 1
+        if acierto:
+            datos.contadores["aciertos_cache_grafo"] += 1
+        datos.grafos_usados.append(num_grafo)
+        datos.tiempos["carga_grafo"] += time.perf_counter() - t0
+
+    #si el vehículo se acerca al borde del tile se precarga el siguiente en segundo plano
+    if pf.prefetcher_global.evaluar(datos, cargar_tile_grafo) is not None:
+        datos.contadores["prefetch_solicitados"] += 1
 
 
 def ubicar_muestra_grafov2(datos):
     datos.segmento_encontrado = False
+    datos.contadores["muestras_procesadas"] += 1
+    t0 = time.perf_counter()
     
     if not datos.primera_muestra:
 
@@ -111,6 +260,7 @@ def ubicar_muestra_grafov2(datos):
         datos.primera_muestra = True
         datos.segmento_encontrado = True
         datos.cambio_segmento = True
+        datos.tiempos["primera_muestra"] += time.perf_counter() - t0
 
 
         
@@ -134,6 +284,7 @@ def ubicar_muestra_grafov2(datos):
             datos.cambio_segmento = True
 
             #como el segmento no esta dentro, se extrae los segmentos cercanos
+            datos.contadores["busquedas_vecinos"] += 1
             segmentos_anexos = ap.caminos_hasta_distanciav2(datos.G,datos.id_edge[0],datos.id_edge[1],50)
 
             
@@ -146,6 +297,7 @@ def ubicar_muestra_grafov2(datos):
                 for j in range(len(segmentos_anexos[i])):
     
                     id_segmento = (segmentos_anexos[i][j][0],segmentos_anexos[i][j][1],0)
+                    datos.contadores["candidatos_evaluados"] += 1
                     info_segmento = datos.G.edges[id_segmento]
                     
                     #para ello se utiliza la función para extraer las coordenadas del segmento
@@ -177,6 +329,7 @@ def ubicar_muestra_grafov2(datos):
 
             #se va a cambiar la escala de los diversos
             mayor_peso = 0
+            datos.contadores["candidatos_puntuados"] += len(posibilidades_segmento)
             if(len(posibilidades_segmento) > 0):
                 for i in range(len(posibilidades_segmento)):
                     
@@ -213,15 +366,21 @@ def ubicar_muestra_grafov2(datos):
                         datos.coordenadas_segmento = posibilidades_segmento[i]['coordenadas']
                         datos.segmento_encontrado = True    
 
+            datos.tiempos["busqueda_vecinos"] += time.perf_counter() - t0
+
         #en caso que el segmento este adentro del anterior no se cambian los datos de la estructura        
         else:
             datos.segmento_encontrado = True
             datos.cambio_segmento = False
+            datos.contadores["dentro_corredor"] += 1
+            datos.tiempos["dentro_corredor"] += time.perf_counter() - t0
             
         #en caso que todos los proceso fueron incapaces de encontrar un segmento se utiliza la función pesada
         if not datos.segmento_encontrado:
             #trabajando aca 
             #
+            t1 = time.perf_counter()
+            datos.contadores["busquedas_pesadas"] += 1
             
             latr, lonr = math.radians(datos.latitud), math.radians(datos.longitud)
             radio_m = 300
@@ -252,6 +411,7 @@ def ubicar_muestra_grafov2(datos):
             datos.coordenadas_segmento = ap.obtener_coordenadas_segmento(datos.G,datos.id_edge,datos.info_edge)
             datos.primera_muestra = True
             datos.segmento_encontrado = True
+            datos.tiempos["busqueda_pesada"] += time.perf_counter() - t1
             
     #se guarda el registro del punto dentro del segmento
 
@@ -262,6 +422,7 @@ def colocar_puntos_grafo(datos,latitud,longitud):
     return resultado
 
 def segmentar_grafo(datos):
+    t0 = time.perf_counter()
         
     #se comprueba si el segmento es superior a los 60 metros
     if(datos.info_edge['length'] > datos.segmento_maximo):
@@ -322,6 +483,8 @@ def segmentar_grafo(datos):
                 datos.posicion_subsegmento = i
                 datos.coordenadas_subsegmento = lista_total[i]
                 break
+
+        datos.tiempos["subsegmentos"] += time.perf_counter() - t0
             
 
     else:
@@ -329,51 +492,113 @@ def segmentar_grafo(datos):
         datos.coordenadas_subsegmento = datos.coordenadas_segmento
         datos.longitud_subsegmento = datos.info_edge['length']
         datos.posicion_subsegmento = 0
+        datos.tiempos["segmento_corto"] += time.perf_counter() - t0
+
+
+def resumen_diagnostico(datos, nombre_archivo, tiempo_total, version_tiles=None):
+    """
+    Construye el resumen de diagnóstico del matching de un archivo a partir de
+    los contadores acumulados en la estructura de procesamiento.
+
+    Parámetros:
+        datos : DatosProcesamiento
+            Estructura usada durante el recorrido.
+        nombre_archivo : str
+            Nombre del CSV procesado.
+        tiempo_total : float
+            Tiempo total de procesamiento del archivo (s).
+        version_tiles : str
+            Versión del conjunto de tiles usada en el archivo.
+
+    Retorna:
+        dict con contadores, tiempos por rama (s), grafos usados y versiones de tiles y algoritmo.
+    """
+    muestras = datos.contadores["muestras_procesadas"]
+    return {
+        "archivo": nombre_archivo,
+        "tiempo_total": round(tiempo_total, 3),
+        "contadores": dict(datos.contadores),
+        "tiempos": {clave: round(valor, 4) for clave, valor in datos.tiempos.items()},
+        "tasa_corredor": (datos.contadores["dentro_corredor"] / muestras) if muestras else 0.0,
+        "grafos_usados": list(datos.grafos_usados),
+        "version_tiles": version_tiles,
+        "version_algoritmo": VERSION_ALGORITMO,
+        "cache_grafos": cg.cache_global.metricas(),
+        "prefetch": pf.prefetcher_global.metricas(),
+    }
 
 
 #se recorren la lista que tiene todas las condiciones
+class ResultadoProcesamiento:
+    """
+    Resultado en memoria de un archivo procesado.
+
+    segmentos tiene el mismo formato que el JSON de salida (lista de dicts), así
+    quien llama puede pasarlo directo a la base de datos sin releer el JSON.
+    """
+
+    def __init__(self, archivo, segmentos, diagnostico):
+        self.archivo = archivo
+        self.segmentos = segmentos
+        self.diagnostico = diagnostico
+
+    @property
+    def version_tiles(self):
+        return self.diagnostico["version_tiles"]
+
+    @property
+    def version_algoritmo(self):
+        return self.diagnostico["version_algoritmo"]
+
+    def __len__(self):
+        return len(self.segmentos)
+
+
 def procesar_archivos(dato,carpeta_csv,
                       carpeta_archivos_json,
                       carpeta_almacenamiento_json,
                       carpeta_almacenamiento_csv,
                       umbral,
-                      carpeta_grafos):
-
-    inicio = time.time()
-
-    contador_json = 1 
-    #se extrae la metadata del dispositivo y su dataframe de los datos
-    df,metadatos =  ap.cargar_csv_con_metadatos(carpeta_csv,dato)
+                      carpeta_grafos,
+                      guardar_json=True,
+                      mover_csv=True,
+                      hash_contenido=None):
+    """
+    Procesa un CSV y retorna un ResultadoProcesamiento.
+
+    Con guardar_json=False no se escriben los JSON de salida (el CSV igual se
+    mueve a procesados); quien llama los puede guardar después con
+    escribir_resultado_json. Con mover_csv=False el CSV queda donde está
+    (reprocesamiento de archivos ya procesados). hash_contenido es el SHA-256
+    del CSV si quien llama ya lo calculó (clave de los artefactos por etapa).
+    """
+    #el archivo se procesa completo con la versión de tiles actual al comenzar,
+    #aunque se active otra versión mientras tanto
+    with vt.usar_version(carpeta_grafos) as version, me.MedidorMemoria(TRAZA_MEMORIA) as medidor:
+        return procesar_archivos_version(dato, carpeta_csv, carpeta_archivos_json, carpeta_almacenamiento_json,
+                                         carpeta_almacenamiento_csv, umbral, version.carpeta, version.nombre,
+                                         guardar_json, mover_csv, medidor, hash_contenido)
+
+
+def preparar_senales(df, metadatos):
+    """
+    Remuestrea las señales inerciales a 25 Hz y les quita la media.
+
+    Parámetros:
+        df : pandas.DataFrame
+            Datos del CSV en orden cronológico.
+        metadatos : dict
+            Metadatos del CSV (frecuencia configurada, giroscopio disponible).
+
+    Retorna:
+        dict con la frecuencia original, la de trabajo, las señales sin media y
+        la partición en ventanas de 6 s usada por la detección de huecos.
+    """
     frecuencia_muestreo = int(metadatos["Sampling Rate Configured"][0:2])
     giroscopio_habilitado = False
     if(metadatos["Gyroscope Available"] == 'true'):
         giroscopio_habilitado = True
 
-    df = df.iloc[::-1].reset_index(drop=True)
-    
-    df_gps = ap.eliminar_muestras_gps_duplicadas(df)
-
-    df_gps = ap.ajustar_heading_y_filtrar(df_gps)
-
-    ######por ahora se deshabilita el filtro de velocidad para poder utilizar la muestra
-
-    df_gps = df_gps.reset_index(drop=True)
-
-    #df_gps = ap.filtrar_muestras_por_velocidad(df_gps,umbral)
-
-    
-    recortes_velocidad = algs.encontrar_segmentos_continuos(df_gps.index.tolist())
-
-
-    
-    indice_segmento_previo = 0
-    indice_anterior = 0
-    #se crea la estructura base para manejar el grafo
-    datos_mapa = DatosProcesamiento()
-    datos_mapa.carpeta_grafos = carpeta_grafos
-    datos_mapa.carpeta_grafos_comprimidos = carpeta_grafos
-    lista_recortes = []
-
     f_muestreo = 25
 
     if frecuencia_muestreo != f_muestreo:
@@ -390,25 +615,55 @@ def procesar_archivos(dato,carpeta_csv,
         wx = df['gyro_x'].to_numpy()
         wy = df['gyro_y'].to_numpy()
 
-    senal_pura_ax = ax - np.mean(ax)
-    senal_pura_wy = wy - np.mean(wy)
-    senal_pura_az  = az - np.mean(az)
-    senal_pura_wx = wx - np.mean(wx)
+    #las señales remuestreadas son arreglos propios y se centran en el sitio;
+    #sin remuestreo son vistas del DataFrame y la resta crea la copia
+    if frecuencia_muestreo != f_muestreo:
+        for senal in (ax, az, wx, wy):
+            senal -= np.mean(senal)
+    else:
+        ax, az, wx, wy = (senal - np.mean(senal) for senal in (ax, az, wx, wy))
 
     tiempo_muestra = 6
-    
     cantidad_segmentos_analizados = int(len(ax)/(tiempo_muestra*f_muestreo))
-    longitud_recorte = int(len(ax)/cantidad_segmentos_analizados)
-    listado_huecos = []
 
-    print("tiempo de preparación:",time.time()-inicio)
-    
-    for i in range(1,cantidad_segmentos_analizados+1):
+    return {
+        "frecuencia_muestreo": frecuencia_muestreo,
+        "f_muestreo": f_muestreo,
+        "giroscopio_habilitado": giroscopio_habilitado,
+        "ax": ax,
+        "wy": wy,
+        "az": az,
+        "wx": wx,
+        "tiempo_muestra": tiempo_muestra,
+        "cantidad_segmentos_analizados": cantidad_segmentos_analizados,
+        "longitud_recorte": int(len(ax)/cantidad_segmentos_analizados),
+    }
+
+
+def detectar_huecos(senal_ax, senal_wy, giroscopio_habilitado, longitud_recorte, cantidad_ventanas):
+    """
+    Detecta huecos con la wavelet en ventanas consecutivas de la señal.
+
+    Parámetros:
+        senal_ax, senal_wy : ndarray
+            Señales sin media; la ventana j es [longitud_recorte*j, longitud_recorte*(j+1)).
+        giroscopio_habilitado : bool
+            Si es True se combinan los huecos del giroscopio con los del acelerómetro.
+        longitud_recorte : int
+            Muestras por ventana.
+        cantidad_ventanas : int
+            Ventanas a analizar desde el inicio de las señales.
+
+    Retorna:
+        list[dict] con {"huecos": [...]} por ventana.
+    """
+    listado_huecos = []
+    for i in range(1,cantidad_ventanas+1):
         
-        senal_recortada_acelerometro = senal_pura_ax[longitud_recorte*(i-1):longitud_recorte*i]
+        senal_recortada_acelerometro = senal_ax[longitud_recorte*(i-1):longitud_recorte*i]
         huecos_acelerometro = algs.encontar_huecos_segmento(senal_recortada_acelerometro,25,1,10,3,2,1)
         if(giroscopio_habilitado):
-            senal_recortada_giroscopio = senal_pura_wy[longitud_recorte*(i-1):longitud_recorte*i]
+            senal_recortada_giroscopio = senal_wy[longitud_recorte*(i-1):longitud_recorte*i]
             huecos_giroscopio = algs.encontar_huecos_segmento(senal_recortada_giroscopio,25,1,10,3,2,1)
 
             for j in range(len(huecos_giroscopio)):
@@ -428,171 +683,316 @@ def procesar_archivos(dato,carpeta_csv,
             }
         
         listado_huecos.append(diccionario_hueco)
+    return listado_huecos
+
+
+def estado_emparejamiento(datos):
+    """
+    Estado del matching que determina el resultado de las muestras siguientes:
+    tile, arista actual y subsegmento. Dos recorridos con el mismo estado tras
+    una muestra producen los mismos cambios de segmento desde ahí en adelante.
+    """
+    coordenadas = datos.coordenadas_subsegmento
+    if coordenadas is not None:
+        coordenadas = tuple(tuple(punto) for punto in coordenadas)
+    return (datos.numero_grafo, datos.id_edge, datos.posicion_subsegmento, coordenadas)
+
+
+def orientar_arista_por_heading(datos):
+    """
+    Para arrancar el matching a mitad de un recorrido: la primera muestra se
+    ubica en la arista más cercana sin mirar el sentido, así que en vías de doble
+    sentido se toma la arista inversa si su rumbo se acerca más al heading.
+    """
+    u, v, k = datos.id_edge
+    if not datos.G.has_edge(v, u, k):
+        return
+    diferencia_actual = ap.diferencia_angular(ap.obtener_angulos_edge(datos.G,u,v)[0],datos.heading)
+    diferencia_inversa = ap.diferencia_angular(ap.obtener_angulos_edge(datos.G,v,u)[0],datos.heading)
+    if diferencia_inversa < diferencia_actual:
+        datos.id_edge = (v, u, k)
+        datos.info_edge = datos.G.edges[datos.id_edge]
+        datos.coordenadas_segmento = ap.obtener_coordenadas_segmento(datos.G,datos.id_edge,datos.info_edge)
 
-    print("tiempo de encontrar huecos:",time.time()-inicio)
 
-    for i in range(len(df_gps)):
+def emparejar_muestras(df_gps, datos_mapa, inicio, fin, registrar_estados=(), orientar_inicio=False):
+    """
+    Recorre las muestras GPS [inicio, fin) sobre el grafo y registra cada cambio de segmento.
+
+    Parámetros:
+        df_gps : pandas.DataFrame
+            Muestras GPS filtradas, en orden cronológico.
+        datos_mapa : DatosProcesamiento
+            Estructura del matching (se continúa desde su estado actual).
+        inicio, fin : int
+            Rango de muestras a recorrer.
+        registrar_estados : iterable de (desde, hasta)
+            Rangos de muestras en los que se guarda el estado del matching.
+        orientar_inicio : bool
+            Si es True la primera arista se orienta con el heading (arranque de un tramo).
+
+    Retorna:
+        (eventos, estados) : list[dict] con lo necesario para calcular los índices de
+        cada segmento, y dict muestra -> estado_emparejamiento.
+    """
+    eventos = []
+    estados = {}
+    for i in range(inicio, fin):
         
         adquirir_latitud_longitud(df_gps,datos_mapa,i)
         procesamiento_mapa_simple(datos_mapa)
         ubicar_muestra_grafov2(datos_mapa)
+        if orientar_inicio and i == inicio:
+            orientar_arista_por_heading(datos_mapa)
         segmentar_grafo(datos_mapa)
 
+        #se guarda la información en caso que se cambie el segmento
+        if datos_mapa.cambio_segmento:
+            eventos.append({
+                "i": i,
+                "hash": ap.hash_segmento(datos_mapa.id_edge[0],datos_mapa.id_edge[1],(datos_mapa.posicion_subsegmento*1000)+datos_mapa.id_edge[2]),
+                "nombre": datos_mapa.info_edge['name'] if 'name' in datos_mapa.info_edge else "Undefined",
+                "tipo_via": datos_mapa.info_edge["highway"],
+                "longitud_subsegmento": datos_mapa.longitud_subsegmento,
+                "coordenadas_subsegmento": datos_mapa.coordenadas_subsegmento,
+                "coordenadas_segmento": datos_mapa.coordenadas_segmento,
+            })
+
+        for desde, hasta in registrar_estados:
+            if desde <= i < hasta:
+                estados[i] = estado_emparejamiento(datos_mapa)
+                break
+    return eventos, estados
+
+
+def medir_segmentos(eventos, df, df_gps, senales, listado_huecos, recortes_velocidad):
+    """
+    Recorta las señales de cada segmento recorrido y calcula sus espectros
+    (PSD de az y wx), la energía de ax y los huecos proyectados sobre la vía.
+
+    Parámetros:
+        eventos : list[dict]
+            Cambios de segmento en orden (emparejar_muestras).
+        df : pandas.DataFrame
+            Datos completos del CSV en orden cronológico.
+        df_gps : pandas.DataFrame
+            Muestras GPS filtradas.
+        senales : dict
+            Resultado de preparar_senales.
+        listado_huecos : list[dict]
+            Huecos por ventana (detectar_huecos).
+        recortes_velocidad : list[tuple]
+            Intervalos continuos de muestras GPS.
+
+    Retorna:
+        list[dict] con las medidas de los segmentos que tienen muestras suficientes,
+        de las que calcular_indices obtiene los índices.
+    """
+    frecuencia_muestreo = senales["frecuencia_muestreo"]
+    f_muestreo = senales["f_muestreo"]
+    giroscopio_habilitado = senales["giroscopio_habilitado"]
+    senal_pura_ax = senales["ax"]
+    senal_pura_az = senales["az"]
+    senal_pura_wx = senales["wx"]
+    tiempo_muestra = senales["tiempo_muestra"]
+    longitud_recorte = senales["longitud_recorte"]
 
+    indice_segmento_previo = 0
+    indice_anterior = 0
+    medidas = []
+    for evento in eventos:
+        i = evento["i"]
+        longitud_subsegmento = evento["longitud_subsegmento"]
+
+        #se recorta de acuerdo a los segmentos de velocidad 
+        index_intervalo = ap.buscar_intervalo(df_gps.index[i],recortes_velocidad)
+        if(indice_segmento_previo < recortes_velocidad[index_intervalo][0]):
+            indice_anterior = recortes_velocidad[index_intervalo][0]
+        else:
+            indice_anterior = indice_segmento_previo
         
+        indice_segmento_previo = df_gps.index[i]
 
-        #se guarda la información en caso que se cambie el segmento
-        if datos_mapa.cambio_segmento:
-      
-            hash_segmento = ap.hash_segmento(datos_mapa.id_edge[0],datos_mapa.id_edge[1],(datos_mapa.posicion_subsegmento*1000)+datos_mapa.id_edge[2])
-            #se recorta de acuerdo a los segmentos de velocidad 
-
-            index_intervalo = ap.buscar_intervalo(df_gps.index[i],recortes_velocidad)
-            if(indice_segmento_previo < recortes_velocidad[index_intervalo][0]):
-                indice_anterior = recortes_velocidad[index_intervalo][0]
-            else:
-                indice_anterior = indice_segmento_previo
-            
-            indice_segmento_previo = df_gps.index[i]
+        indice_inicio_original = df_gps['index_original'].loc[indice_anterior]
+        indice_final_original = df_gps['index_original'].iloc[i]
 
-            indice_inicio_original = df_gps['index_original'].loc[indice_anterior]
-            indice_final_original = df_gps['index_original'].iloc[i]
+        #condición de minimas muestas para las muestras del segmento
+        if((indice_final_original - indice_inicio_original) > (64*(frecuencia_muestreo/f_muestreo))):
 
-            #condición de minimas muestas para las muestras del segmento
-            if((indice_final_original - indice_inicio_original) > (64*(frecuencia_muestreo/f_muestreo))):
+            df_base_recortado = df.iloc[indice_inicio_original:indice_final_original]
 
-                df_base_recortado = df.iloc[indice_inicio_original:indice_final_original]
+            prom_velocidad = np.mean(df_base_recortado['gps_speed'].to_numpy())
 
-                prom_velocidad = np.mean(df_base_recortado['gps_speed'].to_numpy())
-                
-            
-                if prom_velocidad > 5:
-                    multiplicacion_velocidad = (0.8453153406199 + 0.5658028957503j) * np.exp(-10 * np.pi * 1j / (prom_velocidad)) + (-0.5661842683643 - 1.9824881204756j)
-                else:
-                    multiplicacion_velocidad = 1
+            index_inicio = int((indice_inicio_original/frecuencia_muestreo)*f_muestreo)
+            index_final = int((indice_final_original/frecuencia_muestreo)*f_muestreo)
 
-                index_inicio = int((indice_inicio_original/frecuencia_muestreo)*f_muestreo)
-                index_final = int((indice_final_original/frecuencia_muestreo)*f_muestreo)
+            ax_recortado = senal_pura_ax[index_inicio:index_final] - np.mean(senal_pura_ax[index_inicio:index_final])
+            wx_recortado = senal_pura_wx[index_inicio:index_final] - np.mean(senal_pura_wx[index_inicio:index_final])
+            az_recortado = senal_pura_az[index_inicio:index_final] - np.mean(senal_pura_az[index_inicio:index_final])
 
-                ax_recortado = senal_pura_ax[index_inicio:index_final] - np.mean(senal_pura_ax[index_inicio:index_final])
-                wx_recortado = senal_pura_wx[index_inicio:index_final] - np.mean(senal_pura_wx[index_inicio:index_final])
-                az_recortado = senal_pura_az[index_inicio:index_final] - np.mean(senal_pura_az[index_inicio:index_final])
+            tiempo_segmento = (1/f_muestreo)*len(wx_recortado)
 
-                tiempo_segmento = (1/f_muestreo)*len(wx_recortado)
+            #se realiza la conversión de la PWELCH de los indices 
+            fvec, psd_az = welch(az_recortado,window="hamming",nperseg=64,noverlap=32,nfft=64,fs=f_muestreo,detrend=False)
+            psd_az_ajustada = psd_az*(fvec[1]-fvec[0])*(8*(len(az_recortado)**2))            
 
-                #se realiza la conversión de la PWELCH de los indices 
-                fvec, psd_az = welch(az_recortado,window="hamming",nperseg=64,noverlap=32,nfft=64,fs=f_muestreo,detrend=False)
-                psd_az_ajustada = psd_az*(fvec[1]-fvec[0])*(8*(len(az_recortado)**2))            
+            medida = {
+                "id" : evento["hash"],
+                "nombre": evento["nombre"],
+                "tipo_via": evento["tipo_via"],
+                "longitud_via" : longitud_subsegmento,
+                "punto_inicial" : i,
+                "tiempo" : ap.timestamp_a_iso8601(int(df_gps['timestamp'].iloc[i])),
+                "coordenadas_segmento" : evento["coordenadas_subsegmento"],
+                "prom_velocidad": prom_velocidad,
+                "tiempo_segmento": tiempo_segmento,
+                "fvec": fvec,
+                "psd_az_ajustada": psd_az_ajustada,
+                "energia_ax": np.sum(ax_recortado**2),
+                "muestras_ax": len(ax_recortado),
+            }
 
+            if(giroscopio_habilitado):
+                #se realiza la conversión de la PWELCH de los indices wx
+                fvec_wx, psd_wx = welch(wx_recortado,window="hamming",nperseg=64,noverlap=32,nfft=64,fs=f_muestreo,detrend=False) 
+                medida["fvec_wx"] = fvec_wx
+                medida["psd_wx_ajustada"] = psd_wx*(fvec_wx[1]-fvec_wx[0])*(8*(len(wx_recortado)**2))
+
+            #se realiza el analisis de tiempo para ver si hay huecos en el segmento.
+            posicion_segmento_inicial = int(index_inicio/longitud_recorte)
+            posicion_segmento_final = int(index_final/longitud_recorte)
+
+            listado_huecos_segmento = []
+            for j in range(posicion_segmento_inicial,posicion_segmento_final):
+                segmento_hueco_analizado = listado_huecos[j]
+                for k in range(len(segmento_hueco_analizado['huecos'])):
+                    numero_muestra = int(segmento_hueco_analizado['huecos'][k]['tiempo']*f_muestreo) + (j*f_muestreo*tiempo_muestra)
+                    if(index_inicio < numero_muestra and numero_muestra < index_final):
+                        latitud_hueco_bruto = df['gps_lat'].iloc[numero_muestra]
+                        longitud_hueco_bruto = df['gps_lng'].iloc[numero_muestra]
+                        velocidad_hueco = df['gps_speed'].iloc[numero_muestra]
+                        #el hueco se proyecta sobre el segmento en el que estaba el vehículo al cambiar de segmento
+                        (latitud_hueco,longitud_hueco) = ap.proyectar_segmento(evento["coordenadas_segmento"],latitud_hueco_bruto,longitud_hueco_bruto)
+                        hueco = {
+                            "latitud":latitud_hueco,
+                            "longitud":longitud_hueco,
+                            "magnitud" : segmento_hueco_analizado['huecos'][k]['valor'],
+                            "velocidad" : velocidad_hueco
+                        }
+                        listado_huecos_segmento.append(hueco)
+            medida["huecos"] = listado_huecos_segmento
 
-                #ajuste de indice az hasta 3 hz
-                vector_diferencia_maximo = np.abs(3 - fvec)
-                indice_superior = np.argmin(vector_diferencia_maximo) + 1
-                energia_az = np.sum(psd_az_ajustada[0:indice_superior])
-                
-                indice_az = energia_az/(tiempo_segmento*datos_mapa.longitud_subsegmento*np.abs(multiplicacion_velocidad))
-                
-      
-                #se ajusta el indice si se acerca a los indices
-                if indice_az < 2:
-                    indice_az = 2
-                if indice_az > 512:
-                    indice_az = -(1 / (indice_az**2)) + 600
+            medidas.append(medida)
+    return medidas
 
-                indice_az_ajustado = -0.0666 * (np.log2(indice_az) ** 2) + 0.0835 * (np.log2(indice_az)) + 4.91
 
-                indice_ax = (100*np.sum(ax_recortado**2))/(len(ax_recortado)*datos_mapa.longitud_subsegmento)
+def calcular_indices(medidas, giroscopio_habilitado):
+    """
+    Aplica las fórmulas de los índices (az, ax, wx, IRI, IQR) a las medidas
+    de cada segmento (medir_segmentos).
 
-                if indice_ax > 0.36:
-                    indice_ax = (-0.0072/indice_ax) + 0.38
+    Retorna:
+        list[dict] con un segmento por medida.
+    """
+    lista_recortes = []
+    for medida in medidas:
+        longitud_subsegmento = medida["longitud_via"]
+        prom_velocidad = medida["prom_velocidad"]
+        tiempo_segmento = medida["tiempo_segmento"]
+        fvec = medida["fvec"]
+        psd_az_ajustada = medida["psd_az_ajustada"]
+
+        if prom_velocidad > 5:
+            multiplicacion_velocidad = (0.8453153406199 + 0.5658028957503j) * np.exp(-10 * np.pi * 1j / (prom_velocidad)) + (-0.5661842683643 - 1.9824881204756j)
+        else:
+            multiplicacion_velocidad = 1
 
-                indice_ax_ajustado = -11.679*indice_ax + 4.4797
-                
-                numerator = (np.pi**2 * fvec**2)
-                denominator = (3*np.pi**4 * fvec**4 / 3265 - 69*np.pi**3 * 1j * fvec**3 / 3265 - 145159*np.pi**2 * fvec**2 / 130600 + 3*np.pi * 1j * fvec + 633/40)
-                resultado = np.abs(numerator / denominator)
-                
-                iri_desescalado = np.abs(np.sqrt(np.sum((resultado**2 * psd_az_ajustada) * (2*np.pi*fvec*1j)**4) / np.abs(multiplicacion_velocidad)) / (10000 * datos_mapa.longitud_subsegmento))
-                iri_escala_humana = 5.2*(-(1./(1+np.exp(-0.8*(iri_desescalado-4))))+1)
-
-                #se realiza el analisis de tiempo para ver si hay huecos en el segmento.
-                if(giroscopio_habilitado):
-                    #se realiza la conversión de la PWELCH de los indices wx
-                    fvec_wx, psd_wx = welch(wx_recortado,window="hamming",nperseg=64,noverlap=32,nfft=64,fs=f_muestreo,detrend=False) 
-                    psd_wx_ajustada = psd_wx*(fvec_wx[1]-fvec_wx[0])*(8*(len(wx_recortado)**2))
-                    vector_diferencia_maximo = np.abs(6 - fvec_wx)
-                    indice_superior = np.argmin(vector_diferencia_maximo) + 1
-                    energia_wx =  np.sum(psd_wx_ajustada[0:indice_superior])    
-                    indice_wx = energia_wx/(tiempo_segmento*datos_mapa.longitud_subsegmento)
+        #ajuste de indice az hasta 3 hz
+        vector_diferencia_maximo = np.abs(3 - fvec)
+        indice_superior = np.argmin(vector_diferencia_maximo) + 1
+        energia_az = np.sum(psd_az_ajustada[0:indice_superior])
+        
+        indice_az = energia_az/(tiempo_segmento*longitud_subsegmento*np.abs(multiplicacion_velocidad))
+        
+  
+        #se ajusta el indice si se acerca a los indices
+        if indice_az < 2:
+            indice_az = 2
+        if indice_az > 512:
+            indice_az = -(1 / (indice_az**2)) + 600
 
-                    
-                    #se ajusta el indice 
-                    if indice_wx > 8.57:
-                        indice_wx = -(1 / (indice_wx**3)) + 8.815
-                    
-                    indice_wx_ajustado = -0.0021*(np.log2(indice_wx)**3) - 0.0675*(np.log2(indice_wx)**2) - 0.6786*(np.log2(indice_wx)) + 2.8683
+        indice_az_ajustado = -0.0666 * (np.log2(indice_az) ** 2) + 0.0835 * (np.log2(indice_az)) + 4.91
 
-                    
+        indice_ax = (100*medida["energia_ax"])/(medida["muestras_ax"]*longitud_subsegmento)
 
-                    ibf = (indice_ax_ajustado+indice_wx_ajustado+indice_az_ajustado)/3
-                else:
-                    ibf = (indice_ax_ajustado+indice_az_ajustado)/2
-                    indice_wx_ajustado = np.nan
-                    indice_wx = np.nan
+        if indice_ax > 0.36:
+            indice_ax = (-0.0072/indice_ax) + 0.38
 
-                iqr = ((1 - 0.5 * (1 / ((0.5 * ibf**2) + 1))) * iri_escala_humana) + 0.5 * (ibf * (1 / ((0.5 * ibf**2) + 1)))
-                
-                posicion_segmento_inicial = int(index_inicio/longitud_recorte)
-                posicion_segmento_final = int(index_final/longitud_recorte)
-
-                listado_huecos_segmento = []
-                for j in range(posicion_segmento_inicial,posicion_segmento_final):
-                    segmento_hueco_analizado = listado_huecos[j]
-                    for k in range(len(segmento_hueco_analizado['huecos'])):
-                        numero_muestra = int(segmento_hueco_analizado['huecos'][k]['tiempo']*f_muestreo) + (j*f_muestreo*tiempo_muestra)
-                        if(index_inicio < numero_muestra and numero_muestra < index_final):
-                            latitud_hueco_bruto = df['gps_lat'].iloc[numero_muestra]
-                            longitud_hueco_bruto = df['gps_lng'].iloc[numero_muestra]
-                            velocidad_hueco = df['gps_speed'].iloc[numero_muestra]
-                            (latitud_hueco,longitud_hueco) = colocar_puntos_grafo(datos_mapa,latitud_hueco_bruto,longitud_hueco_bruto)
-                            hueco = {
-                                "latitud":latitud_hueco,
-                                "longitud":longitud_hueco,
-                                "magnitud" : segmento_hueco_analizado['huecos'][k]['valor'],
-                                "velocidad" : velocidad_hueco
-                            }
-                            listado_huecos_segmento.append(hueco)
-
-                if 'name' in datos_mapa.info_edge:
-                    nombre = datos_mapa.info_edge['name']
-                else:
-                    nombre = "Undefined"
-                segmento = {
-                    "id" : hash_segmento,
-                    "nombre": nombre,
-                    "tipo_via": datos_mapa.info_edge["highway"],
-                    "longitud_via" : datos_mapa.longitud_subsegmento,
-                    "punto_inicial" : i,
-                    "tiempo" : ap.timestamp_a_iso8601(int(df_gps['timestamp'].iloc[i])),
-                    "coordenadas_segmento" : datos_mapa.coordenadas_subsegmento,
-                    "huecos":listado_huecos_segmento,
-                    "az": indice_az,
-                    "az_ajustado": indice_az_ajustado,
-                    "wx": indice_wx,
-                    "wx_ajustado":indice_wx_ajustado,
-                    "iri" :iri_desescalado,
-                    "iri_ajustado": iri_escala_humana,
-                    "ax": indice_ax,
-                    "ax_ajustado": indice_ax_ajustado,
-                    "IQR": iqr
-                }
-                lista_recortes.append(segmento)
-    #en lista recortes se va a encontrar todos los segmentos que se especificaron en el recorrido
+        indice_ax_ajustado = -11.679*indice_ax + 4.4797
+        
+        numerator = (np.pi**2 * fvec**2)
+        denominator = (3*np.pi**4 * fvec**4 / 3265 - 69*np.pi**3 * 1j * fvec**3 / 3265 - 145159*np.pi**2 * fvec**2 / 130600 + 3*np.pi * 1j * fvec + 633/40)
+        resultado = np.abs(numerator / denominator)
+        
+        iri_desescalado = np.abs(np.sqrt(np.sum((resultado**2 * psd_az_ajustada) * (2*np.pi*fvec*1j)**4) / np.abs(multiplicacion_velocidad)) / (10000 * longitud_subsegmento))
+        iri_escala_humana = 5.2*(-(1./(1+np.exp(-0.8*(iri_desescalado-4))))+1)
 
-    print("tiempo de segmentar y encontrar indices:",time.time()-inicio)
-    #importante como esta es una versión prototipo para el sistema se tiene que tomar en cuenta que el recorte de velocidad
-    #puede recortar segmentos tomar en cuenta para el sistema final.
+        if(giroscopio_habilitado):
+            fvec_wx = medida["fvec_wx"]
+            psd_wx_ajustada = medida["psd_wx_ajustada"]
+            vector_diferencia_maximo = np.abs(6 - fvec_wx)
+            indice_superior = np.argmin(vector_diferencia_maximo) + 1
+            energia_wx =  np.sum(psd_wx_ajustada[0:indice_superior])    
+            indice_wx = energia_wx/(tiempo_segmento*longitud_subsegmento)
+
+            
+            #se ajusta el indice 
+            if indice_wx > 8.57:
+                indice_wx = -(1 / (indice_wx**3)) + 8.815
+            
+            indice_wx_ajustado = -0.0021*(np.log2(indice_wx)**3) - 0.0675*(np.log2(indice_wx)**2) - 0.6786*(np.log2(indice_wx)) + 2.8683
+
+            
+
+            ibf = (indice_ax_ajustado+indice_wx_ajustado+indice_az_ajustado)/3
+        else:
+            ibf = (indice_ax_ajustado+indice_az_ajustado)/2
+            indice_wx_ajustado = np.nan
+            indice_wx = np.nan
+
+        iqr = ((1 - 0.5 * (1 / ((0.5 * ibf**2) + 1))) * iri_escala_humana) + 0.5 * (ibf * (1 / ((0.5 * ibf**2) + 1)))
+
+        segmento = {
+            "id" : medida["id"],
+            "nombre": medida["nombre"],
+            "tipo_via": medida["tipo_via"],
+            "longitud_via" : longitud_subsegmento,
+            "punto_inicial" : medida["punto_inicial"],
+            "tiempo" : medida["tiempo"],
+            "coordenadas_segmento" : medida["coordenadas_segmento"],
+            "huecos": medida["huecos"],
+            "az": indice_az,
+            "az_ajustado": indice_az_ajustado,
+            "wx": indice_wx,
+            "wx_ajustado":indice_wx_ajustado,
+            "iri" :iri_desescalado,
+            "iri_ajustado": iri_escala_humana,
+            "ax": indice_ax,
+            "ax_ajustado": indice_ax_ajustado,
+            "IQR": iqr
+        }
+        lista_recortes.append(segmento)
+    return lista_recortes
+
+
+def calcular_indices_segmentos(eventos, df, df_gps, senales, listado_huecos, recortes_velocidad):
+    """Medidas y fórmulas de todos los segmentos en un solo paso (medir_segmentos + calcular_indices)."""
+    medidas = medir_segmentos(eventos, df, df_gps, senales, listado_huecos, recortes_velocidad)
+    return calcular_indices(medidas, senales["giroscopio_habilitado"])
 
+
+def construir_resultado_json(lista_recortes):
+    """Convierte los segmentos calculados al formato JSON de salida (lista de segmentos)."""
     resultado_json = []
     for i in range(len(lista_recortes)):
         lista_geometria = []
@@ -626,48 +1026,191 @@ def procesar_archivos(dato,carpeta_csv,
         }
 
         resultado_json.append(datos_obtenidos)
+    return resultado_json
+
+
+def escribir_resultado_json(resultado_json, dato, carpeta_archivos_json, carpeta_almacenamiento_json, contador_json=1,
+                            version_tiles=None):
+    """
+    Guarda el resultado rápido y el histórico del archivo en el formato
+    configurado en archivo_resultado (JSON legado o ndjson compacto). El ndjson
+    registra la versión del algoritmo y la de tiles usada en el archivo.
+    """
+    print("guardando los datos")
+    versiones = {"version_algoritmo": VERSION_ALGORITMO, "version_tiles": version_tiles}
+    return ar.escribir_resultado(resultado_json, dato, carpeta_archivos_json, carpeta_almacenamiento_json,
+                                 contador_json, versiones=versiones)
+
+
+def guardar_resultado_json(resultado_json, dato, carpeta_csv, carpeta_archivos_json,
+                           carpeta_almacenamiento_json, carpeta_almacenamiento_csv, contador_json=1,
+                           version_tiles=None):
+    """Guarda el JSON rápido y el histórico del archivo y mueve el CSV a procesados."""
+    escribir_resultado_json(resultado_json, dato, carpeta_archivos_json, carpeta_almacenamiento_json, contador_json,
+                            version_tiles)
+    ab.mover_archivo(carpeta_csv,carpeta_almacenamiento_csv,dato)
+
+
+def procesar_archivos_version(dato,carpeta_csv,
+                              carpeta_archivos_json,
+                              carpeta_almacenamiento_json,
+                              carpeta_almacenamiento_csv,
+                              umbral,
+                              carpeta_grafos,
+                              version_tiles,
+                              guardar_json=True,
+                              mover_csv=True,
+                              medidor=None,
+                              hash_contenido=None):
 
-    if(len (resultado_json) > 0):
-        print("guardando los datos")
-        # Usar carpeta actual si está vacía
-        if carpeta_archivos_json == "":
-            carpeta = "."
+    inicio = time.time()
+    medidor = medidor or me.MedidorMemoria(False)
+    baja_memoria = BAJA_MEMORIA
+
+    with medidor.etapa("lectura"):
+        #se extrae la metadata del dispositivo y su dataframe de los datos
+        if baja_memoria:
+            #solo las columnas que usa el procesamiento, leídas por bloques y ya en orden cronológico
+            df,metadatos = ap.cargar_csv_con_metadatos(carpeta_csv,dato,columnas=COLUMNAS_PROCESAMIENTO,invertir=True)
         else:
-            carpeta = carpeta_archivos_json
+            df,metadatos =  ap.cargar_csv_con_metadatos(carpeta_csv,dato)
+
+            df = df.iloc[::-1].reset_index(drop=True)
+
+        df_gps = ap.eliminar_muestras_gps_duplicadas(df, columnas=COLUMNAS_GPS if baja_memoria else None)
+
+        df_gps = ap.ajustar_heading_y_filtrar(df_gps, en_sitio=True)
 
-        # Crear carpeta si no existe
-        os.makedirs(carpeta, exist_ok=True)
+        ######por ahora se deshabilita el filtro de velocidad para poder utilizar la muestra
 
-        # Construir ruta del archivo
-        ruta_archivo = os.path.join(carpeta, 'datos' + str(contador_json) + '.json')
+        df_gps.reset_index(drop=True, inplace=True)
 
-        # Guardar el archivo
-        with open(ruta_archivo, 'w', encoding='utf-8') as archivo:
-            json.dump(resultado_json, archivo, indent=2)
+        #df_gps = ap.filtrar_muestras_por_velocidad(df_gps,umbral)
+
+    
+    recortes_velocidad = algs.encontrar_segmentos_continuos(df_gps.index.tolist())
+
+    #se crea la estructura base para manejar el grafo
+    datos_mapa = DatosProcesamiento()
+    datos_mapa.carpeta_grafos = carpeta_grafos
+    datos_mapa.carpeta_grafos_comprimidos = carpeta_grafos
 
-        # Usar carpeta actual si está vacía
-        if carpeta_almacenamiento_json == "":
-            carpeta = "."
+    #las salidas de cada etapa se reutilizan si su versión no cambió (ver artefactos_etapas)
+    artefactos = ae.ArtefactosArchivo(os.path.join(carpeta_csv, dato), VERSIONES_ETAPAS, version_tiles,
+                                      hash_csv=hash_contenido)
+
+    with medidor.etapa("senales"):
+        senales = artefactos.obtener("senales", lambda: preparar_senales(df, metadatos))
+        if baja_memoria:
+            #las señales ya están remuestreadas; del CSV solo quedan las columnas GPS
+            df.drop(columns=list(COLUMNAS_SENALES), inplace=True)
+
+    print("tiempo de preparación:",time.time()-inicio)
+
+    listado_huecos = artefactos.cargar("huecos")
+    emparejamiento = artefactos.cargar("emparejamiento")
+
+    #los tramos en paralelo y el hilo de detección duplican datos entre procesos y
+    #mezclan las etapas, así que en bajo consumo o con traza de memoria todo va en serie
+    etapas_en_serie = baja_memoria or medidor.habilitado
+
+    #los recorridos largos se parten en tramos con solape que se procesan en paralelo
+    if listado_huecos is None and emparejamiento is None and not etapas_en_serie:
+        por_tramos = pt.procesar_por_tramos(df_gps, senales, carpeta_grafos, datos_mapa)
+        if por_tramos is not None:
+            listado_huecos, eventos = por_tramos
+            artefactos.guardar("huecos", listado_huecos)
+            emparejamiento = {"eventos": eventos, "grafos_usados": list(datos_mapa.grafos_usados)}
+            artefactos.guardar("emparejamiento", emparejamiento)
+            print("tiempo de encontrar huecos y segmentar por tramos:",time.time()-inicio)
+
+    #la detección de huecos (numpy, libera el GIL) corre en un hilo mientras el matching
+    #recorre las muestras GPS; las dos etapas se juntan recién al calcular los índices
+    hilo_deteccion = None
+    futuro_huecos = None
+    if listado_huecos is None:
+        argumentos_deteccion = (senales["ax"], senales["wy"], senales["giroscopio_habilitado"],
+                                senales["longitud_recorte"], senales["cantidad_segmentos_analizados"])
+        if emparejamiento is None and not etapas_en_serie and deteccion_concurrente():
+            hilo_deteccion = ThreadPoolExecutor(max_workers=1, thread_name_prefix="deteccion-huecos")
+            futuro_huecos = hilo_deteccion.submit(detectar_huecos, *argumentos_deteccion)
         else:
-            carpeta = carpeta_almacenamiento_json
+            with medidor.etapa("huecos"):
+                listado_huecos = detectar_huecos(*argumentos_deteccion)
+            artefactos.guardar("huecos", listado_huecos)
+            print("tiempo de encontrar huecos:",time.time()-inicio)
+
+    try:
+        if emparejamiento is None:
+            with medidor.etapa("emparejamiento"):
+                eventos, _ = emparejar_muestras(df_gps, datos_mapa, 0, len(df_gps))
+            emparejamiento = {"eventos": eventos, "grafos_usados": list(datos_mapa.grafos_usados)}
+            artefactos.guardar("emparejamiento", emparejamiento)
+            print("tiempo de matching:",time.time()-inicio)
+        else:
+            for grafo in emparejamiento["grafos_usados"]:
+                if grafo not in datos_mapa.grafos_usados:
+                    datos_mapa.grafos_usados.append(grafo)
+
+        if futuro_huecos is not None:
+            listado_huecos = futuro_huecos.result()
+            artefactos.guardar("huecos", listado_huecos)
+            print("tiempo de encontrar huecos (en paralelo al matching):",time.time()-inicio)
+    finally:
+        if hilo_deteccion is not None:
+            hilo_deteccion.shutdown(wait=True)
+
+    with medidor.etapa("espectros"):
+        medidas = artefactos.obtener("espectros", lambda: medir_segmentos(emparejamiento["eventos"], df, df_gps, senales,
+                                                                          listado_huecos, recortes_velocidad))
+    with medidor.etapa("indices"):
+        lista_recortes = calcular_indices(medidas, senales["giroscopio_habilitado"])
+    #en lista recortes se va a encontrar todos los segmentos que se especificaron en el recorrido
 
-        # Crear carpeta si no existe
-        os.makedirs(carpeta, exist_ok=True)
+    print("tiempo de segmentar y encontrar indices:",time.time()-inicio)
+    #importante como esta es una versión prototipo para el sistema se tiene que tomar en cuenta que el recorte de velocidad
+    #puede recortar segmentos tomar en cuenta para el sistema final.
 
-        # Construir ruta del archivo
-        ruta_archivo = os.path.join(carpeta, 'datos' + dato[:-4] + 'save.json')
-        with open(ruta_archivo, 'w', encoding='utf-8') as archivo:
-            json.dump(resultado_json, archivo, indent=2)
-        contador_json +=1
+    with medidor.etapa("resultado"):
+        resultado_json = construir_resultado_json(lista_recortes)
 
-        ab.mover_archivo(carpeta_csv,carpeta_almacenamiento_csv,dato)
+    if(len (resultado_json) > 0):
+        if guardar_json and mover_csv:
+            guardar_resultado_json(resultado_json, dato, carpeta_csv, carpeta_archivos_json,
+                                   carpeta_almacenamiento_json, carpeta_almacenamiento_csv,
+                                   version_tiles=version_tiles)
+        elif guardar_json:
+            escribir_resultado_json(resultado_json, dato, carpeta_archivos_json, carpeta_almacenamiento_json,
+                                    version_tiles=version_tiles)
+        elif mover_csv:
+            ab.mover_archivo(carpeta_csv,carpeta_almacenamiento_csv,dato)
+
+    diagnostico = resumen_diagnostico(datos_mapa, dato, time.time()-inicio, version_tiles)
+    diagnostico["tramos"] = datos_mapa.tramos
+    diagnostico["muestras_csv"] = len(df)
+    artefactos.recortar()
+    diagnostico["artefactos"] = artefactos.resumen()
+    diagnostico["memoria"] = medidor.resumen()
+    diagnostico["baja_memoria"] = baja_memoria
+    print("diagnóstico de matching:", json.dumps(diagnostico))
     
-    return 0,0
+    return ResultadoProcesamiento(dato, resultado_json, diagnostico)
     
 ###############################################################
 #-----------------       MAIN        -------------------------#
 
 
+def inicializar_worker_serie():
+    """
+    Inicializador de los workers del pool de archivos: cada archivo va en serie
+    dentro de su worker (sin abrir otro pool de procesos para los tramos).
+
+    Retorna:
+        None
+    """
+    pt.TRAMOS_WORKERS = 1
+
+
 def main():
     ap_entrada = argparse.ArgumentParser(description="Pipeline híbrido ultra-optimizado")
     ap_entrada.add_argument("--carpeta_csv", default="", help="Carpeta con CSVs a procesar")
@@ -693,8 +1236,12 @@ def main():
     #se extrae la lista de los archivos que cumplen con las condiciones del prefijo
     archivos = ab.buscar_archivos_por_nombre(carpeta_csv,prefijo_busqueda)
 
+    #con varios archivos en paralelo los tramos de un viaje largo van en serie para no
+    #multiplicar los procesos (workers × pool de tramos); con un solo worker se paralelizan
+    inicializador = inicializar_worker_serie if workers > 1 else None
+
     try:
-        with ProcessPoolExecutor(max_workers=workers) as ex:
+        with ProcessPoolExecutor(max_workers=workers, initializer=inicializador) as ex:
             futs = [
                 ex.submit(
                     procesar_archivos,
@@ -707,10 +1254,13 @@ def main():
             archivos_procesados = 0
             for fut in as_completed(futs):
                 try:
-                    ruta, n = fut.result()
-                    total_seg += n
+                    resultado = fut.result()
+                    diagnostico = resultado.diagnostico
+                    total_seg += len(resultado)
                     archivos_procesados += 1
                     print(f"   📋 Progreso: {archivos_procesados}/{len(archivos)} archivos completados")
+                    print(f"   🔎 {diagnostico['archivo']}: {diagnostico['contadores']['muestras_procesadas']} muestras, "
+                          f"{diagnostico['contadores']['busquedas_pesadas']} búsquedas pesadas, {diagnostico['tiempo_total']}s")
                 except Exception as e:
                     print("⚠️  Tarea fallida:")
                     traceback.print_exception(type(e), e, e.__traceback__)
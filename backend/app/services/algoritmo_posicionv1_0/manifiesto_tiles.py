@@ -0,0 +1,288 @@
+"""
+Manifiesto de tiles de grafo e índice espacial para resolver punto -> tile.
+
+El manifiesto (`manifest.json` dentro de la carpeta de grafos) se genera en la
+carpeta de cada despliegue (no se versiona) y lista, por tile, las rutas de sus archivos, la celda que cubre y la extensión
+del grafo (leída del nombre `segN<id>pos<latI>&<latD>&<lonI>&<lonD>.pkl`).
+Sobre las celdas se construye un R-tree en memoria: un punto se resuelve al
+tile de menor área cuya celda lo contiene, lo que admite tilings no uniformes
+(celdas densas partidas en cuadrantes por el constructor de tiles).
+
+Estructura del manifiesto:
+
+    {
+      "version": 2,
+      "huella": "<sha1 de los nombres segN*.pkl de la carpeta>",
+      "tiles": [
+        {"id": 816, "grafo": "segN816pos...pkl", "balltree": "balltree_model_N816.pkl",
+         "mids_ids": "mids_ids_N816.csv", "celda": [lat_min, lat_max, lon_min, lon_max],
+         "extension": [lat_min, lat_max, lon_min, lon_max]},
+        ...
+      ]
+    }
+
+Las rutas son relativas a la carpeta de grafos. Al cargarlo se compara la huella
+con los segN*.pkl presentes: si se agregaron, quitaron o renombraron tiles (o el
+manifiesto es de otra versión) se regenera, así un tile nuevo nunca queda fuera
+del R-tree. En memoria se vuelve a verificar cuando cambia el mtime de la carpeta.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from rtree import index as rtree_index
+
+from . import algoritmos_posicinamiento as ap
+
+VERSION_MANIFIESTO = 2
+NOMBRE_MANIFIESTO = "manifest.json"
+
+
+def normalizar_id(id_tile):
+    """Los tiles de la grilla uniforme se identifican con enteros, el resto con texto."""
+    texto = str(id_tile)
+    return int(texto) if texto.isdigit() else texto
+
+
+def limites_celda(id_tile):
+    """
+    Límites (lat_min, lat_max, lon_min, lon_max) de la celda de un tile.
+
+    Los tiles de la grilla uniforme se identifican con su número. Los tiles
+    partidos por el constructor llevan el número de la celda base seguido de
+    'q' y un dígito de cuadrante por nivel (0 = NO, 1 = NE, 2 = SO, 3 = SE),
+    por ejemplo '695q03'.
+    """
+    texto = str(id_tile)
+    base, _, cuadrantes = texto.partition("q")
+    lat_min, lat_max, lon_min, lon_max = ap.limites_celda_grafo(int(base))
+    for cuadrante in cuadrantes:
+        if cuadrante not in "0123":
+            raise ValueError(f"cuadrante inválido en el tile {texto}")
+        lat_medio = (lat_min + lat_max) / 2
+        lon_medio = (lon_min + lon_max) / 2
+        if cuadrante in "01":
+            lat_min = lat_medio
+        else:
+            lat_max = lat_medio
+        if cuadrante in "02":
+            lon_max = lon_medio
+        else:
+            lon_min = lon_medio
+    return lat_min, lat_max, lon_min, lon_max
+
+
+def _extension_desde_nombre(nombre):
+    #segN<id>pos<latI>&<latD>&<lonI>&<lonD>.pkl -> (lat_min, lat_max, lon_min, lon_max)
+    coordenadas = nombre[nombre.find("pos") + 3:-len(".pkl")].split("&")
+    if len(coordenadas) != 4:
+        return None
+    lat_izquierda, lat_derecha, lon_izquierda, lon_derecha = (float(c) for c in coordenadas)
+    return [min(lat_izquierda, lat_derecha), max(lat_izquierda, lat_derecha),
+            min(lon_izquierda, lon_derecha), max(lon_izquierda, lon_derecha)]
+
+
+def _es_archivo_grafo(nombre):
+    return nombre.startswith("segN") and nombre.endswith(".pkl") and "pos" in nombre
+
+
+def _archivos_grafo(carpeta_grafos):
+    return sorted(n for n in os.listdir(carpeta_grafos) if _es_archivo_grafo(n))
+
+
+def _huella(nombres):
+    return hashlib.sha1("\n".join(nombres).encode("utf-8")).hexdigest()
+
+
+def huella_carpeta(carpeta_grafos):
+    """
+    Huella del conjunto de tiles de la carpeta: sha1 de los nombres segN*.pkl
+    ordenados (el nombre lleva el id y la extensión del grafo).
+    """
+    return _huella(_archivos_grafo(carpeta_grafos))
+
+
+def _mtime_carpeta(carpeta_grafos):
+    try:
+        return os.stat(carpeta_grafos).st_mtime_ns
+    except OSError:
+        return None
+
+
+def generar_manifiesto(carpeta_grafos, guardar=True):
+    """
+    Recorre la carpeta de grafos una sola vez y arma el manifiesto de tiles.
+
+    Parámetros:
+        carpeta_grafos : str
+            Carpeta con los archivos segN*.pkl, balltree_model_N*.pkl y mids_ids_N*.csv.
+        guardar : bool
+            Si es True se escribe `manifest.json` en la carpeta.
+
+    Retorna:
+        dict con el contenido del manifiesto.
+    """
+    tiles = []
+    nombres = _archivos_grafo(carpeta_grafos)
+    for nombre in nombres:
+        id_tile = normalizar_id(nombre[4:nombre.find("pos")])
+        extension = _extension_desde_nombre(nombre)
+        try:
+            celda = list(limites_celda(id_tile))
+        except ValueError:
+            print(f"tile {nombre} con identificador no reconocido, se omite del manifiesto")
+            continue
+        tiles.append({
+            "id": id_tile,
+            "grafo": nombre,
+            "balltree": "balltree_model_N" + str(id_tile) + ".pkl",
+            "mids_ids": "mids_ids_N" + str(id_tile) + ".csv",
+            "celda": celda,
+            "extension": extension,
+        })
+
+    manifiesto = {"version": VERSION_MANIFIESTO, "huella": _huella(nombres), "tiles": tiles}
+    if guardar:
+        escribir_manifiesto(carpeta_grafos, manifiesto)
+    return manifiesto
+
+
+def escribir_manifiesto(carpeta_grafos, manifiesto):
+    """Escribe el manifiesto de forma atómica (archivo temporal + os.replace)."""
+    ruta = os.path.join(carpeta_grafos, NOMBRE_MANIFIESTO)
+    temporal = ruta + ".tmp"
+    try:
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(manifiesto, f, indent=2)
+        os.replace(temporal, ruta)
+    except OSError as e:
+        #una carpeta de solo lectura no impide usar el manifiesto en memoria
+        print(f"no se pudo guardar el manifiesto en {ruta}: {e}")
+    invalidar_manifiesto(carpeta_grafos)
+
+
+class ManifiestoTiles:
+    """Manifiesto cargado en memoria con un R-tree sobre las celdas de los tiles."""
+
+    def __init__(self, carpeta_grafos, manifiesto):
+        self.carpeta_grafos = carpeta_grafos
+        self.tiles = [dict(t, id=normalizar_id(t["id"])) for t in manifiesto.get("tiles", [])]
+        self._por_id = {t["id"]: t for t in self.tiles}
+        #el R-tree trabaja en (x, y) = (lon, lat)
+        self._indice = rtree_index.Index(
+            ((i, (t["celda"][2], t["celda"][0], t["celda"][3], t["celda"][1]), None) for i, t in enumerate(self.tiles))
+        ) if self.tiles else None
+
+    def ids(self):
+        return [t["id"] for t in self.tiles]
+
+    def entrada(self, id_tile):
+        return self._por_id.get(normalizar_id(id_tile))
+
+    def ruta(self, id_tile, archivo):
+        """Ruta absoluta de un archivo ('grafo', 'balltree', 'mids_ids') de un tile, o None."""
+        entrada = self.entrada(id_tile)
+        if entrada is None or not entrada.get(archivo):
+            return None
+        return os.path.join(self.carpeta_grafos, entrada[archivo])
+
+    def resolver(self, latitud, longitud):
+        """
+        Retorna el id del tile de menor área cuya celda contiene el punto, o None.
+
+        Los bordes siguen la misma convención que determinar_grafo: la celda
+        incluye su latitud máxima y su longitud mínima.
+        """
+        if self._indice is None:
+            return None
+        mejor = None
+        mejor_area = None
+        for i in self._indice.intersection((longitud, latitud, longitud, latitud)):
+            lat_min, lat_max, lon_min, lon_max = self.tiles[i]["celda"]
+            if not (lat_min < latitud <= lat_max and lon_min <= longitud < lon_max):
+                continue
+            area = (lat_max - lat_min) * (lon_max - lon_min)
+            if mejor_area is None or area < mejor_area:
+                mejor, mejor_area = self.tiles[i]["id"], area
+        return mejor
+
+
+_manifiestos = {}
+_lock_manifiestos = threading.Lock()
+
+
+def _leer_vigente(carpeta_grafos):
+    #contenido de manifest.json si corresponde a los tiles de la carpeta, si no None
+    ruta = os.path.join(carpeta_grafos, NOMBRE_MANIFIESTO)
+    if not os.path.isfile(ruta):
+        return None
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            contenido = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"manifiesto ilegible en {ruta}, se regenera: {e}")
+        return None
+    if contenido.get("version") != VERSION_MANIFIESTO or contenido.get("huella") != huella_carpeta(carpeta_grafos):
+        print(f"manifiesto desactualizado en {carpeta_grafos}, se regenera")
+        return None
+    return contenido
+
+
+def cargar_manifiesto(carpeta_grafos):
+    """
+    Retorna el manifiesto de la carpeta (cacheado por proceso). Si la carpeta no
+    tiene `manifest.json` o el que tiene no corresponde a sus tiles, se genera en
+    ese momento.
+    """
+    clave = os.path.abspath(carpeta_grafos)
+    mtime = _mtime_carpeta(carpeta_grafos)
+    with _lock_manifiestos:
+        cacheado = _manifiestos.get(clave)
+    if cacheado is not None and cacheado[1] == mtime:
+        return cacheado[0]
+
+    contenido = _leer_vigente(carpeta_grafos)
+    if contenido is None:
+        contenido = generar_manifiesto(carpeta_grafos)
+
+    manifiesto = ManifiestoTiles(carpeta_grafos, contenido)
+    with _lock_manifiestos:
+        #el mtime se toma después de escribir manifest.json (que también lo cambia)
+        _manifiestos[clave] = (manifiesto, _mtime_carpeta(carpeta_grafos))
+    return manifiesto
+
+
+def invalidar_manifiesto(carpeta_grafos):
+    """Descarta el manifiesto cacheado de la carpeta para que se relea en el próximo uso."""
+    with _lock_manifiestos:
+        _manifiestos.pop(os.path.abspath(carpeta_grafos), None)
+
+
+def resolver_grafo(carpeta_grafos, latitud, longitud):
+    """
+    Resuelve el tile de un punto con el manifiesto de la carpeta. Si ningún tile
+    lo contiene se usa la grilla uniforme (determinar_grafo).
+    """
+    id_tile = cargar_manifiesto(carpeta_grafos).resolver(latitud, longitud)
+    if id_tile is None:
+        return ap.determinar_grafo(latitud, longitud)
+    return id_tile
+
+
+###############################################################
+#-----------------       MAIN        -------------------------#
+
+def main():
+    import argparse
+
+    entrada = argparse.ArgumentParser(description="Genera el manifiesto de tiles de una carpeta de grafos")
+    entrada.add_argument("--carpeta_grafos", required=True, help="Carpeta con segN*.pkl, balltree y mids_ids")
+    args = entrada.parse_args()
+
+    manifiesto = generar_manifiesto(args.carpeta_grafos)
+    print(f"manifiesto con {len(manifiesto['tiles'])} tiles -> {os.path.join(args.carpeta_grafos, NOMBRE_MANIFIESTO)}")
+
+
+if __name__ == "__main__":
+    main()
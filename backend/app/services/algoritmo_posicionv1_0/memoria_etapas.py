@@ -0,0 +1,101 @@
+"""
+Pico de memoria por etapa del procesamiento con tracemalloc.
+
+tracemalloc registra las asignaciones de Python y de numpy (los arreglos de
+pandas incluidos). Cada etapa reinicia el pico y al terminar guarda:
+
+    pico_mb     memoria máxima en uso durante la etapa
+    final_mb    memoria en uso al terminar la etapa
+    delta_mb    diferencia entre el pico y la memoria al comenzar la etapa
+
+La medición es por proceso: si varios archivos se procesan a la vez en hilos
+del mismo proceso sus etapas se mezclan. tracemalloc hace más lentas las
+asignaciones de Python, por eso solo se activa cuando se pide.
+"""
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+MB = 1024 * 1024
+
+#cantidad de medidores activos; tracemalloc se detiene cuando termina el último
+_lock = threading.Lock()
+_activos = 0
+_iniciado_aqui = False
+
+
+def _iniciar():
+    global _activos, _iniciado_aqui
+    with _lock:
+        if _activos == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _iniciado_aqui = True
+        _activos += 1
+
+
+def _detener():
+    global _activos, _iniciado_aqui
+    with _lock:
+        _activos -= 1
+        if _activos == 0 and _iniciado_aqui:
+            tracemalloc.stop()
+            _iniciado_aqui = False
+
+
+class MedidorMemoria:
+    """
+    Medidor de un archivo. Deshabilitado no mide nada y `etapa` no tiene costo.
+
+    Uso:
+        medidor = MedidorMemoria(True)
+        with medidor:
+            with medidor.etapa("lectura"):
+                ...
+        medidor.resumen()
+    """
+
+    def __init__(self, habilitado):
+        self.habilitado = habilitado
+        self.etapas = {}
+        self._activo = False
+
+    def __enter__(self):
+        if self.habilitado:
+            _iniciar()
+            self._activo = True
+        return self
+
+    def __exit__(self, *exc):
+        if self._activo:
+            self._activo = False
+            _detener()
+        return False
+
+    @contextmanager
+    def etapa(self, nombre):
+        if not self._activo:
+            yield
+            return
+        tracemalloc.reset_peak()
+        inicial, _ = tracemalloc.get_traced_memory()
+        inicio = time.time()
+        try:
+            yield
+        finally:
+            final, pico = tracemalloc.get_traced_memory()
+            self.etapas[nombre] = {
+                "pico_mb": round(pico / MB, 2),
+                "final_mb": round(final / MB, 2),
+                "delta_mb": round((pico - inicial) / MB, 2),
+                "segundos": round(time.time() - inicio, 3),
+            }
+
+    def resumen(self):
+        if not self.habilitado:
+            return {"habilitado": False}
+        return {
+            "habilitado": True,
+            "pico_mb": max((e["pico_mb"] for e in self.etapas.values()), default=0.0),
+            "etapas": dict(self.etapas),
+        }
@@ -0,0 +1,152 @@
+"""
+Precarga de tiles vecinos según la trayectoria del vehículo.
+
+Cuando un viaje cruza el borde de un tile, el matching se detiene mientras
+procesamiento_mapa_simple carga el siguiente tile de disco. El prefetcher
+proyecta la posición actual con el heading y la velocidad; si el punto
+proyectado cae en otro tile (el vehículo está a menos de la distancia
+configurada de un borde y va hacia él), ese tile se carga en un hilo de fondo
+dentro de la cache del proceso, de modo que el cruce termina siendo un acierto.
+"""
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import cache_grafos as cg
+from . import manifiesto_tiles as mt
+
+EARTH_R = 6371000.0
+
+#distancia (m) al borde a partir de la cual se precarga el tile siguiente
+DISTANCIA_PREFETCH_DEFECTO = float(os.getenv("GRAPH_PREFETCH_DISTANCE_M", "1500"))
+
+#horizonte (s) de proyección: a alta velocidad se mira más lejos que la distancia fija
+HORIZONTE_PREFETCH_DEFECTO = float(os.getenv("GRAPH_PREFETCH_HORIZON_S", "60"))
+
+PREFETCH_HABILITADO_DEFECTO = os.getenv("GRAPH_PREFETCH_ENABLED", "true").lower() == "true"
+
+
+def proyectar_posicion(latitud, longitud, heading, distancia_m):
+    """
+    Proyecta una posición sobre la esfera siguiendo un rumbo.
+
+    Parámetros:
+        latitud, longitud : float
+            Posición actual en grados.
+        heading : float
+            Rumbo en grados desde el norte, en sentido horario.
+        distancia_m : float
+            Distancia a recorrer en metros.
+
+    Retorna:
+        (latitud, longitud) proyectadas en grados.
+    """
+    lat1 = math.radians(latitud)
+    lon1 = math.radians(longitud)
+    rumbo = math.radians(heading)
+    delta = distancia_m / EARTH_R
+    lat2 = math.asin(math.sin(lat1) * math.cos(delta) + math.cos(lat1) * math.sin(delta) * math.cos(rumbo))
+    lon2 = lon1 + math.atan2(math.sin(rumbo) * math.sin(delta) * math.cos(lat1),
+                             math.cos(delta) - math.sin(lat1) * math.sin(lat2))
+    return math.degrees(lat2), math.degrees(lon2)
+
+
+class PrefetcherTiles:
+    """
+    Precarga en segundo plano el tile hacia el que se dirige el vehículo.
+
+    Usa un único hilo de fondo por proceso; las solicitudes de un tile que ya
+    está en la cache o que ya se está cargando se descartan.
+    """
+
+    def __init__(self, cache, distancia_m=DISTANCIA_PREFETCH_DEFECTO,
+                 horizonte_s=HORIZONTE_PREFETCH_DEFECTO, habilitado=PREFETCH_HABILITADO_DEFECTO):
+        self.cache = cache
+        self.distancia_m = float(distancia_m)
+        self.horizonte_s = float(horizonte_s)
+        self.habilitado = habilitado
+        self._pendientes = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self.solicitados = 0
+        self.completados = 0
+        self.errores = 0
+
+    def configurar(self, distancia_m=None, horizonte_s=None, habilitado=None):
+        if distancia_m is not None:
+            self.distancia_m = float(distancia_m)
+        if horizonte_s is not None:
+            self.horizonte_s = float(horizonte_s)
+        if habilitado is not None:
+            self.habilitado = habilitado
+
+    def evaluar(self, datos, cargador):
+        """
+        Revisa la posición actual y solicita la precarga del tile siguiente si corresponde.
+
+        Parámetros:
+            datos : DatosProcesamiento
+                Estructura del matching (posición, heading, velocidad y tile actual).
+            cargador : callable
+                cargador(carpeta_grafos, carpeta_grafos_comprimidos, num_grafo) -> TileGrafo.
+
+        Retorna:
+            id del tile solicitado, o None si no se solicitó nada.
+        """
+        if not self.habilitado or datos.numero_grafo is None:
+            return None
+        if datos.heading is None or datos.velocidad is None:
+            return None
+        heading = float(datos.heading)
+        velocidad = float(datos.velocidad)
+        if math.isnan(heading) or math.isnan(velocidad):
+            return None
+
+        distancia = max(self.distancia_m, velocidad * self.horizonte_s)
+        latitud, longitud = proyectar_posicion(datos.latitud, datos.longitud, heading, distancia)
+        siguiente = mt.cargar_manifiesto(datos.carpeta_grafos).resolver(latitud, longitud)
+        if siguiente is None or siguiente == datos.numero_grafo:
+            return None
+
+        clave = (datos.carpeta_grafos, siguiente)
+        with self._lock:
+            if clave in self._pendientes or self.cache.contiene(clave):
+                return None
+            self._pendientes.add(clave)
+            self.solicitados += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch_tiles")
+
+        carpeta_grafos = datos.carpeta_grafos
+        carpeta_comprimidos = datos.carpeta_grafos_comprimidos
+        self._executor.submit(self._precargar, clave, lambda: cargador(carpeta_grafos, carpeta_comprimidos, siguiente))
+        return siguiente
+
+    def _precargar(self, clave, cargador):
+        try:
+            self.cache.obtener(clave, cargador)
+            with self._lock:
+                self.completados += 1
+        except Exception as e:
+            with self._lock:
+                self.errores += 1
+            print(f"error precargando tile {clave[-1]}: {e}")
+        finally:
+            with self._lock:
+                self._pendientes.discard(clave)
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "habilitado": self.habilitado,
+                "distancia_m": self.distancia_m,
+                "solicitados": self.solicitados,
+                "completados": self.completados,
+                "errores": self.errores,
+                "pendientes": len(self._pendientes),
+            }
+
+
+#prefetcher del proceso, comparte la cache global de tiles
+prefetcher_global = PrefetcherTiles(cg.cache_global)
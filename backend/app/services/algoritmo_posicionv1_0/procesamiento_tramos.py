@@ -0,0 +1,247 @@
+"""
+Procesamiento de recorridos largos por tramos en paralelo.
+
+Un recorrido de horas se procesa completo en un solo núcleo. Aquí se parte en
+tramos de tiempo que se procesan en procesos separados:
+
+- Detección de huecos: las ventanas de 6 s son independientes, cada proceso
+  analiza un bloque de ventanas y los resultados se concatenan.
+- Matching: cada tramo arranca un poco antes de su inicio (solape) para que el
+  matching converja. En la zona de solape entre dos tramos se comparan los
+  estados del matching (tile, arista, subsegmento) muestra a muestra; en la
+  primera muestra en que coinciden los dos recorridos son idénticos desde ahí,
+  así que se toman los cambios de segmento del tramo anterior hasta esa muestra
+  y los del siguiente después de ella.
+- Si en algún solape los estados no coinciden, el archivo se procesa en serie:
+  el resultado siempre es el mismo que el del procesamiento serial.
+
+El cálculo de índices por segmento se hace después de unir los tramos, porque
+el inicio de cada segmento depende del cambio de segmento anterior ya unido.
+
+Cuando ya hay un pool de archivos (main con --workers > 1, el pool del servicio o
+el reprocesamiento masivo) sus workers fijan TRAMOS_WORKERS = 1 para no anidar pools.
+
+Variables de entorno:
+    PROCESAMIENTO_TRAMOS_WORKERS   procesos para los tramos (0 = núcleos disponibles, máx. 4; 1 = serie)
+    PROCESAMIENTO_TRAMOS_MIN_S     duración mínima del recorrido para partirlo (s)
+    PROCESAMIENTO_TRAMOS_SOLAPE_S  solape entre tramos (s)
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from . import main_procesamiento as mp
+
+TRAMOS_WORKERS = int(os.getenv("PROCESAMIENTO_TRAMOS_WORKERS", "0"))
+TRAMOS_MIN_S = float(os.getenv("PROCESAMIENTO_TRAMOS_MIN_S", "1200"))
+TRAMOS_SOLAPE_S = float(os.getenv("PROCESAMIENTO_TRAMOS_SOLAPE_S", "120"))
+
+#un tramo debe cubrir al menos dos solapes para que las zonas de unión no se crucen
+TRAMOS_MAX_AUTOMATICO = 4
+
+
+def cantidad_workers():
+    if TRAMOS_WORKERS > 0:
+        return TRAMOS_WORKERS
+    try:
+        nucleos = len(os.sched_getaffinity(0))
+    except AttributeError:
+        nucleos = os.cpu_count() or 1
+    return min(TRAMOS_MAX_AUTOMATICO, nucleos)
+
+
+def planificar_tramos(timestamps_ms, cantidad, solape_s):
+    """
+    Parte las muestras GPS en tramos de igual duración con solape.
+
+    Parámetros:
+        timestamps_ms : ndarray
+            Timestamps de las muestras GPS en orden cronológico (ms).
+        cantidad : int
+            Tramos deseados.
+        solape_s : float
+            Solape (s) antes y después de cada corte.
+
+    Retorna:
+        list[dict] con "inicio", "fin" (muestras a recorrer) y las zonas de unión
+        con el tramo anterior y el siguiente ("union_anterior", "union_siguiente"
+        como (desde, hasta) o None), o [] si el recorrido es muy corto para partirlo.
+    """
+    n = len(timestamps_ms)
+    t0, t1 = float(timestamps_ms[0]), float(timestamps_ms[-1])
+    solape_ms = solape_s * 1000.0
+    #cada tramo debe ser más largo que las dos zonas de unión que lo tocan
+    cantidad = min(cantidad, int((t1 - t0) // (4 * solape_ms)))
+    if cantidad < 2:
+        return []
+
+    cortes = [int(np.searchsorted(timestamps_ms, t0 + (t1 - t0) * k / cantidad)) for k in range(1, cantidad)]
+    zonas = [(int(np.searchsorted(timestamps_ms, timestamps_ms[c] - solape_ms)),
+              int(np.searchsorted(timestamps_ms, timestamps_ms[c] + solape_ms))) for c in cortes]
+
+    tramos = []
+    for k in range(cantidad):
+        inicio = 0 if k == 0 else zonas[k - 1][0]
+        fin = n if k == cantidad - 1 else zonas[k][1]
+        tramos.append({
+            "inicio": inicio,
+            "fin": fin,
+            "union_anterior": None if k == 0 else zonas[k - 1],
+            "union_siguiente": None if k == cantidad - 1 else zonas[k],
+        })
+    return tramos
+
+
+def unir_tramos(resultados, tramos):
+    """
+    Une los cambios de segmento de los tramos en la primera muestra de cada
+    zona de unión en la que los estados del matching coinciden.
+
+    Retorna:
+        (eventos, cortes) o None si algún par de tramos no converge.
+    """
+    eventos = []
+    cortes = []
+    ultimo = -1
+    for k in range(len(tramos)):
+        if k + 1 < len(tramos):
+            desde, hasta = tramos[k]["union_siguiente"]
+            estados_actual = resultados[k]["estados"]
+            estados_siguiente = resultados[k + 1]["estados"]
+            corte = next((i for i in range(desde, hasta)
+                          if i in estados_actual and estados_actual[i] == estados_siguiente.get(i)), None)
+            if corte is None or corte <= ultimo:
+                return None
+        else:
+            corte = tramos[k]["fin"]
+        eventos.extend(e for e in resultados[k]["eventos"] if ultimo < e["i"] <= corte)
+        cortes.append(corte)
+        ultimo = corte
+    return eventos, cortes[:-1]
+
+
+###############################################################
+#-----------------  FUNCIONES DE LOS WORKERS  ----------------#
+
+def _detectar_bloque(senal_ax, senal_wy, giroscopio_habilitado, longitud_recorte, cantidad_ventanas):
+    return mp.detectar_huecos(senal_ax, senal_wy, giroscopio_habilitado, longitud_recorte, cantidad_ventanas)
+
+
+def _emparejar_tramo(df_gps, carpeta_grafos, tramo):
+    datos = mp.DatosProcesamiento()
+    datos.carpeta_grafos = carpeta_grafos
+    datos.carpeta_grafos_comprimidos = carpeta_grafos
+    zonas = [z for z in (tramo["union_anterior"], tramo["union_siguiente"]) if z is not None]
+    eventos, estados = mp.emparejar_muestras(df_gps, datos, tramo["inicio"], tramo["fin"], zonas,
+                                             orientar_inicio=tramo["union_anterior"] is not None)
+    return {
+        "eventos": eventos,
+        "estados": estados,
+        "contadores": datos.contadores,
+        "tiempos": datos.tiempos,
+        "grafos_usados": datos.grafos_usados,
+    }
+
+
+###############################################################
+#-----------------   PROCESO PRINCIPAL   ---------------------#
+
+_executor = None
+_lock_executor = threading.Lock()
+
+
+def _obtener_executor(workers):
+    #los procesos persisten entre archivos y conservan su cache de tiles y de núcleos wavelet
+    global _executor
+    with _lock_executor:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def _descartar_executor(executor):
+    global _executor
+    with _lock_executor:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def procesar_por_tramos(df_gps, senales, carpeta_grafos, datos_mapa):
+    """
+    Detección de huecos y matching de un recorrido largo en tramos paralelos.
+
+    Parámetros:
+        df_gps : pandas.DataFrame
+            Muestras GPS filtradas, en orden cronológico.
+        senales : dict
+            Resultado de preparar_senales.
+        carpeta_grafos : str
+            Carpeta de la versión de tiles del archivo.
+        datos_mapa : DatosProcesamiento
+            Recibe los contadores, tiempos y grafos usados de todos los tramos
+            y el resumen de la partición en `tramos`.
+
+    Retorna:
+        (listado_huecos, eventos) o None si el recorrido se debe procesar en serie.
+    """
+    workers = cantidad_workers()
+    timestamps = df_gps['timestamp'].to_numpy(dtype=np.float64)
+    if workers < 2 or len(timestamps) < 2 or (timestamps[-1] - timestamps[0]) / 1000.0 < TRAMOS_MIN_S:
+        return None
+    tramos = planificar_tramos(timestamps, workers, TRAMOS_SOLAPE_S)
+    if not tramos:
+        return None
+
+    inicio = time.perf_counter()
+    executor = _obtener_executor(workers)
+    try:
+        futuros_matching = [executor.submit(_emparejar_tramo, df_gps, carpeta_grafos, tramo) for tramo in tramos]
+
+        #las ventanas de detección se reparten en bloques contiguos
+        ventanas = senales["cantidad_segmentos_analizados"]
+        longitud = senales["longitud_recorte"]
+        limites = np.linspace(0, ventanas, len(tramos) + 1).astype(int)
+        futuros_huecos = []
+        for desde, hasta in zip(limites[:-1], limites[1:]):
+            futuros_huecos.append(executor.submit(
+                _detectar_bloque,
+                senales["ax"][longitud * desde:longitud * hasta],
+                senales["wy"][longitud * desde:longitud * hasta],
+                senales["giroscopio_habilitado"], longitud, int(hasta - desde),
+            ))
+
+        resultados = [f.result() for f in futuros_matching]
+        listado_huecos = [ventana for f in futuros_huecos for ventana in f.result()]
+    except Exception as e:
+        print(f"procesamiento por tramos fallido, se procesa en serie: {e}")
+        _descartar_executor(executor)
+        return None
+
+    union = unir_tramos(resultados, tramos)
+    if union is None:
+        print("los tramos no convergen en el solape, se procesa en serie")
+        datos_mapa.tramos = {"cantidad": len(tramos), "convergencia": False}
+        return None
+    eventos, cortes = union
+
+    for resultado in resultados:
+        for clave, valor in resultado["contadores"].items():
+            datos_mapa.contadores[clave] += valor
+        for clave, valor in resultado["tiempos"].items():
+            datos_mapa.tiempos[clave] += valor
+        for grafo in resultado["grafos_usados"]:
+            if grafo not in datos_mapa.grafos_usados:
+                datos_mapa.grafos_usados.append(grafo)
+    datos_mapa.tramos = {
+        "cantidad": len(tramos),
+        "convergencia": True,
+        "rangos": [(t["inicio"], t["fin"]) for t in tramos],
+        "cortes": cortes,
+        "tiempo": round(time.perf_counter() - inicio, 3),
+    }
+    return listado_huecos, eventos
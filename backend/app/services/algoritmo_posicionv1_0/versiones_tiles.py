@@ -0,0 +1,243 @@
+"""
+Versiones de conjuntos de tiles con cambio atómico.
+
+Reemplazar los archivos de la carpeta de grafos mientras un worker está
+deserializando un tile deja el proceso leyendo archivos a medio escribir. Con
+versiones, cada conjunto de tiles vive en su propia carpeta inmutable y un
+archivo puntero indica cuál es la actual:
+
+    grafos_archivos6/
+        CURRENT                  <- nombre de la versión actual (os.replace)
+        versions/
+            2024-06-01/          <- segN*.pkl, balltree, mids_ids, manifest.json
+            2024-07-15/
+        segN*.pkl ...            <- versión "base" (carpeta plana heredada)
+
+Cada trabajo toma la versión actual al comenzar y la conserva hasta terminar,
+por lo que activar otra versión solo afecta a los trabajos nuevos. Cuando una
+versión deja de ser la actual y ningún trabajo del proceso la usa, sus tiles se
+desalojan de la cache y su manifiesto se descarta.
+
+Uso por línea de comandos:
+
+    python -m app.services.algoritmo_posicionv1_0.versiones_tiles --carpeta_grafos grafos_archivos6 listar
+    python -m app.services.algoritmo_posicionv1_0.versiones_tiles --carpeta_grafos grafos_archivos6 activar 2024-07-15
+"""
+import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from . import cache_grafos as cg
+from . import manifiesto_tiles as mt
+
+NOMBRE_PUNTERO = "CURRENT"
+CARPETA_VERSIONES = "versions"
+
+#versión implícita cuando la carpeta de grafos no tiene versiones (archivos planos)
+VERSION_BASE = "base"
+
+VersionTiles = namedtuple("VersionTiles", ["nombre", "carpeta"])
+
+
+def carpeta_version(carpeta_grafos, nombre):
+    """Carpeta de una versión; la versión base es la propia carpeta de grafos."""
+    if nombre == VERSION_BASE:
+        return carpeta_grafos
+    return os.path.join(carpeta_grafos, CARPETA_VERSIONES, nombre)
+
+
+def _validar_nombre(nombre):
+    if not nombre or nombre in (".", "..") or os.sep in nombre or (os.altsep and os.altsep in nombre):
+        raise ValueError(f"nombre de versión inválido: {nombre!r}")
+
+
+def _tiene_tiles(carpeta):
+    try:
+        return any(n.startswith("segN") and n.endswith(".pkl") for n in os.listdir(carpeta))
+    except OSError:
+        return False
+
+
+def resolver_version(carpeta_grafos):
+    """
+    Lee el puntero de la carpeta de grafos y retorna la versión actual.
+
+    Si no hay puntero, o apunta a una versión inexistente, se usa la versión
+    base (la carpeta plana), que es el comportamiento previo a las versiones.
+
+    Retorna:
+        VersionTiles(nombre, carpeta)
+    """
+    ruta_puntero = os.path.join(carpeta_grafos, NOMBRE_PUNTERO)
+    try:
+        with open(ruta_puntero, "r", encoding="utf-8") as f:
+            nombre = f.read().strip()
+    except FileNotFoundError:
+        return VersionTiles(VERSION_BASE, carpeta_grafos)
+
+    if nombre and nombre != VERSION_BASE:
+        carpeta = carpeta_version(carpeta_grafos, nombre)
+        if os.path.isdir(carpeta):
+            return VersionTiles(nombre, carpeta)
+        print(f"la versión de tiles {nombre} no existe en {carpeta_grafos}, se usa la versión base")
+    return VersionTiles(VERSION_BASE, carpeta_grafos)
+
+
+def listar_versiones(carpeta_grafos):
+    """
+    Lista las versiones disponibles en la carpeta de grafos.
+
+    Retorna:
+        list[dict] con nombre, carpeta, si es la actual y trabajos que la usan en este proceso.
+    """
+    actual = resolver_version(carpeta_grafos).nombre
+    nombres = []
+    if _tiene_tiles(carpeta_grafos):
+        nombres.append(VERSION_BASE)
+    raiz_versiones = os.path.join(carpeta_grafos, CARPETA_VERSIONES)
+    if os.path.isdir(raiz_versiones):
+        nombres.extend(sorted(n for n in os.listdir(raiz_versiones) if os.path.isdir(os.path.join(raiz_versiones, n))))
+
+    return [{
+        "nombre": nombre,
+        "carpeta": carpeta_version(carpeta_grafos, nombre),
+        "actual": nombre == actual,
+        "en_uso": registro_versiones.referencias(carpeta_grafos, nombre),
+    } for nombre in nombres]
+
+
+def activar_version(carpeta_grafos, nombre):
+    """
+    Cambia la versión actual de forma atómica (archivo temporal + os.replace).
+
+    La versión debe existir y tener tiles. Si no trae manifest.json se genera
+    antes de publicarla, para que ningún trabajo lo genere a medias.
+
+    Retorna:
+        VersionTiles activada.
+    """
+    _validar_nombre(nombre)
+    carpeta = carpeta_version(carpeta_grafos, nombre)
+    if not _tiene_tiles(carpeta):
+        raise FileNotFoundError(f"la versión {nombre} no tiene tiles en {carpeta}")
+    if not os.path.isfile(os.path.join(carpeta, mt.NOMBRE_MANIFIESTO)):
+        mt.generar_manifiesto(carpeta)
+
+    ruta_puntero = os.path.join(carpeta_grafos, NOMBRE_PUNTERO)
+    temporal = ruta_puntero + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(nombre + "\n")
+    os.replace(temporal, ruta_puntero)
+
+    #la versión anterior se retira en cuanto ningún trabajo de este proceso la use
+    registro_versiones.retirar_inactivas(carpeta_grafos)
+    return VersionTiles(nombre, carpeta)
+
+
+class RegistroVersiones:
+    """
+    Cuenta, por proceso, cuántos trabajos usan cada versión de tiles y retira
+    de la cache las versiones que ya no son la actual ni tienen trabajos.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._lock = threading.Lock()
+        self._referencias = {}
+        #versiones que pasaron por este proceso y pueden tener tiles en cache
+        self._vistas = set()
+        self.retiradas = 0
+
+    def adquirir(self, carpeta_grafos):
+        version = resolver_version(carpeta_grafos)
+        clave = (os.path.abspath(carpeta_grafos), version.nombre)
+        with self._lock:
+            self._referencias[clave] = self._referencias.get(clave, 0) + 1
+            self._vistas.add(clave)
+        #otro proceso pudo haber activado una versión nueva desde el último trabajo
+        self.retirar_inactivas(carpeta_grafos)
+        return version
+
+    def liberar(self, carpeta_grafos, version):
+        clave = (os.path.abspath(carpeta_grafos), version.nombre)
+        with self._lock:
+            restantes = self._referencias.get(clave, 0) - 1
+            if restantes > 0:
+                self._referencias[clave] = restantes
+            else:
+                self._referencias.pop(clave, None)
+        if restantes <= 0:
+            self.retirar_inactivas(carpeta_grafos)
+
+    def referencias(self, carpeta_grafos, nombre):
+        with self._lock:
+            return self._referencias.get((os.path.abspath(carpeta_grafos), nombre), 0)
+
+    def retirar_inactivas(self, carpeta_grafos):
+        """Desaloja los tiles y manifiestos de las versiones no actuales sin trabajos."""
+        raiz = os.path.abspath(carpeta_grafos)
+        actual = resolver_version(carpeta_grafos).nombre
+        with self._lock:
+            inactivas = [clave for clave in self._vistas
+                         if clave[0] == raiz and clave[1] != actual and clave not in self._referencias]
+            for clave in inactivas:
+                self._vistas.discard(clave)
+        for _, nombre in inactivas:
+            carpeta = carpeta_version(carpeta_grafos, nombre)
+            liberados = self.cache.desalojar_carpeta(carpeta)
+            mt.invalidar_manifiesto(carpeta)
+            self.retiradas += 1
+            print(f"versión de tiles {nombre} retirada: {liberados} tiles desalojados")
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "en_uso": {f"{os.path.basename(raiz)}:{nombre}": n for (raiz, nombre), n in self._referencias.items()},
+                "retiradas": self.retiradas,
+            }
+
+
+registro_versiones = RegistroVersiones(cg.cache_global)
+
+
+@contextmanager
+def usar_version(carpeta_grafos):
+    """
+    Toma la versión actual durante un trabajo y la libera al terminar.
+
+    Ejemplo:
+        with usar_version(carpeta_grafos) as version:
+            procesar(version.carpeta)
+    """
+    version = registro_versiones.adquirir(carpeta_grafos)
+    try:
+        yield version
+    finally:
+        registro_versiones.liberar(carpeta_grafos, version)
+
+
+###############################################################
+#-----------------       MAIN        -------------------------#
+
+def main():
+    import argparse
+
+    entrada = argparse.ArgumentParser(description="Lista o activa versiones de tiles de una carpeta de grafos")
+    entrada.add_argument("--carpeta_grafos", required=True, help="Carpeta raíz de grafos (con versions/ y CURRENT)")
+    acciones = entrada.add_subparsers(dest="accion", required=True)
+    acciones.add_parser("listar", help="Lista las versiones disponibles")
+    activar = acciones.add_parser("activar", help="Activa una versión para los trabajos nuevos")
+    activar.add_argument("version", help="Nombre de la carpeta dentro de versions/ (o 'base')")
+    args = entrada.parse_args()
+
+    if args.accion == "activar":
+        version = activar_version(args.carpeta_grafos, args.version)
+        print(f"versión actual: {version.nombre} ({version.carpeta})")
+    else:
+        for v in listar_versiones(args.carpeta_grafos):
+            print(("* " if v["actual"] else "  ") + v["nombre"] + "  " + v["carpeta"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Vista previa rápida de un recorrido.
+
+Resultado aproximado por segmento en pocos segundos, para mostrar algo
+mientras el procesamiento completo sigue en cola:
+
+- Matching sobre las muestras GPS diezmadas por distancia (una cada
+  `distancia_m` metros recorridos) en lugar de todas.
+- Sin remuestreo, sin wavelet (no se detectan huecos) y sin PSD: por segmento
+  solo se calculan el índice de energía de ax (misma fórmula que el
+  procesamiento completo) y el RMS de az y ax sobre las muestras crudas.
+
+Los segmentos pueden diferir de los del procesamiento completo (el matching
+con menos muestras puede saltarse segmentos cortos); el resultado completo
+reemplaza a la vista previa cuando termina.
+"""
+import time
+
+import numpy as np
+
+from . import algoritmos_posicinamiento as ap
+from . import lector_csv as lc
+from . import main_procesamiento as mp
+from . import versiones_tiles as vt
+
+#distancia recorrida (m) entre muestras GPS usadas en la vista previa
+DISTANCIA_DECIMACION_M = 25.0
+
+
+def decimar_por_distancia(df_gps, distancia_m):
+    """
+    Conserva una muestra GPS cada `distancia_m` metros recorridos.
+
+    Parámetros:
+        df_gps : pandas.DataFrame
+            Muestras GPS en orden cronológico (gps_lat, gps_lng).
+        distancia_m : float
+            Distancia mínima recorrida entre muestras conservadas.
+
+    Retorna:
+        pandas.DataFrame con las muestras conservadas (la primera y la última
+        siempre) e índice 0..n-1.
+    """
+    if len(df_gps) < 3 or distancia_m <= 0:
+        return df_gps.reset_index(drop=True)
+    lat = np.radians(df_gps['gps_lat'].to_numpy())
+    lng = np.radians(df_gps['gps_lng'].to_numpy())
+    #haversine entre muestras consecutivas
+    a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2) ** 2
+    recorrido = np.concatenate(([0.0], np.cumsum(2 * mp.EARTH_R * np.arcsin(np.sqrt(np.minimum(a, 1.0))))))
+    tramo = np.floor(recorrido / distancia_m)
+    conservar = np.concatenate(([True], tramo[1:] != tramo[:-1]))
+    conservar[-1] = True
+    return df_gps[conservar].reset_index(drop=True)
+
+
+def _rms(senal):
+    return float(np.sqrt(np.mean((senal - np.mean(senal)) ** 2)))
+
+
+def vista_previa(ruta_csv, carpeta_grafos, distancia_m=DISTANCIA_DECIMACION_M):
+    """
+    Calcula la vista previa de un CSV sin moverlo ni guardar nada.
+
+    Parámetros:
+        ruta_csv : str
+            Ruta al CSV.
+        carpeta_grafos : str
+            Carpeta de grafos (se usa la versión de tiles actual).
+        distancia_m : float
+            Distancia entre muestras GPS usadas en el matching.
+
+    Retorna:
+        dict con los segmentos aproximados ("segmentos") y el resumen de la
+        vista previa (muestras usadas, tiempo, versión de tiles).
+    """
+    inicio = time.time()
+    registro = lc.leer_csv_por_bloques(ruta_csv, mp.COLUMNAS_PROCESAMIENTO, invertir=True)
+    df = registro.dataframe()
+    frecuencia_muestreo = int(registro.metadatos["Sampling Rate Configured"][0:2])
+
+    df_gps = ap.eliminar_muestras_gps_duplicadas(df, columnas=mp.COLUMNAS_GPS)
+    df_gps = ap.ajustar_heading_y_filtrar(df_gps, en_sitio=True)
+    df_gps.reset_index(drop=True, inplace=True)
+    df_diezmado = decimar_por_distancia(df_gps, distancia_m)
+
+    with vt.usar_version(carpeta_grafos) as version:
+        datos_mapa = mp.DatosProcesamiento()
+        datos_mapa.carpeta_grafos = version.carpeta
+        datos_mapa.carpeta_grafos_comprimidos = version.carpeta
+        eventos, _ = mp.emparejar_muestras(df_diezmado, datos_mapa, 0, len(df_diezmado))
+
+    acc_x = df['acc_x'].to_numpy()
+    acc_z = df['acc_z'].to_numpy()
+    velocidad = df['gps_speed'].to_numpy()
+    indices_originales = df_diezmado['index_original'].to_numpy()
+    #mismo mínimo de muestras por segmento que el procesamiento completo (64 a 25 Hz)
+    minimo_muestras = 64 * (frecuencia_muestreo / 25)
+
+    segmentos = []
+    inicio_segmento = 0
+    for evento in eventos:
+        fin_segmento = int(indices_originales[evento["i"]])
+        desde, inicio_segmento = inicio_segmento, fin_segmento
+        if (fin_segmento - desde) <= minimo_muestras:
+            continue
+        ax = acc_x[desde:fin_segmento]
+        longitud = evento["longitud_subsegmento"]
+
+        indice_ax = (100 * np.sum((ax - np.mean(ax)) ** 2)) / (len(ax) * longitud)
+        if indice_ax > 0.36:
+            indice_ax = (-0.0072 / indice_ax) + 0.38
+
+        segmentos.append({
+            "numero": len(segmentos),
+            "id": evento["hash"],
+            "nombre": evento["nombre"],
+            "tipo": evento["tipo_via"],
+            "longitud": longitud,
+            "fecha": ap.timestamp_a_iso8601(int(df_diezmado['timestamp'].iloc[evento["i"]])),
+            "geometria": [{"orden": j, "longitud": punto[0], "latitud": punto[1]}
+                          for j, punto in enumerate(evento["coordenadas_segmento"])],
+            "velocidad_promedio": float(np.mean(velocidad[desde:fin_segmento])),
+            "ax": float(-11.679 * indice_ax + 4.4797),
+            "rms_ax": _rms(ax),
+            "rms_az": _rms(acc_z[desde:fin_segmento]),
+        })
+
+    return {
+        "vista_previa": True,
+        "distancia_decimacion_m": distancia_m,
+        "muestras_gps": len(df_gps),
+        "muestras_gps_usadas": len(df_diezmado),
+        "version_tiles": version.nombre,
+        "tiempo": round(time.time() - inicio, 3),
+        "segmentos": segmentos,
+    }
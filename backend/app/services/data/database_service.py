@@ -4,6 +4,7 @@ CONCURRENCY SAFE: Implementa UPSERT patterns y manejo de race conditions
 """
 import statistics
 import time
+import numpy as np
 from typing import List, Optional, Dict, Any, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, func
@@ -25,6 +26,12 @@ from app.schemas.recway import (
 
 logger = logging.getLogger(__name__)
 
+# Columnas del CSV que se guardan tal cual en registro_sensores
+SENSOR_COLUMNS = (
+    "timestamp", "acc_x", "acc_y", "acc_z", "gyro_x", "gyro_y", "gyro_z",
+    "gps_lat", "gps_lng", "gps_accuracy", "gps_speed", "gps_altitude", "gps_heading",
+)
+
 class RecWayDatabaseService:
     """Servicio principal para operaciones de base de datos de RecWay"""
 
@@ -256,13 +263,17 @@ class RecWayDatabaseService:
 
     # =================== MUESTRAS ===================
 
-    def create_muestra(self, segmento_data: SegmentoFromJSON, metadata: CSVMetadata, user_id: int, segmento_id: int) -> Muestra:
+    def create_muestra(self, segmento_data: SegmentoFromJSON, metadata: CSVMetadata, user_id: int, segmento_id: int,
+                       versiones: Optional[Dict[str, Optional[str]]] = None) -> Muestra:
         """Crea una nueva muestra con sus índices y huecos"""
+        versiones = versiones or {}
         # Crear la muestra
         muestra = Muestra(
             tipo_dispositivo=metadata.platform,
             identificador_dispositivo=metadata.device_id,
             fecha_muestra=segmento_data.fecha,
+            version_algoritmo=versiones.get("version_algoritmo"),
+            version_tiles=versiones.get("version_tiles"),
             id_segmento_seleccionado=segmento_id,  # Usar el ID de la BD, no el del JSON
             created_by_user_id=user_id
         )
@@ -298,8 +309,10 @@ class RecWayDatabaseService:
 
     # =================== DISPOSITIVOS Y SENSORES ===================
 
-    def create_fuente_datos_dispositivo(self, metadata: CSVMetadata, user_id: int) -> FuenteDatosDispositivo:
+    def create_fuente_datos_dispositivo(self, metadata: CSVMetadata, user_id: int,
+                                        versiones: Optional[Dict[str, Optional[str]]] = None) -> FuenteDatosDispositivo:
         """Crea una nueva fuente de datos del dispositivo"""
+        versiones = versiones or {}
         fuente = FuenteDatosDispositivo(
             device_id=metadata.device_id,
             session_id=metadata.session_id,
@@ -323,6 +336,8 @@ class RecWayDatabaseService:
             sampling_rate=metadata.sampling_rate,
             recording_duration=metadata.recording_duration,
             average_sample_rate=metadata.average_sample_rate,
+            version_algoritmo=versiones.get("version_algoritmo"),
+            version_tiles=versiones.get("version_tiles"),
             created_by_user_id=user_id
         )
         
@@ -330,8 +345,13 @@ class RecWayDatabaseService:
         self.db.flush()
         return fuente
 
-    def create_registro_sensores_bulk(self, sensor_data: List[Dict[str, Any]], fuente_id: int) -> int:
-        """Crea registros de sensores en lote para mejor rendimiento"""
+    def create_registro_sensores_bulk(self, sensor_data, fuente_id: int) -> int:
+        """Crea registros de sensores en lote para mejor rendimiento.
+        Acepta la lista de dicts de CSVParser.parse_csv_file o el RegistroCSV columnar
+        de CSVParser.parse_csv_columns (inserción directa sin objetos ORM)."""
+        if hasattr(sensor_data, "columnas"):
+            return self.create_registro_sensores_columnar(sensor_data.columnas, fuente_id)
+
         registros = []
         
         for row in sensor_data:
@@ -378,21 +398,59 @@ class RecWayDatabaseService:
         
         return total_inserted
 
+    def create_registro_sensores_columnar(self, columnas: Dict[str, np.ndarray], fuente_id: int) -> int:
+        """Inserta registros de sensores desde columnas numpy (un INSERT multi-fila por lote)"""
+        n = len(columnas["timestamp"])
+        if n == 0:
+            return 0
+        
+        valores = {campo: columnas[campo] for campo in SENSOR_COLUMNS if campo in columnas}
+        # Magnitudes vectorizadas (NaN si falta algún eje, que se guarda como NULL)
+        if all(k in columnas for k in ("acc_x", "acc_y", "acc_z")):
+            valores["acc_magnitude"] = np.sqrt(columnas["acc_x"]**2 + columnas["acc_y"]**2 + columnas["acc_z"]**2)
+        if all(k in columnas for k in ("gyro_x", "gyro_y", "gyro_z")):
+            valores["gyro_magnitude"] = np.sqrt(columnas["gyro_x"]**2 + columnas["gyro_y"]**2 + columnas["gyro_z"]**2)
+        
+        claves = ["timestamp"] + [c for c in valores if c != "timestamp"] + ["id_fuente"]
+        listas = [columnas["timestamp"].astype(np.int64).tolist()]
+        for campo in claves[1:-1]:
+            arreglo = np.asarray(valores[campo], dtype=np.float64)
+            nulos = np.isnan(arreglo)
+            if nulos.any():
+                objeto = arreglo.astype(object)
+                objeto[nulos] = None
+                listas.append(objeto.tolist())
+            else:
+                listas.append(arreglo.tolist())
+        listas.append([fuente_id] * n)
+        
+        tabla = RegistroSensores.__table__
+        batch_size = 5000
+        for i in range(0, n, batch_size):
+            filas = [dict(zip(claves, fila)) for fila in zip(*(l[i:i + batch_size] for l in listas))]
+            self.db.execute(tabla.insert(), filas)
+        
+        return n
+
     # =================== OPERACIONES PRINCIPALES ===================
 
     def process_complete_data(self, 
                             csv_metadata: CSVMetadata, 
                             processed_segments: List[SegmentoFromJSON],
-                            csv_sensor_data: List[Dict[str, Any]],
-                            user_id: int) -> ProcessingResult:
+                            csv_sensor_data,
+                            user_id: int,
+                            versiones: Optional[Dict[str, Optional[str]]] = None) -> ProcessingResult:
         """
         Procesa un conjunto completo de datos: segmentos, muestras y sensores
         Esta es la función principal que orquesta todo el procesamiento
+
+        `versiones` ("version_algoritmo", "version_tiles") queda en la fuente y en cada
+        muestra para saber después con qué algoritmo y tiles se produjo el viaje.
         """
         start_time = datetime.now()
         
         # 1. Crear fuente de datos del dispositivo
-        fuente = self.create_fuente_datos_dispositivo(csv_metadata, user_id)
+        fuente = self.create_fuente_datos_dispositivo(csv_metadata, user_id, versiones)
         
         # 2. Procesar cada segmento
         segmentos_creados = []
@@ -412,7 +470,7 @@ class RecWayDatabaseService:
                 segmentos_actualizados.append(segmento.id_segmento)
             
             # Crear muestra (siempre) - usar el ID del segmento en BD
-            nueva_muestra = self.create_muestra(segmento_data, csv_metadata, user_id, segmento.id_segmento)
+            nueva_muestra = self.create_muestra(segmento_data, csv_metadata, user_id, segmento.id_segmento, versiones)
             muestras_creadas.append(nueva_muestra.id_muestra)
             
             # Recalcular índices y huecos del segmento
@@ -436,3 +494,90 @@ class RecWayDatabaseService:
             registros_sensores_creados=registros_creados,
             total_processing_time=processing_time
         )
+
+    # =================== REPROCESAMIENTO ===================
+
+    def delete_trip_data(self, csv_metadata: CSVMetadata, fecha_inicio: str, fecha_fin: str) -> List[int]:
+        """
+        Elimina lo que dejó un procesamiento anterior del mismo viaje: las fuentes con el
+        mismo device_id y session_id (con sus registros de sensores) y las muestras del
+        dispositivo con fecha dentro del viaje. No hace commit.
+
+        Retorna los IDs de los segmentos de las muestras eliminadas.
+        """
+        if not csv_metadata.device_id:
+            return []
+
+        if csv_metadata.session_id:
+            fuentes = [id_fuente for (id_fuente,) in self.db.query(FuenteDatosDispositivo.id_fuente).filter(
+                FuenteDatosDispositivo.device_id == csv_metadata.device_id,
+                FuenteDatosDispositivo.session_id == csv_metadata.session_id
+            ).all()]
+            if fuentes:
+                self.db.query(RegistroSensores).filter(
+                    RegistroSensores.id_fuente.in_(fuentes)
+                ).delete(synchronize_session=False)
+                self.db.query(FuenteDatosDispositivo).filter(
+                    FuenteDatosDispositivo.id_fuente.in_(fuentes)
+                ).delete(synchronize_session=False)
+
+        muestras = self.db.query(Muestra.id_muestra, Muestra.id_segmento_seleccionado).filter(
+            Muestra.identificador_dispositivo == csv_metadata.device_id,
+            Muestra.fecha_muestra >= fecha_inicio,
+            Muestra.fecha_muestra <= fecha_fin
+        ).all()
+        ids_muestras = [id_muestra for id_muestra, _ in muestras]
+        if ids_muestras:
+            self.db.query(HuecoMuestra).filter(
+                HuecoMuestra.id_muestra_seleccionada.in_(ids_muestras)
+            ).delete(synchronize_session=False)
+            self.db.query(IndicesMuestra).filter(
+                IndicesMuestra.id_muestra.in_(ids_muestras)
+            ).delete(synchronize_session=False)
+            self.db.query(Muestra).filter(
+                Muestra.id_muestra.in_(ids_muestras)
+            ).delete(synchronize_session=False)
+
+        return sorted({id_segmento for _, id_segmento in muestras})
+
+    def refresh_segmentos(self, segmento_ids) -> None:
+        """Recalcula cantidad de muestras, última fecha, índices y huecos de los segmentos"""
+        for segmento_id in segmento_ids:
+            segmento = self.db.query(Segmento).filter(Segmento.id_segmento == segmento_id).first()
+            if segmento is None:
+                continue
+            cantidad, ultima_fecha = self.db.query(
+                func.count(Muestra.id_muestra), func.max(Muestra.fecha_muestra)
+            ).filter(Muestra.id_segmento_seleccionado == segmento_id).one()
+            segmento.cantidad_muestras = cantidad
+            if ultima_fecha:
+                segmento.ultima_fecha_muestra = ultima_fecha
+            self.recalculate_segmento_indices(segmento_id)
+            self.recalculate_segmento_huecos(segmento_id)
+
+    def replace_trip_data(self,
+                          csv_metadata: CSVMetadata,
+                          processed_segments: List[SegmentoFromJSON],
+                          csv_sensor_data,
+                          user_id: int,
+                          fecha_inicio: str,
+                          fecha_fin: str,
+                          versiones: Optional[Dict[str, Optional[str]]] = None) -> ProcessingResult:
+        """
+        Reemplaza en BD los datos de un viaje reprocesado: elimina la fuente y las muestras
+        anteriores, inserta el nuevo resultado (process_complete_data) y recalcula los
+        segmentos que tenían o tienen muestras del viaje.
+        """
+        segmentos_anteriores = self.delete_trip_data(csv_metadata, fecha_inicio, fecha_fin)
+        resultado = self.process_complete_data(
+            csv_metadata=csv_metadata,
+            processed_segments=processed_segments,
+            csv_sensor_data=csv_sensor_data,
+            user_id=user_id,
+            versiones=versiones
+        )
+        self.refresh_segmentos(sorted(
+            set(segmentos_anteriores) | set(resultado.segmentos_creados) | set(resultado.segmentos_actualizados)
+        ))
+        self.db.commit()
+        return resultado
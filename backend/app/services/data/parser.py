@@ -31,6 +31,23 @@ class CSVParser:
         
         return CSVParser.parse_csv_content(content)
     
+    @staticmethod
+    def parse_csv_columns(file_path: str):
+        """
+        Parsea un CSV en una sola pasada con el lector del algoritmo
+        
+        Args:
+            file_path: Ruta al archivo CSV
+            
+        Returns:
+            Tuple con (metadatos, RegistroCSV) donde los datos de sensores son
+            arreglos numpy por columna en lugar de un dict por fila
+        """
+        from app.services.algoritmo_posicionv1_0 import lector_csv
+        
+        registro = lector_csv.leer_csv(file_path)
+        return CSVParser._extract_metadata(registro.lineas_encabezado), registro
+    
     @staticmethod
     def parse_csv_content(content: str) -> Tuple[CSVMetadata, List[Dict[str, Any]]]:
         """
@@ -6,11 +6,13 @@ Handles file watching and system monitoring.
 from .file_watcher import (
     start_file_watcher,
     stop_file_watcher,
-    get_file_watcher_status
+    get_file_watcher_status,
+    enqueue_upload
 )
 
 __all__ = [
     "start_file_watcher",
     "stop_file_watcher",
-    "get_file_watcher_status"
+    "get_file_watcher_status",
+    "enqueue_upload"
 ]
@@ -1,8 +1,11 @@
 """
 File Watcher integrado con RecWay Database para procesamiento automático completo.
-Implementación basada en un hilo de polling (sin watchdog) para reducir complejidad.
+Implementación basada en un hilo (sin watchdog) para reducir complejidad.
 Características:
-- Polling ligero cada pocos segundos (configurable)
+- En Linux, eventos de inotify (IN_CLOSE_WRITE / IN_MOVED_TO): el archivo se toma en
+  cuanto se cierra o se renombra dentro de la carpeta, sin listar la carpeta
+- Polling ligero cada pocos segundos (configurable) como alternativa sin inotify y
+  como barrido periódico de reconciliación en modo inotify
 - Detección de nuevos archivos CSV en carpeta raw
 - Verifica que el archivo esté "estable" (sin crecer) antes de procesar
 - Procesamiento automático: CSV → JSON → Base de Datos
@@ -13,25 +16,47 @@ import os
 import time
 import threading
 import logging
-import json
-from typing import Dict, Set
+from typing import Callable, Dict, Optional, Set, Tuple, Union
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, Future
+from app.services.monitoring import inotify
+from app.services.processing.admission import admission_controller
 from app.services.processing.csv_processor import csv_processor
+from app.services.processing.job_queue import JobWorker, PermanentJobError, job_queue
+from app.services.processing.process_pool import processing_pool
+from app.services.processing.result_cache import result_cache, sha256_file
 from app.services.data.database_service import RecWayDatabaseService
 from app.services.data.parser import CSVParser
 from app.database.session import SessionLocal
 
 logger = logging.getLogger(__name__)
 
+WATCHER_MODES = ("auto", "inotify", "polling")
+
+# Eventos de la carpeta que se escuchan en modo inotify
+INOTIFY_MASK = (inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO | inotify.IN_MOVED_FROM | inotify.IN_DELETE
+                | inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF)
+
+
 class SimpleCSVWatcher:
-    """Watcher basado en polling para una carpeta de archivos CSV con ThreadPoolExecutor para concurrencia."""
+    """Watcher de una carpeta de archivos CSV (inotify o polling) con ThreadPoolExecutor para concurrencia."""
 
-    def __init__(self, watch_folder: str = None, poll_interval: float = 2.0, stable_seconds: float = 1.0, max_concurrent_files: int = 3):
+    def __init__(self, watch_folder: str = None, poll_interval: float = 2.0, stable_seconds: float = 1.0, max_concurrent_files: int = 3,
+                 mode: str = None, reconcile_interval: float = None):
         from app.core.config import settings
         # Por defecto usa el directorio configurado
         self.watch_folder = Path(watch_folder or settings.CSV_RAW_DIR)
         self.poll_interval = poll_interval
+        # "auto" usa inotify si está disponible; el barrido de reconciliación recupera
+        # archivos sin evento (copiados antes de arrancar, cola de eventos desbordada, NFS)
+        self.mode = (mode or settings.FILE_WATCHER_MODE).lower()
+        if self.mode not in WATCHER_MODES:
+            raise ValueError(f"FILE_WATCHER_MODE debe ser uno de {WATCHER_MODES}")
+        self.reconcile_interval = reconcile_interval if reconcile_interval is not None else settings.FILE_WATCHER_RECONCILE_SECONDS
+        self._active_mode: str | None = None
+        self._inotify: inotify.InotifyWatch | None = None
+        self._events_received = 0
+        self._last_sweep: float | None = None
         self.stable_seconds = stable_seconds  # Reducido a 1 segundo para debugging
         self.max_concurrent_files = max_concurrent_files
         self._thread: threading.Thread | None = None
@@ -41,14 +66,29 @@ class SimpleCSVWatcher:
         # _seen_files[path] = { 'first_seen': t, 'last_size': size, 'last_mtime': mtime, 'last_stable_since': t }
         self._processed: Set[str] = set()
         self._processing: Set[str] = set()
+        # Con la cola en BD: archivos con trabajo encolado que siguen en raw (sus eventos se ignoran)
+        self._queued_jobs: Set[str] = set()
         self._last_cycle_duration: float | None = None
         
-        # PARALELO SEGURO: max_workers=3 con UUID para evitar conflictos
+        # Los hilos solo coordinan: el CSV → JSON corre en el pool de procesos y
+        # aquí se espera el resultado y se hace el paso a BD. Un hilo por worker.
+        self._workers = processing_pool.max_workers if processing_pool.enabled else 3
         self._executor = ThreadPoolExecutor(
-            max_workers=3,  # PARALELO: Máximo 3 archivos simultáneos
+            max_workers=self._workers,
             thread_name_prefix="csv-processor"
         )
         self._active_futures: Dict[str, Future] = {}  # file_path -> Future
+        # Límite de archivos en el executor (los demás esperan en raw) y bytes encolados
+        self.max_queued = settings.ADMISSION_MAX_QUEUED_JOBS
+        self._queued_bytes: Dict[str, int] = {}
+        self._job_stats_cache = None
+        # Con JOB_QUEUE_ENABLED los archivos se encolan en BD y los procesan estos workers
+        self._job_worker: JobWorker | None = None
+        if settings.JOB_QUEUE_ENABLED:
+            self._job_worker = JobWorker(
+                job_queue, self._run_job,
+                settings.JOB_QUEUE_WORKERS or self._workers
+            )
 
     def start(self):
         if self.is_running:
@@ -57,6 +97,8 @@ class SimpleCSVWatcher:
         try:
             self.watch_folder.mkdir(parents=True, exist_ok=True)
             self._stop_event.clear()
+            if self._job_worker is not None and not self._job_worker.is_running:
+                self._job_worker.start()
             self._thread = threading.Thread(target=self._run_loop, name="csv-watcher", daemon=True)
             self._thread.start()
             logger.info(f"🔍 File watcher (simple) iniciado - monitoreando: {self.watch_folder.resolve()}")
@@ -71,6 +113,8 @@ class SimpleCSVWatcher:
             return
         logger.info("🛑 Deteniendo file watcher...")
         self._stop_event.set()
+        if self._inotify is not None:
+            self._inotify.wake()
         
         # Cancelar futuros pendientes
         for file_path, future in self._active_futures.items():
@@ -80,6 +124,9 @@ class SimpleCSVWatcher:
         
         # Shutdown del ThreadPoolExecutor (sin timeout para compatibilidad)
         self._executor.shutdown(wait=True)
+        if self._job_worker is not None:
+            # Los trabajos en curso terminan; si no alcanzan, su lease vence y los retoma otra instancia
+            self._job_worker.stop()
         
         if self._thread:
             self._thread.join(timeout=5)
@@ -89,7 +136,97 @@ class SimpleCSVWatcher:
     def is_running(self) -> bool:
         return self._thread is not None and self._thread.is_alive() and not self._stop_event.is_set()
 
+    def _open_inotify(self) -> bool:
+        """Crea el watch de inotify según el modo; False si se queda en polling."""
+        if self.mode == "polling":
+            return False
+        if not inotify.inotify_available():
+            if self.mode == "inotify":
+                logger.warning("⚠️ inotify no disponible en este sistema, se usa polling")
+            return False
+        try:
+            self._inotify = inotify.InotifyWatch(str(self.watch_folder), INOTIFY_MASK)
+            return True
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo iniciar inotify en {self.watch_folder} ({e}), se usa polling")
+            return False
+
     def _run_loop(self):
+        if self._open_inotify():
+            self._active_mode = "inotify"
+            logger.info(f"⚡ Watcher en modo inotify (reconciliación cada {self.reconcile_interval}s)")
+            try:
+                self._run_event_loop()
+            finally:
+                self._inotify.close()
+                self._inotify = None
+            return
+        self._active_mode = "polling"
+        self._run_poll_loop()
+
+    def _run_event_loop(self):
+        """Procesa eventos de inotify; barre la carpeta al iniciar, cada reconcile_interval
+        y cada poll_interval mientras haya archivos esperando estabilidad."""
+        next_sweep = 0.0
+        while not self._stop_event.is_set():
+            now = time.time()
+            if now >= next_sweep:
+                self._sweep()
+                with self._lock:
+                    waiting = any(p not in self._processing for p in self._seen_files)
+                next_sweep = time.time() + (self.poll_interval if waiting else self.reconcile_interval)
+            try:
+                events = self._inotify.read_events(max(0.0, next_sweep - time.time()))
+            except OSError as e:
+                logger.error(f"Error leyendo eventos de inotify: {e}")
+                events = []
+                self._stop_event.wait(self.poll_interval)
+            for event in events:
+                if event.mask & (inotify.IN_Q_OVERFLOW | inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF):
+                    # Se perdieron eventos o la carpeta cambió: barrido inmediato
+                    logger.warning(f"⚠️ Evento de inotify {event.mask:#x}, se barre la carpeta")
+                    next_sweep = 0.0
+                    continue
+                self._handle_event(event)
+            self._cleanup_completed_futures()
+
+    def _handle_event(self, event: "inotify.InotifyEvent"):
+        if not event.name.lower().endswith('.csv'):
+            return
+        self._events_received += 1
+        file_path = self.watch_folder / event.name
+        path_str = str(file_path)
+        with self._lock:
+            if event.mask & (inotify.IN_MOVED_FROM | inotify.IN_DELETE):
+                # Ya no está en raw: se puede volver a procesar un archivo con el mismo nombre
+                self._processed.discard(path_str)
+                self._queued_jobs.discard(path_str)
+                if path_str not in self._processing:
+                    self._seen_files.pop(path_str, None)
+                return
+            if path_str in self._processing or path_str in self._queued_jobs:
+                # Ya tiene trabajo (p. ej. el evento de una subida encolada o un archivo aún en la cola en BD)
+                return
+            # Cerrado tras escribir o renombrado dentro de la carpeta: contenido completo
+            self._processed.discard(path_str)
+            self._seen_files.pop(path_str, None)
+            if not self._has_capacity():
+                # Cola llena: queda como archivo estable y lo toma un barrido cuando haya lugar
+                self._seen_files[path_str] = {'first_seen': time.time(), 'last_size': -1, 'last_mtime': -1,
+                                              'last_stable_since': 0.0}
+                logger.info(f"⏸️ Cola llena, {file_path.name} espera lugar ({len(self._processing)} en proceso)")
+                return
+            logger.info(f"⚡ Archivo CSV recibido: {file_path.name}")
+            self._submit(file_path)
+
+    def _sweep(self):
+        try:
+            self._scan_once()
+        except Exception as e:
+            logger.error(f"Error en barrido del watcher: {e}")
+        self._last_sweep = time.time()
+
+    def _run_poll_loop(self):
         while not self._stop_event.is_set():
             cycle_start = time.time()
             try:
@@ -146,6 +283,10 @@ class SimpleCSVWatcher:
                     }
                     logger.info(f"Archivo CSV detectado: {path_str}")
                     continue
+                # Diferido desde un evento de inotify: ya estaba completo
+                if entry['last_size'] == -1:
+                    entry['last_size'] = size
+                    entry['last_mtime'] = mtime
                 # Si cambió tamaño o mtime reiniciamos ventana de estabilidad
                 if size != entry['last_size'] or mtime != entry['last_mtime']:
                     entry['last_size'] = size
@@ -155,21 +296,11 @@ class SimpleCSVWatcher:
                 # Verificar si alcanzó estabilidad
                 stable_duration = now - entry['last_stable_since']
                 if stable_duration >= self.stable_seconds:
+                    if not self._has_capacity():
+                        logger.debug(f"⏸️ Cola llena, {file_path.name} espera lugar")
+                        continue
                     logger.info(f"🚀 Archivo estable, iniciando procesamiento: {file_path.name} (estable por {stable_duration:.1f}s)")
-                    self._processing.add(path_str)
-                    # USAR THREADPOOL en lugar de Thread individual
-                    future = self._executor.submit(self._process_file_safe, file_path)
-                    self._active_futures[path_str] = future
-                    
-                    # Callback para limpiar cuando termine
-                    def cleanup_future(fut, path=path_str):
-                        self._active_futures.pop(path, None)
-                        try:
-                            result = fut.result()  # Esto lanzará la excepción si hubo una
-                            logger.info(f"✅ Procesamiento completado para: {Path(path).name}")
-                        except Exception as e:
-                            logger.error(f"❌ Error en callback de procesamiento para {Path(path).name}: {e}")
-                    future.add_done_callback(cleanup_future)
+                    self._submit(file_path)
                 else:
                     logger.debug(f"⏳ Esperando estabilidad: {file_path.name} (estable por {stable_duration:.1f}s/{self.stable_seconds}s)")
             # Limpiar entradas de archivos desaparecidos
@@ -181,9 +312,110 @@ class SimpleCSVWatcher:
             processed_to_drop = [p for p in list(self._processed) if p not in existing_set]
             for p in processed_to_drop:
                 self._processed.discard(p)
+            for p in [p for p in self._queued_jobs if p not in existing_set]:
+                self._queued_jobs.discard(p)
+
+    def enqueue(self, publish: Callable[[], Path]) -> Tuple[Path, Union[Future, int]]:
+        """Publica un archivo en la carpeta y lo encola para procesar, una sola vez.
+
+        `publish` hace el rename del temporal a su nombre final en la carpeta y retorna la ruta.
+        Se ejecuta con el lock tomado y el archivo queda reclamado antes de que el evento
+        de inotify o un barrido puedan verlo, así que ninguno de los dos lo toma otra vez.
+        """
+        with self._lock:
+            file_path = publish()
+            self._seen_files.pop(str(file_path), None)
+            self._processed.discard(str(file_path))
+            logger.info(f"📥 Subida encolada: {file_path.name}")
+            return file_path, self._submit(file_path, source="upload")
+
+    def _submit(self, file_path: Path, source: str = "watcher") -> Union[Future, int]:
+        """Envía el archivo al executor o, con la cola en BD, lo encola (llamar con self._lock tomado).
+
+        Retorna el Future del executor o el id del trabajo en BD.
+        """
+        path_str = str(file_path)
+        try:
+            self._queued_bytes[path_str] = file_path.stat().st_size
+        except OSError:
+            pass
+        if self._job_worker is not None:
+            # El trabajo queda en BD; lo toma cualquier instancia. Mientras siga en raw no se encola otra vez
+            job_id = job_queue.enqueue(path_str, source)
+            self._queued_bytes.pop(path_str, None)
+            self._processed.add(path_str)
+            self._queued_jobs.add(path_str)
+            self._job_worker.notify()
+            logger.info(f"📬 Trabajo {job_id} encolado en BD: {file_path.name}")
+            return job_id
+        self._processing.add(path_str)
+        # USAR THREADPOOL en lugar de Thread individual
+        future = self._executor.submit(self._process_file_safe, file_path)
+        self._active_futures[path_str] = future
+
+        # Callback para limpiar cuando termine
+        def cleanup_future(fut, path=path_str):
+            self._active_futures.pop(path, None)
+            try:
+                result = fut.result()  # Esto lanzará la excepción si hubo una
+                logger.info(f"✅ Procesamiento completado para: {Path(path).name}")
+            except Exception as e:
+                logger.error(f"❌ Error en callback de procesamiento para {Path(path).name}: {e}")
+        future.add_done_callback(cleanup_future)
+        return future
+
+    def _has_capacity(self) -> bool:
+        """Con el executor local, no encolar más de max_queued archivos (llamar con self._lock tomado)."""
+        if self._job_worker is not None or not self.max_queued:
+            return True
+        return len(self._processing) < self.max_queued
+
+    def queue_snapshot(self) -> dict:
+        """Profundidad de la cola para el control de admisión."""
+        if self._job_worker is not None:
+            counts = self._job_stats()
+            return {"depth": counts.get("pending", 0) + counts.get("running", 0),
+                    "running": counts.get("running", 0), "bytes": 0, "workers": self._job_worker.workers}
+        with self._lock:
+            depth = len(self._processing)
+            deferred = sum(1 for p in self._seen_files if p not in self._processing)
+            return {"depth": depth + deferred, "running": min(depth, self._workers),
+                    "bytes": sum(self._queued_bytes.values()), "workers": self._workers}
+
+    def _job_stats(self) -> dict:
+        # Conteos de la cola en BD con cache corta: se consultan en cada subida
+        now = time.time()
+        if self._job_stats_cache is None or now - self._job_stats_cache[0] > 2.0:
+            try:
+                self._job_stats_cache = (now, job_queue.stats())
+            except Exception as e:
+                logger.warning(f"No se pudo consultar la cola en BD: {e}")
+                return self._job_stats_cache[1] if self._job_stats_cache else {}
+        return self._job_stats_cache[1]
 
     def _process_file_safe(self, file_path: Path):
         path_str = str(file_path)
+        started = time.time()
+        try:
+            self._process_file(file_path)
+            admission_controller.record_processing(time.time() - started)
+        except PermanentJobError as e:
+            logger.error(f"⚠️ {e}")
+        except Exception as e:
+            logger.error(f"❌ Error en procesamiento automático de {file_path.name}: {e}")
+        finally:
+            with self._lock:
+                self._processing.discard(path_str)
+                self._processed.add(path_str)
+                self._seen_files.pop(path_str, None)
+                self._queued_bytes.pop(path_str, None)
+
+    def _process_file(self, file_path: Path) -> str:
+        """CSV → JSON → BD de un archivo de raw. Retorna "done" o "duplicate".
+
+        Lanza PermanentJobError si el archivo no existe o está vacío y otra excepción
+        si falla el procesamiento o el paso a BD (la transacción se revierte).
+        """
         filename = file_path.name
         db = None
         
@@ -193,43 +425,39 @@ class SimpleCSVWatcher:
             
             # PASO 1: Verificar que el archivo existe y no está vacío
             if not file_path.exists():
-                logger.error(f"⚠️ Archivo no existe: {filename}")
-                return
+                raise PermanentJobError(f"Archivo no existe: {filename}")
                 
             file_size = file_path.stat().st_size
             if file_size == 0:
-                logger.error(f"⚠️ Archivo vacío: {filename}")
-                return
+                raise PermanentJobError(f"Archivo vacío: {filename}")
                 
             logger.info(f"📏 Tamaño del archivo: {file_size} bytes")
+
+            # Un contenido ya procesado con las mismas versiones no se procesa ni se inserta otra vez
+            content_hash = sha256_file(file_path) if result_cache.enabled else None
+            if content_hash is not None:
+                cached = csv_processor.buscar_resultado_cache(content_hash)
+                if cached is not None:
+                    logger.info(f"♻️ {filename} es un duplicado de {cached['archivo']} "
+                                f"(algoritmo {cached['version_algoritmo']}, tiles {cached['version_tiles']}): "
+                                f"se omite el procesamiento y el paso a BD")
+                    csv_processor.archivar_duplicado(filename)
+                    return "duplicate"
             
             # PASO 2: Procesar CSV → JSON
             logger.info(f"📄 Paso 1/3: Procesando CSV → JSON para {filename}")
-            try:
-                csv_result = csv_processor.procesar_archivo_especifico(filename)
-                if not csv_result:
-                    logger.error(f"❌ Error en procesamiento CSV → JSON para: {filename}")
-                    return
-                logger.info(f"✅ CSV → JSON completado para {filename}")
-            except Exception as e:
-                logger.error(f"❌ Excepción en procesamiento CSV → JSON para {filename}: {e}")
-                return
+            csv_result, diagnostico = processing_pool.process(filename, content_hash)
+            if not csv_result:
+                raise RuntimeError(f"Procesamiento CSV → JSON sin segmentos para: {filename}")
+            logger.info(f"✅ CSV → JSON completado para {filename} "
+                        f"(tiles {diagnostico.get('version_tiles')}, worker {diagnostico.get('worker_pid', os.getpid())})")
             
-            # PASO 3: Determinar rutas de archivos
+            # PASO 3: Determinar ruta del CSV procesado
             from app.core.config import settings
             processed_csv_path = Path(settings.CSV_PROCESSED_DIR) / filename
-            # El JSON se genera en storage con el patrón: datosNOMBREsave.json
-            base_name = filename.replace('.csv', '')
-            json_filename = f"datos{base_name}save.json"
-            json_path = Path(settings.JSON_STORAGE_DIR) / json_filename
             
             if not processed_csv_path.exists():
-                logger.error(f"❌ Archivo CSV procesado no encontrado: {processed_csv_path}")
-                return
-                
-            if not json_path.exists():
-                logger.error(f"❌ Archivo JSON no encontrado: {json_path}")
-                return
+                raise RuntimeError(f"Archivo CSV procesado no encontrado: {processed_csv_path}")
             
             # PASO 4: Almacenar en base de datos
             logger.info(f"💾 Paso 2/3: Almacenando datos en BD para {filename}")
@@ -237,32 +465,33 @@ class SimpleCSVWatcher:
             # Inicializar conexión a BD y servicio
             db = SessionLocal()
             recway_service = RecWayDatabaseService(db)
-            csv_parser = CSVParser()
             
             # Usuario admin por defecto (ID=1)
             admin_user_id = 1
             
             # Parsear archivos como lo hacemos en los endpoints
-            csv_metadata, csv_sensor_data = CSVParser.parse_csv_file(str(processed_csv_path.resolve()))
-            
-            # Leer JSON con segmentos procesados
-            with open(str(json_path.resolve()), 'r', encoding='utf-8') as f:
-                json_data = json.load(f)
+            csv_metadata, csv_sensor_data = CSVParser.parse_csv_columns(str(processed_csv_path.resolve()))
             
-            # Convertir JSON a esquemas Pydantic
-            from app.schemas.recway import SegmentoFromJSON
-            processed_segments = [SegmentoFromJSON(**segment) for segment in json_data]
+            # Los segmentos llegan en memoria desde el algoritmo: se validan en un solo paso
+            from app.schemas.recway import segmentos_from_json
+            processed_segments = segmentos_from_json.validate_python(csv_result)
             
             # Procesar y almacenar datos completos
             db_result = recway_service.process_complete_data(
                 csv_metadata=csv_metadata,
                 processed_segments=processed_segments,
                 csv_sensor_data=csv_sensor_data,
-                user_id=admin_user_id
+                user_id=admin_user_id,
+                versiones={"version_algoritmo": diagnostico.get("version_algoritmo"),
+                           "version_tiles": diagnostico.get("version_tiles")}
             )
             
             # Confirmar transacción
             db.commit()
+            # Solo con el viaje en BD el contenido cuenta como duplicado en la cache de resultados
+            csv_processor.marcar_resultado_guardado(diagnostico.get("hash_contenido"),
+                                                    diagnostico.get("version_algoritmo"),
+                                                    diagnostico.get("version_tiles"))
             
             logger.info(f"✅ Almacenamiento en BD completado para {filename}")
             logger.info(f"📊 Resultados: {len(db_result.segmentos_creados)} segmentos creados, "
@@ -272,31 +501,69 @@ class SimpleCSVWatcher:
             # PASO 5: Éxito total
             logger.info(f"🎉 Procesamiento automático COMPLETO para {filename}")
             logger.info(f"⏱️ Tiempo total: {db_result.total_processing_time:.2f}s")
+            return "done"
             
-        except Exception as e:
-            logger.error(f"❌ Error en procesamiento automático de {filename}: {e}")
+        except Exception:
             if db:
                 db.rollback()
+            raise
         finally:
             if db:
                 db.close()
-            with self._lock:
-                self._processing.discard(path_str)
-                self._processed.add(path_str)
-                self._seen_files.pop(path_str, None)
+
+    def _run_job(self, job: dict) -> str:
+        """Ejecuta un trabajo de la cola en BD.
+
+        En un reintento, si el CSV ya no está en raw es porque el intento anterior llegó a
+        procesarlo y falló el paso a BD: se reemplazan en BD los datos del viaje con el
+        resultado guardado (sin volver a correr el algoritmo ni duplicar muestras).
+        """
+        file_path = Path(job["file_path"])
+        if job["attempts"] > 1 and not file_path.exists():
+            return self._resume_db_step(file_path.name)
+        started = time.time()
+        result = self._process_file(file_path)
+        admission_controller.record_processing(time.time() - started)
+        return result
+
+    def _resume_db_step(self, filename: str) -> str:
+        from app.core.config import settings
+        from app.services.processing.reprocess import write_to_db
+        processed_csv_path = Path(settings.CSV_PROCESSED_DIR) / filename
+        result_path = csv_processor.ruta_resultado(filename)
+        if not processed_csv_path.exists() or result_path is None:
+            raise PermanentJobError(f"Archivo no existe: {filename} (ni en raw ni procesado con resultado)")
+        logger.info(f"🔁 Reintentando solo el paso a BD de {filename} con {result_path.name}")
+        versiones = csv_processor.leer_versiones_resultado(str(result_path))
+        write_to_db(processed_csv_path, csv_processor.leer_resultado(str(result_path)), user_id=1,
+                    versiones=versiones)
+        if result_cache.enabled:
+            csv_processor.marcar_resultado_guardado(sha256_file(processed_csv_path),
+                                                    versiones.get("version_algoritmo"),
+                                                    versiones.get("version_tiles"))
+        return "done"
 
     def status(self) -> dict:
         """Estado del file watcher con estadísticas de base de datos"""
+        # Fuera del lock: consulta la BD
+        job_queue_status = self._job_worker.status() if self._job_worker is not None else {'enabled': False}
         with self._lock:
             base_status = {
                 'is_running': self.is_running,
                 'watch_folder': str(self.watch_folder.resolve()),
+                'mode': self._active_mode or self.mode,
                 'poll_interval': self.poll_interval,
+                'reconcile_interval': self.reconcile_interval,
+                'events_received': self._events_received,
+                'last_sweep': self._last_sweep,
                 'stable_seconds': self.stable_seconds,
                 'queue_pending': len(self._seen_files),
                 'processing': len(self._processing),
                 'processed_count': len(self._processed),
-                'last_cycle_duration': self._last_cycle_duration
+                'last_cycle_duration': self._last_cycle_duration,
+                'graph_cache': csv_processor.metricas_cache_grafos(),
+                'processing_pool': processing_pool.status(),
+                'job_queue': job_queue_status
             }
             
             # Agregar estadísticas de base de datos
@@ -327,3 +594,12 @@ def stop_file_watcher():
 
 def get_file_watcher_status():
     return _file_watcher.status()
+
+
+admission_controller.set_queue_source(lambda: _file_watcher.queue_snapshot())
+
+def enqueue_upload(publish: Callable[[], Path]) -> Optional[Tuple[Path, Union[Future, int]]]:
+    """Entrega una subida al watcher (ver SimpleCSVWatcher.enqueue); None si el watcher no está activo."""
+    if not _file_watcher.is_running:
+        return None
+    return _file_watcher.enqueue(publish)
@@ -0,0 +1,134 @@
+"""
+Acceso mínimo a inotify de Linux con ctypes (sin dependencias externas).
+
+Solo cubre lo que usa el file watcher: un descriptor no bloqueante con un
+watch por carpeta, lectura de eventos con timeout y un pipe para despertar la
+espera desde otro hilo al detener. En otros sistemas `inotify_available()`
+retorna False y el watcher sigue con polling.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+from typing import List, NamedTuple, Optional
+
+# Constantes de <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+_READ_SIZE = 64 * 1024
+
+_libc = None
+
+
+class InotifyEvent(NamedTuple):
+    mask: int
+    name: str
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_init1.restype = ctypes.c_int
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_add_watch.restype = ctypes.c_int
+        _libc = libc
+    return _libc
+
+
+def inotify_available() -> bool:
+    """True si el sistema tiene inotify (Linux con libc que exporta inotify_init1)."""
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        return hasattr(_load_libc(), "inotify_init1")
+    except OSError:
+        return False
+
+
+class InotifyWatch:
+    """Watch de inotify sobre una carpeta. Lanza OSError si no se puede crear."""
+
+    def __init__(self, folder: str, mask: int):
+        libc = _load_libc()
+        self.folder = str(folder)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1: {os.strerror(errno)}")
+        wd = libc.inotify_add_watch(self._fd, os.fsencode(self.folder), mask | IN_ONLYDIR)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"inotify_add_watch({self.folder}): {os.strerror(errno)}")
+        # Pipe para despertar read_events desde otro hilo
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._closed = False
+
+    def read_events(self, timeout: Optional[float]) -> List[InotifyEvent]:
+        """Espera hasta `timeout` segundos (None = sin límite) y retorna los eventos leídos.
+
+        Retorna una lista vacía si venció el timeout o si se llamó a wake().
+        """
+        if self._closed:
+            return []
+        ready, _, _ = select.select([self._fd, self._wake_r], [], [], timeout)
+        if self._wake_r in ready:
+            try:
+                while os.read(self._wake_r, 512):
+                    pass
+            except BlockingIOError:
+                pass
+        if self._fd not in ready:
+            return []
+        events = []
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset + _EVENT_HEADER.size <= len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].split(b"\0", 1)[0]
+                offset += length
+                events.append(InotifyEvent(mask, os.fsdecode(name)))
+        return events
+
+    def wake(self):
+        """Despierta un read_events en curso (para detener el hilo sin esperar el timeout)."""
+        try:
+            os.write(self._wake_w, b"\0")
+        except (BlockingIOError, OSError):
+            pass
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
@@ -0,0 +1,200 @@
+"""
+Control de admisión de subidas
+==============================
+
+Limita lo que entra al procesamiento para que una sincronización masiva (toda
+la flota al final del turno) no agote memoria ni conexiones de BD:
+
+- ADMISSION_MAX_QUEUED_JOBS     trabajos en cola o en proceso (watcher + subidas)
+- ADMISSION_MAX_INFLIGHT_MB     MB subiéndose o esperando procesamiento
+- ADMISSION_MAX_PER_CLIENT      subidas simultáneas por cliente (IP)
+
+Cada límite en 0 queda deshabilitado. Una subida que no entra recibe
+`AdmissionRejected` con el motivo y los segundos sugeridos para reintentar
+(Retry-After), estimados con la duración media de los últimos procesamientos.
+
+La profundidad de la cola la aporta el watcher (`set_queue_source`); este
+módulo suma las subidas admitidas que todavía no le entregó (recibiéndose o
+procesándose como BackgroundTask sin watcher).
+"""
+
+import math
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from app.core.config import settings
+
+
+class AdmissionRejected(Exception):
+    """La subida supera un límite de admisión (HTTP 429)."""
+
+    def __init__(self, reason: str, retry_after: int, limit: str):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.limit = limit
+
+    def detail(self) -> dict:
+        return {"message": self.reason, "limit": self.limit, "retry_after": self.retry_after}
+
+
+class AdmissionTicket:
+    """Subida admitida: cuenta un trabajo y sus bytes hasta `release()`."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self.bytes = 0
+        self._released = False
+
+    def add_bytes(self, count: int) -> None:
+        """Suma bytes recibidos; lanza AdmissionRejected si se pasa del límite de bytes en vuelo."""
+        self._controller._add_bytes(self, count)
+
+    def transfer(self) -> "AdmissionTicket":
+        """Pasa la cuenta a un ticket nuevo que libera otro (p. ej. una BackgroundTask); este queda liberado."""
+        other = AdmissionTicket(self._controller)
+        other.bytes = self.bytes
+        self._released = True
+        return other
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+
+class AdmissionController:
+    def __init__(self, max_queued_jobs: int = None, max_inflight_bytes: int = None, max_per_client: int = None,
+                 default_job_seconds: float = None):
+        self.max_queued_jobs = settings.ADMISSION_MAX_QUEUED_JOBS if max_queued_jobs is None else max_queued_jobs
+        self.max_inflight_bytes = (settings.ADMISSION_MAX_INFLIGHT_MB * 1024 * 1024
+                                   if max_inflight_bytes is None else max_inflight_bytes)
+        self.max_per_client = settings.ADMISSION_MAX_PER_CLIENT if max_per_client is None else max_per_client
+        self.default_job_seconds = (settings.ADMISSION_DEFAULT_JOB_SECONDS
+                                    if default_job_seconds is None else default_job_seconds)
+        self._lock = threading.Lock()
+        self._tickets = 0
+        self._bytes = 0
+        self._clients: Dict[str, int] = {}
+        self._avg_job_seconds: Optional[float] = None
+        self._jobs_measured = 0
+        self._rejected: Dict[str, int] = {"queued_jobs": 0, "inflight_bytes": 0, "per_client": 0}
+        self._queue_source: Optional[Callable[[], dict]] = None
+
+    def set_queue_source(self, source: Callable[[], dict]) -> None:
+        """Función que retorna el estado de la cola del watcher: depth, running, bytes, workers."""
+        self._queue_source = source
+
+    def _queue(self) -> dict:
+        if self._queue_source is None:
+            return {"depth": 0, "running": 0, "bytes": 0, "workers": 1}
+        return self._queue_source()
+
+    def record_processing(self, seconds: float) -> None:
+        """Registra la duración de un procesamiento (media móvil exponencial para estimar esperas)."""
+        with self._lock:
+            if self._avg_job_seconds is None:
+                self._avg_job_seconds = seconds
+            else:
+                self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * seconds
+            self._jobs_measured += 1
+
+    def _job_seconds(self) -> float:
+        return self._avg_job_seconds if self._avg_job_seconds is not None else self.default_job_seconds
+
+    def _wait_seconds(self, jobs_ahead: int, workers: int) -> float:
+        return self._job_seconds() * jobs_ahead / max(1, workers)
+
+    def _retry_after(self, jobs_over: int, workers: int) -> int:
+        # Lo que tarda en liberarse un lugar (al menos un trabajo), entre 1 s y 10 min
+        return int(min(600, max(1, math.ceil(self._wait_seconds(max(1, jobs_over), workers)))))
+
+    def _reject(self, limit: str, reason: str, jobs_over: int, workers: int):
+        self._rejected[limit] += 1
+        raise AdmissionRejected(reason, self._retry_after(jobs_over, workers), limit)
+
+    def admit(self, expected_bytes: int = 0) -> AdmissionTicket:
+        """Admite un archivo más o lanza AdmissionRejected (límites de cola y de bytes)."""
+        queue = self._queue()
+        with self._lock:
+            depth = queue["depth"] + self._tickets
+            if self.max_queued_jobs and depth >= self.max_queued_jobs:
+                self._reject("queued_jobs", f"Cola de procesamiento llena ({depth}/{self.max_queued_jobs} trabajos)",
+                             depth - self.max_queued_jobs + 1, queue["workers"])
+            inflight = queue["bytes"] + self._bytes
+            # Un archivo solo (sin nada más en vuelo) siempre entra aunque supere el límite
+            if self.max_inflight_bytes and inflight > 0 and inflight + expected_bytes > self.max_inflight_bytes:
+                self._reject("inflight_bytes",
+                             f"Demasiados bytes en proceso ({inflight + expected_bytes}/{self.max_inflight_bytes})",
+                             1, queue["workers"])
+            self._tickets += 1
+            ticket = AdmissionTicket(self)
+        return ticket
+
+    def _add_bytes(self, ticket: AdmissionTicket, count: int) -> None:
+        queue = self._queue()
+        with self._lock:
+            inflight = queue["bytes"] + self._bytes
+            if (self.max_inflight_bytes and inflight > ticket.bytes
+                    and inflight + count > self.max_inflight_bytes):
+                self._reject("inflight_bytes",
+                             f"Demasiados bytes en proceso ({inflight + count}/{self.max_inflight_bytes})",
+                             1, queue["workers"])
+            ticket.bytes += count
+            self._bytes += count
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        with self._lock:
+            self._tickets -= 1
+            self._bytes -= ticket.bytes
+
+    def enter_client(self, client: str) -> None:
+        """Cuenta una petición de subida del cliente o lanza AdmissionRejected (límite por cliente)."""
+        with self._lock:
+            current = self._clients.get(client, 0)
+            if self.max_per_client and current >= self.max_per_client:
+                self._rejected["per_client"] += 1
+                raise AdmissionRejected(
+                    f"Demasiadas subidas simultáneas del cliente {client} ({current}/{self.max_per_client})",
+                    self._retry_after(1, 1), "per_client")
+            self._clients[client] = current + 1
+
+    def leave_client(self, client: str) -> None:
+        with self._lock:
+            current = self._clients.get(client, 0) - 1
+            if current > 0:
+                self._clients[client] = current
+            else:
+                self._clients.pop(client, None)
+
+    def status(self) -> dict:
+        queue = self._queue()
+        with self._lock:
+            depth = queue["depth"] + self._tickets
+            workers = max(1, queue["workers"])
+            waiting = max(0, depth - queue["running"])
+            return {
+                "queue_depth": depth,
+                "running": queue["running"],
+                "waiting": waiting,
+                "workers": workers,
+                "uploads_in_progress": self._tickets,
+                "inflight_bytes": queue["bytes"] + self._bytes,
+                "active_clients": len(self._clients),
+                "avg_job_seconds": round(self._job_seconds(), 2),
+                "jobs_measured": self._jobs_measured,
+                # Espera estimada de un archivo que llega ahora: los que esperan delante
+                # más su propio procesamiento
+                "estimated_wait_seconds": round(self._wait_seconds(waiting, workers) + self._job_seconds(), 1),
+                "limits": {
+                    "max_queued_jobs": self.max_queued_jobs,
+                    "max_inflight_bytes": self.max_inflight_bytes,
+                    "max_per_client": self.max_per_client,
+                },
+                "rejected": dict(self._rejected),
+                "measured_at": time.time(),
+            }
+
+
+admission_controller = AdmissionController()
@@ -11,12 +11,17 @@ CSV Processor wrapper que usa la nueva lógica (algoritmo_posicionv1_0)
 Mantiene la API de la clase anterior para no romper endpoints existentes.
 """
 
-import json
-import sys
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 
 from app.core.config import settings
+from app.services.processing.result_cache import result_cache, sha256_file
+from app.services.processing.tile_warmup import tile_usage
+
+logger = logging.getLogger(__name__)
 
 
 class CSVProcessor:
@@ -43,6 +48,14 @@ class CSVProcessor:
         # Preparar import dinámico del nuevo paquete (lazy)
         self._main = None
         self._busqueda = None
+        self._cache_grafos = None
+        self._prefetch = None
+        self._versiones = None
+        self._archivo_resultado = None
+
+        # Escritura de JSON en segundo plano (se crea al primer uso)
+        self._escritor_json: Optional[ThreadPoolExecutor] = None
+        self._lock_json = threading.Lock()
 
     def _ensure_algo_import(self):
         if self._main is not None and self._busqueda is not None:
@@ -52,6 +65,20 @@ class CSVProcessor:
             # Import using the full package path
             self._main = importlib.import_module("app.services.algoritmo_posicionv1_0.main_procesamiento")  # type: ignore
             self._busqueda = importlib.import_module("app.services.algoritmo_posicionv1_0.algoritmos_busqueda")  # type: ignore
+            self._cache_grafos = importlib.import_module("app.services.algoritmo_posicionv1_0.cache_grafos")  # type: ignore
+            self._cache_grafos.cache_global.configurar(settings.GRAPH_CACHE_MAX_MB * 1024 * 1024)
+            importlib.import_module("app.services.algoritmo_posicionv1_0.artefactos_etapas").configurar(  # type: ignore
+                settings.STAGE_ARTIFACTS_DIR, settings.STAGE_ARTIFACTS_MAX_MB
+            )
+            self._main.configurar_memoria(settings.PROCESSING_LOW_MEMORY, settings.PROCESSING_MEMORY_TRACE)
+            self._archivo_resultado = importlib.import_module("app.services.algoritmo_posicionv1_0.archivo_resultado")  # type: ignore
+            self._archivo_resultado.configurar(settings.RESULT_FILE_FORMAT, settings.RESULT_FILE_COMPRESSION)
+            self._versiones = importlib.import_module("app.services.algoritmo_posicionv1_0.versiones_tiles")  # type: ignore
+            self._prefetch = importlib.import_module("app.services.algoritmo_posicionv1_0.prefetch_tiles")  # type: ignore
+            self._prefetch.prefetcher_global.configurar(
+                distancia_m=settings.GRAPH_PREFETCH_DISTANCE_M,
+                habilitado=settings.GRAPH_PREFETCH_ENABLED,
+            )
         except ImportError as e:
             msg = str(e)
             if "morlet2" in msg or "scipy.signal" in msg:
@@ -79,50 +106,172 @@ class CSVProcessor:
     def procesar_archivo_especifico(self, nombre_archivo: str):
         """Procesa un CSV específico usando la nueva lógica.
         - Ejecuta main.procesar_archivos
-        - Carga el JSON histórico correspondiente y lo retorna (lista de segmentos)
+        - Retorna la lista de segmentos (formato del JSON histórico)
+
+        Los JSON se escriben antes de retornar (salvo RESULT_JSON_PERSIST=off)
+        porque los endpoints que usan este método los leen de disco a continuación.
+        """
+        modo = "off" if settings.RESULT_JSON_PERSIST == "off" else "sync"
+        resultado, diagnostico = self.procesar_archivo_con_diagnostico(nombre_archivo, persistir_json=modo)
+
+        # Conteo de uso por tile para el precalentamiento al iniciar
+        tile_usage.record(diagnostico["grafos_usados"])
+        return resultado
+
+    def procesar_archivo_con_diagnostico(self, nombre_archivo: str, persistir_json: Optional[str] = None,
+                                         content_hash: Optional[str] = None):
+        """Igual que procesar_archivo_especifico pero retorna (segmentos, diagnóstico)
+        y no registra el uso de tiles (lo hace quien recibe el diagnóstico, p. ej.
+        el proceso principal cuando el archivo se procesó en un worker del pool).
+
+        Los segmentos se retornan en memoria; los JSON de salida se escriben según
+        `persistir_json` ("async", "sync" u "off"; por defecto RESULT_JSON_PERSIST).
+        `content_hash` es el SHA-256 del CSV si quien llama ya lo calculó.
         """
         csv_path = self._csv_raw / nombre_archivo
         if not csv_path.exists():
             raise FileNotFoundError(f"CSV no encontrado en raw: {csv_path}")
+        return self._procesar(csv_path, persistir_json or settings.RESULT_JSON_PERSIST, mover_csv=True,
+                              content_hash=content_hash)
+
+    def reprocesar_archivo(self, ruta_csv: str, persistir_json: Optional[str] = None,
+                           content_hash: Optional[str] = None):
+        """Procesa un CSV de cualquier carpeta (p. ej. procesados) sin moverlo.
+
+        Retorna (segmentos, diagnóstico) igual que procesar_archivo_con_diagnostico;
+        los JSON se escriben en el momento salvo RESULT_JSON_PERSIST=off.
+        """
+        csv_path = Path(ruta_csv)
+        if not csv_path.exists():
+            raise FileNotFoundError(f"CSV no encontrado: {csv_path}")
+        modo = persistir_json or ("off" if settings.RESULT_JSON_PERSIST == "off" else "sync")
+        return self._procesar(csv_path, modo, mover_csv=False, content_hash=content_hash)
+
+    def _procesar(self, csv_path: Path, modo: str, mover_csv: bool, content_hash: Optional[str] = None):
+        nombre_archivo = csv_path.name
 
         # Cargar módulos de algoritmos si hace falta
         self._ensure_algo_import()
 
+        # Hash del contenido antes de que el CSV se mueva a procesados (clave de la cache de resultados
+        # y de los artefactos por etapa); se calcula una sola vez si quien llama no lo trae
+        if content_hash is None and (result_cache.enabled or settings.STAGE_ARTIFACTS_DIR):
+            content_hash = sha256_file(csv_path)
+
         # Ejecutar el procesamiento con rutas mapeadas
-        # Nota: el main guarda 2 archivos:
-        #  - output/datos{contador}.json (rápido)
-        #  - storage/datos{<nombre_csv>}save.json (histórico y único)
-        self._main.procesar_archivos(
+        # Nota: con JSON habilitado el main guarda 2 archivos (ver archivo_resultado):
+        #  - output/datos{<nombre_csv>}-{trabajo}.ndjson.gz (rápido, único por trabajo)
+        #  - storage/datos{<nombre_csv>}save.ndjson.gz (histórico y único)
+        resultado = self._main.procesar_archivos(
             dato=nombre_archivo,
-            carpeta_csv=str(self._csv_raw),
+            carpeta_csv=str(csv_path.parent),
             carpeta_archivos_json=str(self._json_output),
             carpeta_almacenamiento_json=str(self._json_storage),
             carpeta_almacenamiento_csv=str(self._csv_processed),
             umbral=3.0,
             carpeta_grafos=str(self._graphs_dir),
+            guardar_json=(modo == "sync"),
+            mover_csv=mover_csv,
+            hash_contenido=content_hash,
         )
+        diagnostico = resultado.diagnostico
+        contadores = diagnostico["contadores"]
+        logger.info(
+            f"🔎 Diagnóstico {nombre_archivo} (tiles {diagnostico['version_tiles']}): {len(resultado)} segmentos, "
+            f"{contadores['muestras_procesadas']} muestras, {contadores['dentro_corredor']} en corredor, "
+            f"{contadores['busquedas_vecinos']} BFS vecinos, {contadores['candidatos_evaluados']} candidatos, "
+            f"{contadores['busquedas_pesadas']} búsquedas pesadas, {contadores['cambios_grafo']} cambios de grafo "
+            f"({contadores['aciertos_cache_grafo']} desde cache), "
+            f"tiempos={diagnostico['tiempos']} total={diagnostico['tiempo_total']}s"
+        )
+
+        diagnostico["hash_contenido"] = content_hash
+        if resultado.segmentos:
+            if modo == "async":
+                self._escribir_json_async(resultado)
+            result_cache.store(content_hash, resultado.version_algoritmo, resultado.version_tiles,
+                               nombre_archivo, resultado.segmentos)
+        return resultado.segmentos, diagnostico
+
+    def _escribir_json_async(self, resultado) -> None:
+        """Escribe los JSON de salida en segundo plano (el resultado ya va en memoria a la BD)."""
+        with self._lock_json:
+            if self._escritor_json is None:
+                self._escritor_json = ThreadPoolExecutor(max_workers=1, thread_name_prefix="json-writer")
+            futuro = self._escritor_json.submit(
+                self._main.escribir_resultado_json, resultado.segmentos, resultado.archivo,
+                str(self._json_output), str(self._json_storage), version_tiles=resultado.version_tiles,
+            )
+
+        def _registrar_error(f, nombre=resultado.archivo):
+            if f.exception() is not None:
+                logger.warning(f"⚠️ No se pudo escribir el JSON de {nombre}: {f.exception()}")
+        futuro.add_done_callback(_registrar_error)
+
+    def vista_previa(self, ruta_csv: str) -> dict:
+        """Resultado aproximado por segmento en segundos (matching diezmado, solo índices de energía).
+
+        No mueve el CSV ni guarda nada; el procesamiento completo lo reemplaza al terminar.
+        """
+        self._ensure_algo_import()
+        import importlib
+        vista_previa = importlib.import_module("app.services.algoritmo_posicionv1_0.vista_previa")  # type: ignore
+        return vista_previa.vista_previa(str(ruta_csv), str(self._graphs_dir), settings.PREVIEW_DECIMATION_M)
+
+    def ruta_resultado(self, nombre_csv: str) -> Optional[Path]:
+        """Archivo de resultado de un CSV: el histórico (cualquier formato) o, si no está,
+        el más reciente de ese CSV en la salida rápida. None si no hay ninguno."""
+        self._ensure_algo_import()
+        historico = self._archivo_resultado.buscar_historico(str(self._json_storage), nombre_csv)
+        if historico is not None:
+            return Path(historico)
+        base = nombre_csv[:-4] if nombre_csv.lower().endswith('.csv') else nombre_csv
+        candidatos = [p for p in self._json_output.glob(f"datos{base}*")
+                      if self._archivo_resultado.es_archivo_resultado(p.name)]
+        return max(candidatos, key=lambda p: p.stat().st_mtime) if candidatos else None
 
-        # Buscar el JSON histórico por nombre determinístico
-        base = nombre_archivo[:-4] if nombre_archivo.lower().endswith(".csv") else nombre_archivo
-        hist_json = self._json_storage / f"datos{base}save.json"
-        if hist_json.exists():
-            try:
-                with open(hist_json, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception:
-                # Fallback: devolver None si no se pudo leer
-                return None
-
-        # Fallback: intentar el último JSON en output
-        candidates = sorted(self._json_output.glob("datos*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
-        if candidates:
-            try:
-                with open(candidates[0], "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception:
-                return None
-
-        return None
+    def leer_resultado(self, ruta: str) -> list:
+        """Segmentos de un archivo de resultado (JSON legado o ndjson compacto)."""
+        self._ensure_algo_import()
+        return self._archivo_resultado.leer_resultado(str(ruta))
+
+    def leer_versiones_resultado(self, ruta: str) -> dict:
+        """Versiones de algoritmo y tiles registradas en un archivo de resultado (None si no las tiene)."""
+        self._ensure_algo_import()
+        return self._archivo_resultado.leer_versiones(str(ruta))
+
+    def es_archivo_resultado(self, nombre: str) -> bool:
+        self._ensure_algo_import()
+        return self._archivo_resultado.es_archivo_resultado(nombre)
+
+    def versiones_actuales(self) -> Tuple[str, str]:
+        """(versión del algoritmo, versión de tiles actual) con las que se procesaría un archivo ahora."""
+        self._ensure_algo_import()
+        version_tiles = self._versiones.resolver_version(str(self._graphs_dir)).nombre
+        return self._main.VERSION_ALGORITMO, version_tiles
+
+    def buscar_resultado_cache(self, content_hash: str, solo_guardados: bool = True):
+        """Resultado guardado para ese contenido con las versiones actuales de algoritmo y tiles (o None).
+
+        Con `solo_guardados` solo cuentan los resultados cuyo paso a BD ya se confirmó.
+        """
+        if not result_cache.enabled:
+            return None
+        version_algoritmo, version_tiles = self.versiones_actuales()
+        return result_cache.lookup(content_hash, version_algoritmo, version_tiles, committed_only=solo_guardados)
+
+    def marcar_resultado_guardado(self, content_hash: Optional[str], version_algoritmo: Optional[str],
+                                  version_tiles: Optional[str]) -> None:
+        """Marca en la cache de resultados que el viaje ya quedó en BD (tras el commit)."""
+        if not result_cache.enabled or not (content_hash and version_algoritmo and version_tiles):
+            return
+        result_cache.mark_committed(content_hash, version_algoritmo, version_tiles)
+
+    def archivar_duplicado(self, nombre_archivo: str) -> None:
+        """Mueve a procesados un CSV de raw cuyo resultado ya estaba en cache, sin procesarlo."""
+        origen = self._csv_raw / nombre_archivo
+        if origen.exists():
+            origen.replace(self._csv_processed / nombre_archivo)
 
     def process_csv_file(self, csv_file_path: str):
         """Compatibilidad: procesa un CSV por ruta absoluta.
@@ -148,6 +297,60 @@ class CSVProcessor:
             p = Path(carpeta)
             return [f.name for f in p.glob(f"{prefijo}*.csv")]
 
+    def precargar_tile(self, id_tile) -> int:
+        """Carga un tile de la versión actual en la cache de grafos del proceso y retorna su tamaño estimado en bytes."""
+        self._ensure_algo_import()
+        with self._versiones.usar_version(str(self._graphs_dir)) as version:
+            tile, _ = self._main.obtener_tile(version.carpeta, version.carpeta, self._main.mt.normalizar_id(id_tile))
+        return tile.tamano_bytes
+
+    def estimar_tamano_tile(self, id_tile):
+        """Memoria estimada de un tile de la versión actual sin cargarlo (None si no está en el manifiesto)."""
+        self._ensure_algo_import()
+        carpeta = self._versiones.resolver_version(str(self._graphs_dir)).carpeta
+        return self._main.estimar_tamano_tile(carpeta, self._main.mt.normalizar_id(id_tile))
+
+    def resolver_tile(self, latitud: float, longitud: float) -> str:
+        """Tile de la versión actual que contiene el punto (vía manifiesto)."""
+        self._ensure_algo_import()
+        carpeta = self._versiones.resolver_version(str(self._graphs_dir)).carpeta
+        return str(self._main.mt.resolver_grafo(carpeta, latitud, longitud))
+
+    def versiones_tiles(self) -> dict:
+        """Versión actual de tiles, versiones disponibles y uso en este proceso."""
+        self._ensure_algo_import()
+        carpeta = str(self._graphs_dir)
+        return {
+            "actual": self._versiones.resolver_version(carpeta).nombre,
+            "versiones": self._versiones.listar_versiones(carpeta),
+            "registro": self._versiones.registro_versiones.metricas(),
+        }
+
+    def activar_version_tiles(self, version: str) -> dict:
+        """Activa una versión de tiles: los trabajos nuevos la usan y los en curso terminan con la anterior."""
+        self._ensure_algo_import()
+        anterior = self._versiones.resolver_version(str(self._graphs_dir)).nombre
+        activada = self._versiones.activar_version(str(self._graphs_dir), version)
+        logger.info(f"🔁 Versión de tiles activada: {anterior} → {activada.nombre}")
+        return {"anterior": anterior, "actual": activada.nombre, "carpeta": activada.carpeta}
+
+    def configurar_cache_grafos(self, limite_bytes: int) -> None:
+        """Cambia el presupuesto de la cache de tiles de este proceso (p. ej. la parte de un worker del pool)."""
+        self._ensure_algo_import()
+        self._cache_grafos.cache_global.configurar(limite_bytes)
+
+    def metricas_cache_grafos(self) -> dict:
+        """Métricas de la cache de tiles de grafo de este proceso (vacío si aún no se cargó el algoritmo)."""
+        if self._cache_grafos is None:
+            return {}
+        metricas = self._cache_grafos.cache_global.metricas()
+        if self._prefetch is not None:
+            metricas["prefetch"] = self._prefetch.prefetcher_global.metricas()
+        if self._versiones is not None:
+            metricas["versiones"] = self._versiones.registro_versiones.metricas()
+        metricas["resultados"] = result_cache.metrics()
+        return metricas
+
     @property
     def carpeta_csv(self) -> str:
         return str(self._csv_raw)
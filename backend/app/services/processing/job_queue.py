@@ -0,0 +1,382 @@
+"""
+Cola de trabajos de procesamiento en BD (tabla processing_jobs)
+===============================================================
+
+Con JOB_QUEUE_ENABLED el watcher y las subidas no procesan el CSV en memoria:
+registran un trabajo en BD y cualquier instancia del backend (en este u otro
+host, con las carpetas de uploads compartidas) lo toma:
+
+    pending ──claim──▶ running ──complete──▶ done
+       ▲                  │
+       └──backoff── fail / lease vencido ──(sin intentos)──▶ failed
+
+- `claim` toma el trabajo pendiente más antiguo con SELECT ... FOR UPDATE SKIP
+  LOCKED: dos workers nunca toman el mismo trabajo y no se bloquean entre sí
+- El worker que lo toma tiene un lease de JOB_LEASE_SECONDS que renueva con
+  `heartbeat` mientras procesa. Si la instancia muere el lease vence y
+  `reclaim_expired` devuelve el trabajo a pending (o a failed sin intentos)
+- Los reintentos esperan JOB_BACKOFF_BASE_SECONDS * 2^(intentos-1), hasta
+  JOB_BACKOFF_MAX_SECONDS. `PermanentJobError` marca failed sin reintentar
+- Un índice único parcial deja un solo trabajo activo por archivo, así que
+  varias instancias pueden encolar el mismo CSV sin duplicarlo
+- Las horas se toman del servidor de BD para no depender del reloj de cada host
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.database.session import SessionLocal
+from app.models.jobs import JOB_ACTIVE_STATES, ProcessingJob
+
+logger = logging.getLogger(__name__)
+
+JOB_STATES = ("pending", "running", "done", "failed")
+
+
+class PermanentJobError(Exception):
+    """Error que no se arregla reintentando (archivo inexistente, vacío, etc.)."""
+
+
+def _job_dict(job: ProcessingJob) -> dict:
+    return {
+        "id": job.id,
+        "file_path": job.file_path,
+        "file_name": job.file_name,
+        "source": job.source,
+        "content_hash": job.content_hash,
+        "state": job.state,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "lease_owner": job.lease_owner,
+        "lease_expires_at": job.lease_expires_at,
+        "next_attempt_at": job.next_attempt_at,
+        "result": job.result,
+        "last_error": job.last_error,
+    }
+
+
+class JobQueue:
+    """Operaciones sobre la tabla processing_jobs. Cada método usa su propia sesión y transacción."""
+
+    def __init__(self, session_factory=SessionLocal, lease_seconds: float = None, max_attempts: int = None,
+                 backoff_base: float = None, backoff_max: float = None):
+        self.session_factory = session_factory
+        self.lease_seconds = lease_seconds if lease_seconds is not None else settings.JOB_LEASE_SECONDS
+        self.max_attempts = max_attempts if max_attempts is not None else settings.JOB_MAX_ATTEMPTS
+        self.backoff_base = backoff_base if backoff_base is not None else settings.JOB_BACKOFF_BASE_SECONDS
+        self.backoff_max = backoff_max if backoff_max is not None else settings.JOB_BACKOFF_MAX_SECONDS
+
+    @staticmethod
+    def _now(db):
+        return db.execute(select(func.now(type_=ProcessingJob.created_at.type))).scalar()
+
+    def backoff(self, attempts: int) -> float:
+        return min(self.backoff_max, self.backoff_base * (2 ** max(0, attempts - 1)))
+
+    def enqueue(self, file_path: str, source: str = "watcher", content_hash: Optional[str] = None) -> int:
+        """Registra un trabajo para el archivo. Si ya hay uno activo retorna su id sin crear otro."""
+        file_path = str(file_path)
+        db = self.session_factory()
+        try:
+            job = ProcessingJob(file_path=file_path, file_name=Path(file_path).name, source=source,
+                                content_hash=content_hash, state="pending", attempts=0,
+                                max_attempts=self.max_attempts, next_attempt_at=self._now(db))
+            db.add(job)
+            try:
+                db.commit()
+                return job.id
+            except IntegrityError:
+                db.rollback()
+            existing = (db.query(ProcessingJob.id)
+                        .filter(ProcessingJob.file_path == file_path,
+                                ProcessingJob.state.in_(JOB_ACTIVE_STATES))
+                        .scalar())
+            if existing is None:
+                raise RuntimeError(f"No se pudo encolar {file_path}")
+            return existing
+        finally:
+            db.close()
+
+    def claim(self, worker_id: str) -> Optional[dict]:
+        """Toma el trabajo pendiente más antiguo cuyo backoff ya venció (None si no hay)."""
+        db = self.session_factory()
+        try:
+            now = self._now(db)
+            job = (db.query(ProcessingJob)
+                   .filter(ProcessingJob.state == "pending", ProcessingJob.next_attempt_at <= now)
+                   .order_by(ProcessingJob.next_attempt_at, ProcessingJob.id)
+                   .with_for_update(skip_locked=True)
+                   .limit(1)
+                   .first())
+            if job is None:
+                db.commit()
+                return None
+            job.state = "running"
+            job.attempts += 1
+            job.lease_owner = worker_id
+            job.lease_expires_at = now + timedelta(seconds=self.lease_seconds)
+            job.updated_at = now
+            db.commit()
+            return _job_dict(job)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def reclaim_expired(self, limit: int = 100) -> int:
+        """Devuelve a pending (con backoff) los trabajos running con lease vencido; sin intentos, a failed."""
+        db = self.session_factory()
+        try:
+            now = self._now(db)
+            expired = (db.query(ProcessingJob)
+                       .filter(ProcessingJob.state == "running", ProcessingJob.lease_expires_at < now)
+                       .order_by(ProcessingJob.lease_expires_at)
+                       .with_for_update(skip_locked=True)
+                       .limit(limit)
+                       .all())
+            for job in expired:
+                logger.warning(f"⏰ Lease vencido del trabajo {job.id} ({job.file_name}, {job.lease_owner})")
+                self._retry_or_fail(job, now, f"lease vencido ({job.lease_owner})")
+            db.commit()
+            return len(expired)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _retry_or_fail(self, job: ProcessingJob, now, error: str, retry: bool = True) -> None:
+        job.last_error = error
+        job.lease_owner = None
+        job.lease_expires_at = None
+        job.updated_at = now
+        if retry and job.attempts < job.max_attempts:
+            job.state = "pending"
+            job.next_attempt_at = now + timedelta(seconds=self.backoff(job.attempts))
+        else:
+            job.state = "failed"
+            job.finished_at = now
+
+    def _owned(self, db, job_id: int, worker_id: str):
+        return (db.query(ProcessingJob)
+                .filter(and_(ProcessingJob.id == job_id, ProcessingJob.state == "running",
+                             ProcessingJob.lease_owner == worker_id))
+                .with_for_update()
+                .first())
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """Renueva el lease. False si el trabajo ya no es de este worker (lease vencido y reasignado)."""
+        db = self.session_factory()
+        try:
+            job = self._owned(db, job_id, worker_id)
+            if job is None:
+                db.commit()
+                return False
+            now = self._now(db)
+            job.lease_expires_at = now + timedelta(seconds=self.lease_seconds)
+            job.updated_at = now
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    def complete(self, job_id: int, worker_id: str, result: str = "done") -> bool:
+        db = self.session_factory()
+        try:
+            job = self._owned(db, job_id, worker_id)
+            if job is None:
+                db.commit()
+                return False
+            now = self._now(db)
+            job.state = "done"
+            job.result = result
+            job.lease_owner = None
+            job.lease_expires_at = None
+            job.updated_at = now
+            job.finished_at = now
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    def fail(self, job_id: int, worker_id: str, error: str, retry: bool = True) -> Optional[str]:
+        """Registra el error: vuelve a pending con backoff o queda en failed. Retorna el nuevo estado."""
+        db = self.session_factory()
+        try:
+            job = self._owned(db, job_id, worker_id)
+            if job is None:
+                db.commit()
+                return None
+            self._retry_or_fail(job, self._now(db), error[:2000], retry)
+            db.commit()
+            return job.state
+        finally:
+            db.close()
+
+    def get(self, job_id: int) -> Optional[dict]:
+        db = self.session_factory()
+        try:
+            job = db.get(ProcessingJob, job_id)
+            return _job_dict(job) if job is not None else None
+        finally:
+            db.close()
+
+    def wait(self, job_id: int, timeout: float, poll: float = 0.5) -> Optional[dict]:
+        """Espera a que el trabajo termine (done o failed) o a que venza el timeout. Retorna su estado."""
+        deadline = time.time() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["state"] in ("done", "failed") or time.time() >= deadline:
+                return job
+            time.sleep(poll)
+
+    def stats(self) -> Dict[str, int]:
+        db = self.session_factory()
+        try:
+            rows = (db.query(ProcessingJob.state, func.count(ProcessingJob.id))
+                    .group_by(ProcessingJob.state)
+                    .all())
+            counts = {state: 0 for state in JOB_STATES}
+            counts.update({state: count for state, count in rows})
+            return counts
+        finally:
+            db.close()
+
+
+class JobWorker:
+    """Hilos que toman trabajos de la cola y los ejecutan con `handler(job) -> resultado`.
+
+    `handler` lanza PermanentJobError para fallar sin reintento y cualquier otra
+    excepción para reintentar con backoff. Mientras corre, un hilo renueva el lease.
+    """
+
+    def __init__(self, queue: JobQueue, handler: Callable[[dict], str], workers: int,
+                 poll_seconds: float = None):
+        self.queue = queue
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.poll_seconds = poll_seconds if poll_seconds is not None else settings.JOB_POLL_SECONDS
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._last_reclaim = 0.0
+        self._reclaim_lock = threading.Lock()
+        self.jobs_done = 0
+        self.jobs_failed = 0
+
+    def start(self):
+        self._stop_event.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"📬 Cola de trabajos en BD: {self.workers} workers en {socket.gethostname()}")
+
+    def stop(self, timeout: float = 10):
+        self._stop_event.set()
+        self._wake_event.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    @property
+    def is_running(self) -> bool:
+        return any(t.is_alive() for t in self._threads) and not self._stop_event.is_set()
+
+    def notify(self):
+        """Despierta a los workers sin esperar el siguiente sondeo (trabajo encolado en esta instancia)."""
+        self._wake_event.set()
+
+    def _worker_id(self) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+
+    def _maybe_reclaim(self):
+        # Una sola revisión de leases vencidos por intervalo de sondeo en toda la instancia
+        with self._reclaim_lock:
+            if time.time() - self._last_reclaim < self.poll_seconds:
+                return
+            self._last_reclaim = time.time()
+        try:
+            self.queue.reclaim_expired()
+        except Exception as e:
+            logger.error(f"Error recuperando leases vencidos: {e}")
+
+    def _run(self):
+        worker_id = self._worker_id()
+        while not self._stop_event.is_set():
+            self._maybe_reclaim()
+            try:
+                job = self.queue.claim(worker_id)
+            except Exception as e:
+                logger.error(f"Error tomando trabajo de la cola: {e}")
+                job = None
+            if job is None:
+                self._wake_event.wait(self.poll_seconds)
+                self._wake_event.clear()
+                continue
+            try:
+                self._execute(job, worker_id)
+            except Exception as e:
+                # No se pudo registrar el resultado: el lease vence y el trabajo se reintenta
+                logger.error(f"Error registrando el resultado del trabajo {job['id']}: {e}")
+
+    def _execute(self, job: dict, worker_id: str):
+        logger.info(f"🛠️ Trabajo {job['id']} ({job['file_name']}), intento {job['attempts']}/{job['max_attempts']}")
+        done = threading.Event()
+
+        def renew():
+            while not done.wait(self.queue.lease_seconds / 3):
+                try:
+                    if not self.queue.heartbeat(job["id"], worker_id):
+                        logger.warning(f"⚠️ Se perdió el lease del trabajo {job['id']} ({job['file_name']})")
+                        return
+                except Exception as e:
+                    logger.error(f"Error renovando lease del trabajo {job['id']}: {e}")
+
+        heartbeat = threading.Thread(target=renew, name=f"lease-{job['id']}", daemon=True)
+        heartbeat.start()
+        try:
+            result = self.handler(job)
+            self.queue.complete(job["id"], worker_id, result or "done")
+            self.jobs_done += 1
+            logger.info(f"✅ Trabajo {job['id']} terminado ({job['file_name']}: {result})")
+        except PermanentJobError as e:
+            self.jobs_failed += 1
+            self.queue.fail(job["id"], worker_id, str(e), retry=False)
+            logger.error(f"❌ Trabajo {job['id']} fallido sin reintento ({job['file_name']}): {e}")
+        except Exception as e:
+            self.jobs_failed += 1
+            state = self.queue.fail(job["id"], worker_id, f"{type(e).__name__}: {e}")
+            logger.error(f"❌ Trabajo {job['id']} con error ({job['file_name']}), queda {state}: {e}")
+        finally:
+            done.set()
+            heartbeat.join(timeout=5)
+
+    def status(self) -> dict:
+        try:
+            counts = self.queue.stats()
+        except Exception as e:
+            counts = {"error": str(e)}
+        return {
+            "workers": self.workers,
+            "running": self.is_running,
+            "jobs_done": self.jobs_done,
+            "jobs_failed": self.jobs_failed,
+            "lease_seconds": self.queue.lease_seconds,
+            "max_attempts": self.queue.max_attempts,
+            "states": counts,
+        }
+
+
+job_queue = JobQueue()
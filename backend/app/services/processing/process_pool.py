@@ -0,0 +1,448 @@
+"""
+Pool persistente de procesos para el procesamiento CSV → JSON
+=============================================================
+
+- El matching es mayormente Python con el GIL tomado (networkx, shapely, bucle
+  de muestras), así que varios hilos se serializan y además frenan el event loop
+  de la API. El pool usa procesos, uno por núcleo disponible (menos uno para la API)
+- Los workers viven mientras viva el servicio: su cache de tiles, el prefetcher y
+  los núcleos de la wavelet quedan calientes entre archivos
+- El presupuesto de la cache de tiles (GRAPH_CACHE_MAX_MB) se reparte entre los
+  workers: cada uno configura su cache con su parte, así el total en memoria
+  sigue siendo el configurado
+- Los tiles más usados se reparten por turnos entre los workers (el worker i
+  precarga los tiles i, i + N, ...): cada tile caliente queda en un solo worker y
+  la afinidad le manda los viajes de esa zona
+- Afinidad por tile: cada worker es un executor de un solo proceso, así el
+  planificador elige a qué worker va cada viaje. Se lee el primer fix GPS del CSV
+  (sin parsearlo completo), se resuelve su tile y el viaje va al worker que ya
+  tiene ese tile en cache; si ese worker está más cargado que el resto se usa el
+  menos cargado para no concentrar todo en uno
+- Dentro de los workers los viajes largos no se parten en tramos paralelos
+  (TRAMOS_WORKERS = 1): el paralelismo es entre archivos y no se anidan pools
+- El resultado (segmentos + diagnóstico) o la excepción vuelven al proceso
+  principal; el registro de uso de tiles y el paso a BD se hacen allí
+- Si un worker muere (p. ej. por memoria) se recrea solo ese worker
+"""
+
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Callable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.services.processing.tile_warmup import tile_usage
+
+logger = logging.getLogger(__name__)
+
+# Bytes que se leen del final del CSV para encontrar el primer fix del viaje
+_TAIL_BYTES = 8192
+
+
+def available_cores() -> int:
+    """Núcleos que el proceso puede usar (respeta la afinidad de CPU del contenedor)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _parse_fix(line: str, lat_idx: int, lon_idx: int) -> Optional[Tuple[float, float]]:
+    parts = line.split(",")
+    if len(parts) <= max(lat_idx, lon_idx):
+        return None
+    try:
+        lat, lon = float(parts[lat_idx]), float(parts[lon_idx])
+    except ValueError:
+        return None
+    if lat == 0.0 and lon == 0.0:
+        return None
+    return lat, lon
+
+
+def read_first_gps_fix(path: Path) -> Optional[Tuple[float, float]]:
+    """Primer fix GPS válido del viaje sin parsear el CSV completo.
+
+    La app exporta las muestras de la más reciente a la más antigua, así que el
+    inicio del viaje está al final del archivo: se lee el encabezado y el último
+    bloque del archivo. Retorna (lat, lon) o None si no se encuentra.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = None
+            for raw in f:
+                line = raw.decode("utf-8", errors="ignore").strip()
+                if line and not line.startswith("#"):
+                    header = line.split(",")
+                    break
+            if header is None or "gps_lat" not in header or "gps_lng" not in header:
+                return None
+            lat_idx, lon_idx = header.index("gps_lat"), header.index("gps_lng")
+            data_start = f.tell()
+
+            size = f.seek(0, os.SEEK_END)
+            f.seek(max(data_start, size - _TAIL_BYTES))
+            tail = f.read().decode("utf-8", errors="ignore").splitlines()
+        # La primera línea del bloque puede estar cortada; se recorre desde el final
+        for line in reversed(tail[1:] if len(tail) > 1 else tail):
+            fix = _parse_fix(line.strip(), lat_idx, lon_idx)
+            if fix is not None:
+                return fix
+    except OSError:
+        return None
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Funciones que se ejecutan dentro de los workers
+# ---------------------------------------------------------------------------
+
+_worker_state = {"pid": None, "warmup": None}
+
+
+def _init_worker(warm_tiles_list: List[str], cache_bytes: int):
+    """Inicializador de cada worker: carga el algoritmo y precalienta su cache de tiles.
+
+    `cache_bytes` es la parte del presupuesto de tiles que le toca a este worker.
+    """
+    from app.services.processing.csv_processor import csv_processor
+    from app.services.processing.tile_warmup import warm_tiles
+
+    _worker_state["pid"] = os.getpid()
+    try:
+        csv_processor._ensure_algo_import()
+        csv_processor.configurar_cache_grafos(cache_bytes)
+        # El pool ya reparte los archivos entre núcleos: un viaje largo va en serie dentro de su
+        # worker en lugar de abrir otro pool de procesos (cada uno con su propia cache de tiles)
+        importlib.import_module("app.services.algoritmo_posicionv1_0.procesamiento_tramos").TRAMOS_WORKERS = 1
+        _worker_state["warmup"] = warm_tiles(warm_tiles_list) if warm_tiles_list else None
+    except Exception as e:
+        # Un worker sin precalentar sigue siendo útil: carga los tiles al usarlos
+        _worker_state["warmup"] = {"error": str(e)}
+
+
+def _worker_info() -> dict:
+    from app.services.processing.csv_processor import csv_processor
+
+    return {
+        "pid": os.getpid(),
+        "warmup": _worker_state["warmup"],
+        "graph_cache": csv_processor.metricas_cache_grafos(),
+    }
+
+
+def _process_in_worker(filename: str, content_hash: Optional[str] = None):
+    from app.services.processing.csv_processor import csv_processor
+
+    result, diagnostico = csv_processor.procesar_archivo_con_diagnostico(filename, content_hash=content_hash)
+    diagnostico["worker_pid"] = os.getpid()
+    return result, diagnostico
+
+
+# ---------------------------------------------------------------------------
+# Proceso principal
+# ---------------------------------------------------------------------------
+
+class _WorkerSlot:
+    """Un worker del pool: executor de un proceso y lo que se sabe de su cache."""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.pid: Optional[int] = None
+        self.warmup = None
+        self.warmed_at: Optional[float] = None
+        self.tiles: Set[str] = set()
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+        self.routed_affinity = 0
+        self.routed_least_loaded = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def update_cache(self, graph_cache: dict):
+        # Métricas acumuladas de la cache del worker (se reinician si el worker se recrea)
+        if not graph_cache:
+            return
+        self.tiles = set(graph_cache.get("claves", []))
+        self.cache_hits = graph_cache.get("aciertos", 0)
+        self.cache_misses = graph_cache.get("fallos", 0)
+
+    def status(self) -> dict:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "index": self.index,
+            "pid": self.pid,
+            "alive": self.executor is not None,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "restarts": self.restarts,
+            "tiles": sorted(self.tiles),
+            "routed_affinity": self.routed_affinity,
+            "routed_least_loaded": self.routed_least_loaded,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": (self.cache_hits / lookups) if lookups else 0.0,
+            "warmup": self.warmup,
+        }
+
+
+class ProcessingPool:
+    """Pool de procesos con workers persistentes y planificación por afinidad de tile."""
+
+    def __init__(self, enabled: bool, max_workers: int, affinity: bool = True, max_imbalance: int = 1):
+        self.enabled = enabled
+        self.max_workers = max_workers if max_workers > 0 else max(1, available_cores() - 1)
+        self.affinity = affinity
+        self.max_imbalance = max_imbalance
+        self._lock = threading.Lock()
+        self._slots = [_WorkerSlot(i) for i in range(self.max_workers)]
+        self._state = {
+            "status": "stopped",  # stopped | starting | ready
+            "started_at": None,
+            "warmup_planned": [],
+            "warmup_started_at": None,
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "unresolved_tile": 0,
+        }
+
+    def _create_executor(self, slot: _WorkerSlot) -> ProcessPoolExecutor:
+        top = tile_usage.top(settings.GRAPH_WARMUP_TOP_N) if settings.GRAPH_WARMUP_ENABLED else []
+        self._state["warmup_planned"] = top
+        # Cada worker precarga solo su parte de los tiles calientes (por turnos según su índice)
+        warm = top[slot.index::self.max_workers]
+        # Cada worker tiene su propia cache: el presupuesto total se reparte entre todos
+        cache_bytes = int(settings.GRAPH_CACHE_MAX_MB * 1024 * 1024) // self.max_workers
+        # spawn: el proceso principal tiene hilos (uvicorn, watcher) y fork los copiaría a medias
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(warm, cache_bytes),
+        )
+
+    def _get_executor(self, slot: _WorkerSlot) -> ProcessPoolExecutor:
+        # Llamar con self._lock tomado
+        if slot.executor is None:
+            slot.executor = self._create_executor(slot)
+            if self._state["started_at"] is None:
+                self._state["started_at"] = time.time()
+        return slot.executor
+
+    def start(self, on_ready: Optional[Callable[[], None]] = None) -> bool:
+        """Arranca los workers en segundo plano; `on_ready` se ejecuta cuando todos están calientes."""
+        if not self.enabled:
+            if on_ready is not None:
+                on_ready()
+            return False
+        with self._lock:
+            self._state["status"] = "starting"
+            self._state["warmup_started_at"] = time.time()
+            for slot in self._slots:
+                slot.warmed_at = None
+            futures = [(slot, self._get_executor(slot).submit(_worker_info)) for slot in self._slots]
+        logger.info(f"⚙️ Iniciando pool de procesamiento con {self.max_workers} workers")
+
+        def wait_ready():
+            for slot, future in futures:
+                try:
+                    info = future.result()
+                    with self._lock:
+                        slot.pid = info["pid"]
+                        slot.warmup = info["warmup"]
+                        slot.update_cache(info["graph_cache"])
+                except Exception as e:
+                    logger.error(f"❌ Error iniciando worker {slot.index} del pool: {e}")
+                    with self._lock:
+                        slot.warmup = {"error": str(e)}
+                with self._lock:
+                    slot.warmed_at = time.time()
+            with self._lock:
+                self._state["status"] = "ready"
+            logger.info(f"✅ Pool de procesamiento listo ({self.max_workers} workers)")
+            if on_ready is not None:
+                on_ready()
+
+        threading.Thread(target=wait_ready, name="processing-pool-start", daemon=True).start()
+        return True
+
+    def _resolve_tile(self, filename: str) -> Optional[str]:
+        from app.services.processing.csv_processor import csv_processor
+
+        fix = read_first_gps_fix(Path(settings.CSV_RAW_DIR) / filename)
+        if fix is None:
+            return None
+        try:
+            return csv_processor.resolver_tile(*fix)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo resolver el tile de {filename}: {e}")
+            return None
+
+    def _choose_slot(self, tile: Optional[str]) -> Tuple[_WorkerSlot, bool]:
+        # Llamar con self._lock tomado. Retorna (worker, por_afinidad)
+        least_loaded = min(self._slots, key=lambda s: (s.in_flight, len(s.tiles)))
+        if self.affinity and tile is not None:
+            warm = [s for s in self._slots if tile in s.tiles]
+            if warm:
+                best = min(warm, key=lambda s: s.in_flight)
+                # Evitar puntos calientes: la afinidad no justifica una cola mucho más larga
+                if best.in_flight - least_loaded.in_flight <= self.max_imbalance:
+                    return best, True
+        return least_loaded, False
+
+    def submit(self, filename: str, content_hash: Optional[str] = None) -> Future:
+        """Envía un CSV de la carpeta raw a un worker; el Future retorna (segmentos, diagnóstico).
+
+        `content_hash` (SHA-256 ya calculado del CSV) evita que el worker lo vuelva a leer para hashearlo.
+        """
+        tile = self._resolve_tile(filename) if self.affinity else None
+        with self._lock:
+            if tile is None:
+                self._state["unresolved_tile"] += 1
+            slot, by_affinity = self._choose_slot(tile)
+            executor = self._get_executor(slot)
+            try:
+                future = executor.submit(_process_in_worker, filename, content_hash)
+            except BrokenProcessPool:
+                self._restart_locked(slot, executor)
+                executor = self._get_executor(slot)
+                future = executor.submit(_process_in_worker, filename, content_hash)
+            if by_affinity:
+                slot.routed_affinity += 1
+            else:
+                slot.routed_least_loaded += 1
+            if tile is not None:
+                # El worker tendrá el tile en cache: los viajes siguientes de la zona van con él
+                slot.tiles.add(tile)
+            slot.in_flight += 1
+            self._state["submitted"] += 1
+        logger.info(f"📮 {filename} → worker {slot.index} (tile {tile}, {'afinidad' if by_affinity else 'menos cargado'})")
+        future.add_done_callback(lambda fut, s=slot, ex=executor: self._on_done(fut, s, ex))
+        return future
+
+    def _on_done(self, future: Future, slot: _WorkerSlot, executor: ProcessPoolExecutor):
+        if future.cancelled():
+            # Cancelado al detener o recrear el worker: future.exception() lanzaría CancelledError
+            with self._lock:
+                slot.in_flight -= 1
+            return
+        error = future.exception()
+        with self._lock:
+            slot.in_flight -= 1
+            if error is None:
+                _, diagnostico = future.result()
+                slot.completed += 1
+                slot.pid = diagnostico.get("worker_pid", slot.pid)
+                slot.update_cache(diagnostico.get("cache_grafos"))
+                self._state["completed"] += 1
+            else:
+                slot.failed += 1
+                self._state["failed"] += 1
+                if isinstance(error, BrokenProcessPool):
+                    self._restart_locked(slot, executor)
+        if error is None:
+            # El conteo de uso se guarda solo desde el proceso principal
+            tile_usage.record(diagnostico["grafos_usados"])
+
+    def _restart_locked(self, slot: _WorkerSlot, broken: ProcessPoolExecutor):
+        if slot.executor is not broken:
+            return
+        slot.executor = None
+        slot.pid = None
+        slot.tiles = set()
+        slot.restarts += 1
+        logger.warning(f"⚠️ El worker {slot.index} del pool terminó inesperadamente, se recrea")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def process(self, filename: str, content_hash: Optional[str] = None) -> Tuple[Optional[list], dict]:
+        """Procesa un CSV y espera el resultado. Sin pool, lo procesa en el hilo actual."""
+        if not self.enabled:
+            from app.services.processing.csv_processor import csv_processor
+
+            result, diagnostico = csv_processor.procesar_archivo_con_diagnostico(filename, content_hash=content_hash)
+            tile_usage.record(diagnostico["grafos_usados"])
+            return result, diagnostico
+        return self.submit(filename, content_hash).result()
+
+    def shutdown(self):
+        with self._lock:
+            executors = [slot.executor for slot in self._slots if slot.executor is not None]
+            for slot in self._slots:
+                slot.executor = None
+                slot.pid = None
+                slot.tiles = set()
+            self._state["status"] = "stopped"
+        for executor in executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+        if executors:
+            logger.info("🛑 Pool de procesamiento detenido")
+
+    def warmup_status(self) -> dict:
+        """Precalentamiento de los workers con la forma de tile_warmup.status().
+
+        Cada worker precalienta su cache en el inicializador y reporta al quedar listo, así que
+        el progreso es la fracción de workers listos; loaded y skipped son la unión de todos.
+        """
+        with self._lock:
+            planned = list(self._state["warmup_planned"])
+            started_at = self._state["warmup_started_at"]
+            workers = [{"index": slot.index, "pid": slot.pid, "ready": slot.warmed_at is not None,
+                        "warmup": slot.warmup} for slot in self._slots]
+            finished = [slot.warmed_at for slot in self._slots]
+        results = [w["warmup"] or {} for w in workers if w["ready"]]
+        errors = [r["error"] for r in results if "error" in r]
+        ready = sum(1 for w in workers if w["ready"])
+        if started_at is None:
+            status = "idle"
+        elif ready < len(workers):
+            status = "running"
+        else:
+            status = "failed" if errors and len(errors) == len(workers) else "done"
+        loaded = sorted({tile for r in results for tile in r.get("loaded", [])})
+        state = {
+            "status": status,
+            "planned": planned,
+            "loaded": loaded,
+            "skipped": sorted({tile for r in results for tile in r.get("skipped", [])} - set(loaded)),
+            "bytes_loaded": sum(r.get("bytes_loaded", 0) for r in results),
+            "started_at": started_at,
+            "finished_at": max(finished) if status in ("done", "failed") else None,
+            "error": "; ".join(errors) or None,
+            "progress": (ready / len(workers)) if started_at is not None else 0.0,
+            "workers": workers,
+        }
+        if started_at is not None:
+            state["elapsed_seconds"] = round((state["finished_at"] or time.time()) - started_at, 2)
+        return state
+
+    def status(self) -> dict:
+        with self._lock:
+            state = dict(self._state)
+            state["workers"] = [slot.status() for slot in self._slots]
+        hits = sum(w["cache_hits"] for w in state["workers"])
+        lookups = hits + sum(w["cache_misses"] for w in state["workers"])
+        state["cache_hit_rate"] = (hits / lookups) if lookups else 0.0
+        state["in_flight"] = sum(w["in_flight"] for w in state["workers"])
+        state["enabled"] = self.enabled
+        state["max_workers"] = self.max_workers
+        state["affinity"] = self.affinity
+        return state
+
+
+processing_pool = ProcessingPool(
+    settings.PROCESSING_POOL_ENABLED,
+    settings.PROCESSING_POOL_WORKERS,
+    affinity=settings.PROCESSING_POOL_AFFINITY,
+    max_imbalance=settings.PROCESSING_POOL_MAX_IMBALANCE,
+)
@@ -0,0 +1,324 @@
+"""
+Reprocesamiento masivo de CSV ya procesados
+===========================================
+
+Después de un cambio de algoritmo o de tiles se vuelven a procesar los CSV de
+`uploads/csv/processed` (o de otra carpeta) con un pool de procesos, sin
+moverlos, y se reemplazan sus datos en BD:
+
+    python -m app.services.processing.reprocess --desde 2025-09-01 --hasta 2025-09-30 --workers 4
+
+- Los archivos se eligen por carpeta, prefijo y rango de fechas (fecha de
+  exportación del encabezado; si falta, fecha de modificación del archivo)
+- El avance queda en un checkpoint con una línea JSON por archivo terminado.
+  Por defecto hay uno por versión de algoritmo y de tiles, así relanzar el
+  mismo comando tras una interrupción continúa donde quedó y un cambio de
+  versión vuelve a procesar todo
+- Los workers solo procesan; el paso a BD se hace en el proceso principal por
+  el camino masivo (lectura columnar + inserción por lotes), reemplazando la
+  fuente y las muestras que dejó el procesamiento anterior del mismo viaje
+- Cada worker tiene su propia cache de tiles: GRAPH_CACHE_MAX_MB se reparte
+  entre los workers, así el total en memoria sigue siendo el configurado
+- Por archivo y al final se informa el rendimiento (viajes/min, muestras/s)
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+from app.database.session import SessionLocal
+from app.schemas.recway import segmentos_from_json
+from app.services.data.database_service import RecWayDatabaseService
+from app.services.data.parser import CSVParser
+from app.services.processing.csv_processor import csv_processor
+from app.services.processing.process_pool import available_cores
+from app.services.processing.result_cache import sha256_file
+
+logger = logging.getLogger(__name__)
+
+# Líneas de encabezado que se leen como máximo para buscar la fecha de exportación
+_HEADER_MAX_LINES = 64
+
+
+def read_export_date(path: Path) -> Optional[date]:
+    """Fecha de '# Export Date:' del encabezado del CSV (None si no está o no se entiende)."""
+    with open(path, "rb") as f:
+        for _ in range(_HEADER_MAX_LINES):
+            line = f.readline()
+            if not line or line.strip().startswith(b"timestamp"):
+                break
+            text = line.decode("utf-8", errors="ignore").strip()
+            if text.startswith("#") and "Export Date:" in text:
+                try:
+                    return datetime.fromisoformat(text.split(":", 1)[1].strip()).date()
+                except ValueError:
+                    return None
+    return None
+
+
+def select_files(folder: str, prefix: str, since: Optional[date] = None,
+                 until: Optional[date] = None) -> List[Path]:
+    """CSV de la carpeta con el prefijo y fecha del viaje dentro de [since, until]."""
+    files = sorted(p for p in Path(folder).glob(f"{prefix}*.csv") if p.is_file())
+    if since is None and until is None:
+        return files
+    selected = []
+    for path in files:
+        day = read_export_date(path) or date.fromtimestamp(path.stat().st_mtime)
+        if (since is None or day >= since) and (until is None or day <= until):
+            selected.append(path)
+    return selected
+
+
+def trip_span(timestamps) -> Tuple[str, str]:
+    """Primera y última fecha del viaje con el mismo formato que las fechas de las muestras."""
+    # Igual que timestamp_a_iso8601 del algoritmo (hora local, ISO 8601)
+    first = datetime.fromtimestamp(int(timestamps.min()) / 1000).isoformat()
+    last = datetime.fromtimestamp(int(timestamps.max()) / 1000).isoformat()
+    return first, last
+
+
+class Checkpoint:
+    """Archivos terminados de una corrida: una línea JSON por archivo, agregada y sincronizada a disco."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.done = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Última línea cortada por una interrupción
+                        continue
+                    if entry.get("estado") == "ok":
+                        self.done[entry["archivo"]] = entry
+
+    def is_done(self, path: Path, content_hash: str) -> bool:
+        entry = self.done.get(str(path.resolve()))
+        return entry is not None and entry.get("hash") == content_hash
+
+    def record(self, entry: dict) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if entry.get("estado") == "ok":
+            self.done[entry["archivo"]] = entry
+
+
+class Throughput:
+    """Viajes y muestras terminados desde el inicio de la corrida."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.trips = 0
+        self.samples = 0
+
+    def add(self, samples: int) -> None:
+        self.trips += 1
+        self.samples += samples
+
+    def summary(self) -> dict:
+        elapsed = max(time.time() - self.started, 1e-9)
+        return {
+            "viajes": self.trips,
+            "muestras": self.samples,
+            "segundos": round(elapsed, 1),
+            "viajes_por_min": round(self.trips * 60.0 / elapsed, 2),
+            "muestras_por_s": round(self.samples / elapsed, 1),
+        }
+
+
+# ---------------------------------------------------------------------------
+# Funciones que se ejecutan dentro de los workers
+# ---------------------------------------------------------------------------
+
+def _init_worker(cache_bytes: int):
+    """Inicializador de cada worker; `cache_bytes` es su parte del presupuesto de tiles."""
+    import importlib
+
+    csv_processor._ensure_algo_import()
+    csv_processor.configurar_cache_grafos(cache_bytes)
+    # El pool ya reparte los archivos entre núcleos: cada archivo va en serie dentro de su worker
+    importlib.import_module("app.services.algoritmo_posicionv1_0.procesamiento_tramos").TRAMOS_WORKERS = 1
+    csv_processor._main.DETECCION_CONCURRENTE = "false"
+
+
+def _reprocess_in_worker(path: str, content_hash: Optional[str] = None):
+    segments, diagnostico = csv_processor.reprocesar_archivo(path, content_hash=content_hash)
+    diagnostico["worker_pid"] = os.getpid()
+    return segments, diagnostico
+
+
+# ---------------------------------------------------------------------------
+# Proceso principal
+# ---------------------------------------------------------------------------
+
+def write_to_db(path: Path, segments: list, user_id: int, versiones: Optional[dict] = None) -> int:
+    """Reemplaza en BD los datos del viaje con el nuevo resultado. Retorna los registros de sensores insertados.
+
+    `versiones` ("version_algoritmo", "version_tiles") se guarda con el viaje y sus muestras.
+    """
+    csv_metadata, csv_sensor_data = CSVParser.parse_csv_columns(str(path))
+    processed_segments = segmentos_from_json.validate_python(segments)
+    first, last = trip_span(csv_sensor_data.columnas["timestamp"])
+    db = SessionLocal()
+    try:
+        result = RecWayDatabaseService(db).replace_trip_data(
+            csv_metadata=csv_metadata,
+            processed_segments=processed_segments,
+            csv_sensor_data=csv_sensor_data,
+            user_id=user_id,
+            fecha_inicio=first,
+            fecha_fin=last,
+            versiones=versiones,
+        )
+        return result.registros_sensores_creados
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def reprocess(files: List[Path], workers: int, checkpoint: Checkpoint, write_db: bool = True,
+              force: bool = False, user_id: int = 1) -> dict:
+    """
+    Reprocesa los archivos con un pool de `workers` procesos.
+
+    Omite los que el checkpoint ya tiene con el mismo contenido (salvo `force`) y
+    usa la cache de resultados cuando el contenido ya se procesó con las versiones
+    actuales. Retorna el resumen de la corrida.
+    """
+    version_algoritmo, version_tiles = csv_processor.versiones_actuales()
+    throughput = Throughput()
+    skipped = 0
+    failed = 0
+
+    pending = []
+    for path in files:
+        content_hash = sha256_file(path)
+        if not force and checkpoint.is_done(path, content_hash):
+            skipped += 1
+        else:
+            pending.append((path, content_hash))
+    total = len(pending)
+    logger.info(f"🔁 Reprocesamiento: {total} archivos pendientes, {skipped} ya hechos según {checkpoint.path} "
+                f"(algoritmo {version_algoritmo}, tiles {version_tiles}, {workers} workers)")
+
+    def finish(path: Path, content_hash: str, segments: list, diagnostico: dict, source: str):
+        nonlocal failed
+        versiones = {"version_algoritmo": diagnostico.get("version_algoritmo", version_algoritmo),
+                     "version_tiles": diagnostico.get("version_tiles", version_tiles)}
+        try:
+            samples = (write_to_db(path, segments, user_id, versiones) if write_db
+                       else diagnostico.get("muestras_csv", 0))
+        except Exception as e:
+            failed += 1
+            logger.error(f"❌ Error guardando en BD {path.name}: {e}")
+            checkpoint.record({"archivo": str(path.resolve()), "hash": content_hash, "estado": "error",
+                               "error": f"bd: {e}", "fin": time.time()})
+            return
+        if write_db:
+            csv_processor.marcar_resultado_guardado(content_hash, versiones["version_algoritmo"],
+                                                    versiones["version_tiles"])
+        throughput.add(samples)
+        checkpoint.record({
+            "archivo": str(path.resolve()),
+            "hash": content_hash,
+            "estado": "ok",
+            "origen": source,
+            "segmentos": len(segments),
+            "muestras": samples,
+            **versiones,
+            "segundos_algoritmo": diagnostico.get("tiempo_total"),
+            "fin": time.time(),
+        })
+        stats = throughput.summary()
+        logger.info(f"✅ [{throughput.trips + failed}/{total}] {path.name}: {len(segments)} segmentos, "
+                    f"{samples} muestras ({source}) — {stats['viajes_por_min']} viajes/min, "
+                    f"{stats['muestras_por_s']} muestras/s")
+
+    # Contenido ya procesado con las versiones actuales: no se vuelve a procesar (aunque su paso
+    # a BD no se haya confirmado, finish lo escribe)
+    to_process = []
+    for path, content_hash in pending:
+        cached = None if force else csv_processor.buscar_resultado_cache(content_hash, solo_guardados=False)
+        if cached is None:
+            to_process.append((path, content_hash))
+        else:
+            finish(path, content_hash, cached["segmentos"], {}, "cache")
+
+    # Cada worker tiene su propia cache: el presupuesto total se reparte entre todos.
+    # spawn como en el pool del servicio: los workers no heredan el estado del proceso principal
+    cache_bytes = int(settings.GRAPH_CACHE_MAX_MB * 1024 * 1024) // workers
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(cache_bytes,))
+    try:
+        futures = {executor.submit(_reprocess_in_worker, str(path), content_hash): (path, content_hash)
+                   for path, content_hash in to_process}
+        for future in as_completed(futures):
+            path, content_hash = futures[future]
+            try:
+                segments, diagnostico = future.result()
+            except Exception as e:
+                failed += 1
+                logger.error(f"❌ Error reprocesando {path.name}: {e}")
+                checkpoint.record({"archivo": str(path.resolve()), "hash": content_hash, "estado": "error",
+                                   "error": str(e), "fin": time.time()})
+                continue
+            finish(path, content_hash, segments, diagnostico, "procesado")
+    except KeyboardInterrupt:
+        logger.warning("⏹️ Reprocesamiento interrumpido: relanzar el mismo comando para continuar")
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+
+    summary = throughput.summary()
+    summary.update({"omitidos": skipped, "fallidos": failed, "checkpoint": str(checkpoint.path),
+                    "version_algoritmo": version_algoritmo, "version_tiles": version_tiles})
+    logger.info(f"🏁 Reprocesamiento terminado: {summary}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reprocesa CSV ya procesados y reemplaza sus datos en BD")
+    parser.add_argument("--carpeta", default=settings.CSV_PROCESSED_DIR, help="Carpeta con los CSV a reprocesar")
+    parser.add_argument("--prefijo", default=csv_processor.prefijo_busqueda, help="Prefijo de los CSV")
+    parser.add_argument("--desde", type=date.fromisoformat, default=None, help="Fecha mínima del viaje (AAAA-MM-DD)")
+    parser.add_argument("--hasta", type=date.fromisoformat, default=None, help="Fecha máxima del viaje (AAAA-MM-DD)")
+    parser.add_argument("--workers", type=int, default=max(1, available_cores() - 1), help="Procesos en paralelo")
+    parser.add_argument("--checkpoint", default="",
+                        help="Archivo de checkpoint (por defecto uno por versión de algoritmo y tiles)")
+    parser.add_argument("--sin_bd", action="store_true", help="Solo procesar (JSON y cache), sin escribir en BD")
+    parser.add_argument("--forzar", action="store_true", help="Ignorar checkpoint y cache de resultados")
+    parser.add_argument("--usuario", type=int, default=1, help="Usuario que figura como creador de los datos")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    checkpoint_path = args.checkpoint
+    if not checkpoint_path:
+        version_algoritmo, version_tiles = csv_processor.versiones_actuales()
+        checkpoint_path = os.path.join(settings.REPROCESS_CHECKPOINT_DIR,
+                                       f"{version_algoritmo}__{version_tiles}.jsonl")
+
+    files = select_files(args.carpeta, args.prefijo, args.desde, args.hasta)
+    summary = reprocess(files, max(1, args.workers), Checkpoint(checkpoint_path),
+                        write_db=not args.sin_bd, force=args.forzar, user_id=args.usuario)
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Cache de resultados por contenido
+=================================
+
+- Cada CSV se identifica por el SHA-256 de su contenido (calculado al subirlo,
+  mientras se escribe a disco, o al procesarlo)
+- El resultado del procesamiento se guarda bajo la clave
+  (hash del contenido, versión del algoritmo, versión de tiles)
+- Un archivo repetido con las mismas versiones no se vuelve a procesar ni a
+  insertar en BD: se devuelve el resultado guardado o se rechaza la subida
+- La entrada se escribe al terminar el algoritmo con "guardado_bd": false y se marca
+  al confirmarse el paso a BD (mark_committed); solo las entradas marcadas cuentan
+  como duplicado, así un viaje cuyo paso a BD falló se vuelve a procesar
+
+Cada entrada es un archivo JSON propio con escritura atómica, así los workers
+del pool y el proceso principal pueden leer y escribir la cache sin coordinarse:
+
+    RESULT_CACHE_DIR/ab/abcdef.../1.0.0__base.json
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de bloque para leer y hashear archivos
+CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path) -> str:
+    """SHA-256 del contenido de un archivo, leído por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Resultados de procesamiento indexados por (hash, versión de algoritmo, versión de tiles)."""
+
+    def __init__(self, root: str, enabled: bool = True):
+        self.root = root
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def _path(self, content_hash: str, algorithm_version: str, tile_version: str) -> str:
+        return os.path.join(self.root, content_hash[:2], content_hash,
+                            f"{algorithm_version}__{tile_version}.json")
+
+    def _read(self, path: str, content_hash: str) -> Optional[dict]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"⚠️ Entrada de cache de resultados ilegible ({content_hash[:12]}): {e}")
+            return None
+
+    def _write(self, path: str, entry: dict) -> None:
+        """Escritura atómica con un temporal único (varios hilos pueden guardar el mismo hash a la vez)."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def lookup(self, content_hash: str, algorithm_version: str, tile_version: str,
+               committed_only: bool = True) -> Optional[dict]:
+        """Entrada guardada ({archivo, segmentos, ...}) o None si el contenido no se procesó con esas versiones.
+
+        Con `committed_only` (por defecto) una entrada cuyo paso a BD no se confirmó cuenta como fallo.
+        """
+        if not self.enabled or not content_hash:
+            return None
+        entry = self._read(self._path(content_hash, algorithm_version, tile_version), content_hash)
+        if entry is not None and committed_only and not entry.get("guardado_bd"):
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def store(self, content_hash: str, algorithm_version: str, tile_version: str,
+              filename: str, segments: List[dict]) -> None:
+        """Guarda el resultado de un archivo, aún sin paso a BD (los errores solo se registran)."""
+        if not self.enabled or not content_hash:
+            return
+        path = self._path(content_hash, algorithm_version, tile_version)
+        entry = {
+            "hash": content_hash,
+            "version_algoritmo": algorithm_version,
+            "version_tiles": tile_version,
+            "archivo": filename,
+            "creado": time.time(),
+            "guardado_bd": False,
+            "segmentos": segments,
+        }
+        try:
+            self._write(path, entry)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar el resultado de {filename} en cache: {e}")
+            return
+        with self._lock:
+            self.stores += 1
+
+    def mark_committed(self, content_hash: str, algorithm_version: str, tile_version: str) -> None:
+        """Marca la entrada como guardada en BD: desde aquí el contenido cuenta como duplicado."""
+        if not self.enabled or not content_hash:
+            return
+        path = self._path(content_hash, algorithm_version, tile_version)
+        entry = self._read(path, content_hash)
+        if entry is None or entry.get("guardado_bd"):
+            return
+        entry["guardado_bd"] = True
+        entry["guardado_bd_en"] = time.time()
+        try:
+            self._write(path, entry)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo marcar en cache el paso a BD de {entry.get('archivo')}: {e}")
+
+    def metrics(self) -> dict:
+        """Aciertos, fallos y escrituras de este proceso."""
+        with self._lock:
+            queries = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "root": self.root,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": (self.hits / queries) if queries else 0.0,
+            }
+
+
+result_cache = ResultCache(settings.RESULT_CACHE_DIR, enabled=settings.RESULT_CACHE_ENABLED)
@@ -0,0 +1,173 @@
+"""
+Precalentamiento de tiles de grafo al iniciar el servicio
+==========================================================
+
+- Registra cuántos viajes procesados usaron cada tile (`GRAPH_TILE_USAGE_FILE`)
+- Al iniciar, un hilo de fondo carga en la cache de tiles los N más usados,
+  sin pasar el presupuesto de memoria de la cache
+- Cuando termina, ejecuta el callback de arranque (iniciar el file watcher) para
+  que los primeros viajes de cada región no paguen la deserialización
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TileUsageStore:
+    """Conteo persistente de viajes por tile (archivo JSON con escritura atómica)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._counts: Optional[Dict[str, int]] = None
+
+    def _load(self) -> Dict[str, int]:
+        if self._counts is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._counts = {str(k): int(v) for k, v in json.load(f).items()}
+            except FileNotFoundError:
+                self._counts = {}
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo leer el uso de tiles ({self.path}): {e}")
+                self._counts = {}
+        return self._counts
+
+    def record(self, tiles: List) -> None:
+        """Suma un viaje a cada tile usado (cada tile cuenta una vez por viaje)."""
+        if not tiles:
+            return
+        with self._lock:
+            counts = self._load()
+            for tile in set(str(t) for t in tiles):
+                counts[tile] = counts.get(tile, 0) + 1
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp = self.path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(counts, f, indent=2)
+                os.replace(tmp, self.path)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo guardar el uso de tiles: {e}")
+
+    def top(self, n: int) -> List[str]:
+        """Tiles más usados, de mayor a menor."""
+        with self._lock:
+            counts = dict(self._load())
+        return [tile for tile, _ in sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:n]]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._load())
+
+
+def warm_tiles(tiles: List[str], on_result: Optional[Callable[[str, Optional[int]], None]] = None) -> dict:
+    """Carga los tiles en la cache de este proceso sin pasar su presupuesto (el límite actual de la cache).
+
+    `on_result(tile, size)` se llama por tile con los bytes cargados, o None si se omitió.
+    """
+    from app.services.processing.csv_processor import csv_processor
+
+    budget = csv_processor.metricas_cache_grafos().get("limite_bytes") or settings.GRAPH_CACHE_MAX_MB * 1024 * 1024
+    result = {"loaded": [], "skipped": [], "bytes_loaded": 0}
+    for tile in tiles:
+        estimate = csv_processor.estimar_tamano_tile(tile)
+        used = csv_processor.metricas_cache_grafos().get("bytes_usados", 0)
+        if estimate is None or used + estimate > budget:
+            # Tile que ya no existe o que no cabe en el presupuesto restante
+            size = None
+            result["skipped"].append(tile)
+        else:
+            size = csv_processor.precargar_tile(tile)
+            result["loaded"].append(tile)
+            result["bytes_loaded"] += size
+        if on_result is not None:
+            on_result(tile, size)
+    return result
+
+
+class TileWarmup:
+    """Carga en segundo plano los tiles más usados en la cache del proceso."""
+
+    def __init__(self, usage: TileUsageStore, top_n: int):
+        self.usage = usage
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._state = {
+            "status": "idle",  # idle | running | done | failed
+            "planned": [],
+            "loaded": [],
+            "skipped": [],
+            "bytes_loaded": 0,
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+        }
+
+    def start(self, on_complete: Optional[Callable[[], None]] = None) -> bool:
+        """Inicia el precalentamiento; `on_complete` se ejecuta al terminar (aun si falla)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._state.update({
+                "status": "running", "planned": [], "loaded": [], "skipped": [],
+                "bytes_loaded": 0, "started_at": time.time(), "finished_at": None, "error": None,
+            })
+            self._thread = threading.Thread(target=self._run, args=(on_complete,), name="tile-warmup", daemon=True)
+            self._thread.start()
+        return True
+
+    def _run(self, on_complete: Optional[Callable[[], None]]):
+        try:
+            planned = self.usage.top(self.top_n)
+            with self._lock:
+                self._state["planned"] = planned
+            logger.info(f"🔥 Precalentando {len(planned)} tiles de grafo: {planned}")
+
+            def on_result(tile: str, size: Optional[int]):
+                with self._lock:
+                    if size is None:
+                        self._state["skipped"].append(tile)
+                    else:
+                        self._state["loaded"].append(tile)
+                        self._state["bytes_loaded"] += size
+
+            warm_tiles(planned, on_result)
+
+            with self._lock:
+                self._state["status"] = "done"
+            logger.info(f"✅ Precalentamiento completo: {len(self._state['loaded'])} tiles cargados")
+        except Exception as e:
+            logger.error(f"❌ Error precalentando tiles: {e}")
+            with self._lock:
+                self._state["status"] = "failed"
+                self._state["error"] = str(e)
+        finally:
+            with self._lock:
+                self._state["finished_at"] = time.time()
+            if on_complete is not None:
+                on_complete()
+
+    def status(self) -> dict:
+        with self._lock:
+            state = dict(self._state, planned=list(self._state["planned"]),
+                         loaded=list(self._state["loaded"]), skipped=list(self._state["skipped"]))
+        total = len(state["planned"])
+        done = len(state["loaded"]) + len(state["skipped"])
+        state["progress"] = (done / total) if total else (1.0 if state["status"] == "done" else 0.0)
+        if state["started_at"] is not None:
+            state["elapsed_seconds"] = round((state["finished_at"] or time.time()) - state["started_at"], 2)
+        return state
+
+
+tile_usage = TileUsageStore(settings.GRAPH_TILE_USAGE_FILE)
+tile_warmup = TileWarmup(tile_usage, settings.GRAPH_WARMUP_TOP_N)